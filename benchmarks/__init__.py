@@ -0,0 +1,11 @@
+"""Offline benchmark suite for the CKM agent tree.
+
+Runs the scripted sessions from examples.md through the real agent tree
+against a local stub that speaks the Ollama HTTP protocol, so the cost of
+the orchestration itself (routing, intake, parallel panel, mediator) can be
+measured separately from model speed:
+- mock_ollama: Ollama /api/chat + /api/tags stub with configurable latency,
+  tokens/s and canned responses
+- scenarios: Scripted sessions parsed from examples.md
+- run: Benchmark runner writing a JSON results file (python -m benchmarks.run)
+"""
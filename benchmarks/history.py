@@ -0,0 +1,173 @@
+"""Long-session benchmark: turn latency over 30+ turns with and without history compaction.
+
+Replays one patient through the real agent tree against MockOllamaServer:
+paste-mode intake and a snapshot, then repeated cycles of expansions, a
+follow-up question to the coordinator, added details and a re-consult.
+The mock evaluates prompts at a fixed speed (--prompt-tokens-per-second),
+so a request's latency grows with the history it carries, as on a real
+Ollama server.
+
+The session runs once with the full history (CKM_HISTORY_COMPACTION_DISABLED)
+and once compacted (history.py), and reports per turn the wall time and the
+root agent's prompt tokens, plus their growth from the first to the last
+follow-up questions.
+
+Usage:
+    python -m benchmarks.history --cycles 5 --output history.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+# Offline: use LiteLLM's bundled model cost map instead of fetching it
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+from google.adk.runners import InMemoryRunner
+from google.genai import types
+
+from .mock_ollama import MockOllamaServer
+from .scenarios import load_scenarios
+
+
+APP_NAME = "ckm_benchmark"
+USER_ID = "benchmark"
+
+ROOT_AGENT = "ckm_root_agent"
+
+FOLLOW_UP_QUESTION = "Is the empagliflozin dose still appropriate at this eGFR, and when should we recheck potassium?"
+
+# Roughly the length of a real coordinator answer to a follow-up question
+ROOT_ANSWER = (
+    "Empagliflozin 10 mg daily remains appropriate: SGLT2 inhibitors can be started down to an eGFR of 20 and "
+    "continued below it until dialysis, and the early eGFR dip of up to 30% is expected and not a reason to stop. "
+    "Recheck creatinine, eGFR and potassium 1–2 weeks after any RAAS or diuretic change, then every 3 months "
+    "while eGFR is below 45. Metformin needs a dose cap at eGFR 30–44 (max 1000 mg/day) and should be stopped "
+    "below 30. Reply A, B or C for the details of the latest Consultation Snapshot."
+)
+
+
+def session_turns(cycles: int) -> List[str]:
+    """Paste-mode intake and snapshot, then `cycles` rounds of expansions, a question and a re-consult."""
+    scenario = next(s for s in load_scenarios() if "Confirm" in s["turns"] and "2" in s["turns"])
+    turns = scenario["turns"][: scenario["turns"].index("Confirm") + 1]
+    for cycle in range(cycles):
+        turns += ["A", "B", "Back", FOLLOW_UP_QUESTION, f"Add details: eGFR {44 - 3 * cycle} mL/min/1.73m²", "Confirm"]
+    return turns
+
+
+async def run_session(server: MockOllamaServer, turns: List[str], compaction: bool) -> List[Dict[str, Any]]:
+    """Replay the session once; return wall time and model requests per turn."""
+    from src import root_agent
+
+    os.environ["CKM_HISTORY_COMPACTION_DISABLED"] = "0" if compaction else "1"
+    runner = InMemoryRunner(agent=root_agent, app_name=APP_NAME)
+    session = await runner.session_service.create_session(app_name=APP_NAME, user_id=USER_ID)
+    results = []
+    for index, text in enumerate(turns, start=1):
+        first_request = len(server.requests)
+        started = time.perf_counter()
+        message = types.Content(role="user", parts=[types.Part(text=text)])
+        async for _ in runner.run_async(user_id=USER_ID, session_id=session.id, new_message=message):
+            pass
+        requests = server.requests[first_request:]
+        root_tokens = [request["prompt_tokens"] for request in requests if request["agent"] == ROOT_AGENT]
+        results.append({
+            "turn": index,
+            "text": text[:40],
+            "wall_ms": round((time.perf_counter() - started) * 1000, 1),
+            "llm_calls": len(requests),
+            "prompt_tokens": sum(request["prompt_tokens"] for request in requests),
+            "root_prompt_tokens": max(root_tokens) if root_tokens else None,
+        })
+    return results
+
+
+def growth(turns: List[Dict[str, Any]], field: str) -> Dict[str, Optional[float]]:
+    """Compare a field between the first and the last follow-up question turns."""
+    values = [turn[field] for turn in turns if turn["text"] == FOLLOW_UP_QUESTION[:40]]
+    if len(values) < 2:
+        return {"first": None, "last": None, "ratio": None}
+    return {"first": values[0], "last": values[-1], "ratio": round(values[-1] / values[0], 2)}
+
+
+async def run_history_benchmark(
+    cycles: int = 5,
+    latency_ms: float = 20.0,
+    prompt_tokens_per_second: float = 2000.0,
+    tokens_per_second: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Run the long session with the full and the compacted history."""
+    os.environ["CKM_CACHE_DISABLED"] = "1"
+    turns = session_turns(cycles)
+    results: Dict[str, Any] = {
+        "config": {
+            "cycles": cycles,
+            "turns": len(turns),
+            "latency_ms": latency_ms,
+            "prompt_tokens_per_second": prompt_tokens_per_second,
+            "tokens_per_second": tokens_per_second,
+        }
+    }
+    with MockOllamaServer(
+        latency_ms=latency_ms,
+        tokens_per_second=tokens_per_second,
+        prompt_tokens_per_second=prompt_tokens_per_second,
+        responses={ROOT_AGENT: ROOT_ANSWER},
+    ) as server:
+        os.environ["OLLAMA_API_BASE"] = server.url
+        # Unmeasured intake and consult first (lazy imports, connection setup)
+        await run_session(server, session_turns(0), compaction=True)
+        server.reset()
+        for mode, compaction in (("full", False), ("compacted", True)):
+            session = await run_session(server, turns, compaction)
+            results[mode] = {
+                "turns": session,
+                "wall_ms": growth(session, "wall_ms"),
+                "root_prompt_tokens": growth(session, "root_prompt_tokens"),
+                "total_wall_seconds": round(sum(turn["wall_ms"] for turn in session) / 1000, 2),
+            }
+    return results
+
+
+def main() -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Turn latency over a long consultation session, with and without history compaction.")
+    parser.add_argument("--cycles", type=int, default=5, help="Expansion/question/re-consult rounds after the first snapshot (default: 5, 34 turns)")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Mock time to first token (default: 20)")
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=2000.0, help="Mock prompt evaluation speed (default: 2000)")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="Mock generation speed (default: instant)")
+    parser.add_argument("--output", help="Results JSON path")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_history_benchmark(
+        cycles=args.cycles,
+        latency_ms=args.latency_ms,
+        prompt_tokens_per_second=args.prompt_tokens_per_second,
+        tokens_per_second=args.tokens_per_second,
+    ))
+    print(f"{'turn':>4}  {'message':<42}{'full ms':>9}{'tokens':>8}{'compacted ms':>14}{'tokens':>8}")
+    for full, compacted in zip(results["full"]["turns"], results["compacted"]["turns"]):
+        print(
+            f"{full['turn']:>4}  {full['text'].splitlines()[0][:40]:<42}{full['wall_ms']:>9}{full['root_prompt_tokens'] or '-':>8}"
+            f"{compacted['wall_ms']:>14}{compacted['root_prompt_tokens'] or '-':>8}"
+        )
+    print("(tokens: root agent prompt tokens)")
+    for mode in ("full", "compacted"):
+        wall, tokens = results[mode]["wall_ms"], results[mode]["root_prompt_tokens"]
+        print(
+            f"{mode:<10} follow-up turn {wall['first']} → {wall['last']} ms (x{wall['ratio']}), "
+            f"root prompt {tokens['first']} → {tokens['last']} tokens (x{tokens['ratio']}), "
+            f"session {results[mode]['total_wall_seconds']} s"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2, ensure_ascii=False)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Import-time benchmark: how long short-lived processes take to load the package.
+
+Runs each scenario in a fresh interpreter (so nothing is cached in
+sys.modules) and reports the median and best import time, plus whether
+google.adk or LiteLLM were loaded. Helper imports must stay light: pass
+--max-seconds to exit 1 when one of them loads google.adk or LiteLLM, or
+takes longer than the budget.
+
+Usage:
+    python -m benchmarks.imports --repeat 5 --output imports.json
+    python -m benchmarks.imports --max-seconds 0.5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+# Scenario -> (import statement, whether it may load the agent stack)
+SCENARIOS = {
+    "package": ("import src", False),
+    "templates": ("from src import format_medication_table", False),
+    "case_parser": ("from src.case_parser import parse_case", False),
+    "root_agent": ("from src import root_agent", True),
+}
+
+HEAVY_MODULES = ("google.adk", "litellm")
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_import(statement: str) -> Dict[str, Any]:
+    """Run one import statement in a fresh interpreter; return its time and heavy modules loaded."""
+    env = {**os.environ, "LITELLM_LOCAL_MODEL_COST_MAP": "True"}
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(statement=statement, heavy=HEAVY_MODULES)],
+        cwd=_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run_imports(repeat: int) -> Dict[str, Dict[str, Any]]:
+    """Time every scenario ``repeat`` times."""
+    results: Dict[str, Dict[str, Any]] = {}
+    for name, (statement, heavy) in SCENARIOS.items():
+        runs = [time_import(statement) for _ in range(repeat)]
+        seconds = [run["seconds"] for run in runs]
+        results[name] = {
+            "statement": statement,
+            "median_seconds": round(statistics.median(seconds), 4),
+            "min_seconds": round(min(seconds), 4),
+            "loaded": runs[-1]["loaded"],
+            "heavy_allowed": heavy,
+        }
+    return results
+
+
+def check_budget(results: Dict[str, Dict[str, Any]], max_seconds: float) -> List[str]:
+    """List light scenarios that loaded the agent stack or exceeded the budget."""
+    failures = []
+    for name, result in results.items():
+        if result["heavy_allowed"]:
+            continue
+        if result["loaded"]:
+            failures.append(f"{name}: loads {', '.join(result['loaded'])}")
+        if result["median_seconds"] > max_seconds:
+            failures.append(f"{name}: {result['median_seconds']}s > {max_seconds}s")
+    return failures
+
+
+def main() -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Measure package import time in fresh interpreters.")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per scenario (default: 5)")
+    parser.add_argument("--max-seconds", type=float, help="Exit 1 if a helper import exceeds this or loads google.adk/LiteLLM")
+    parser.add_argument("--output", help="Results JSON path")
+    args = parser.parse_args()
+
+    results = run_imports(args.repeat)
+    for name, result in results.items():
+        loaded = ", ".join(result["loaded"]) or "-"
+        print(f"{name:<12} median={result['median_seconds']:.4f}s min={result['min_seconds']:.4f}s loaded={loaded}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2)
+        print(f"Results written to {args.output}")
+    if args.max_seconds is not None:
+        failures = check_budget(results, args.max_seconds)
+        if failures:
+            print("Import budget exceeded:")
+            for line in failures:
+                print(f"  {line}")
+            sys.exit(1)
+        print("Helper imports within budget.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""Local stub of the Ollama HTTP API for offline benchmarks.
+
+Implements just enough of the protocol used by LiteLLM's ``ollama_chat``
+provider and verify_setup.py:
+- GET  /api/tags, /api/version, /api/ps
+- POST /api/show
+- POST /api/chat (streaming NDJSON or single JSON response, tool calls)
+
+Each chat request sleeps for ``latency_ms`` (time to first token), plus
+``prompt tokens / prompt_tokens_per_second`` when set (prompt evaluation,
+so long histories answer slower), plus
+``completion tokens / tokens_per_second``, then answers with the canned
+response registered for the calling agent. The agent is recognised from
+the identity line ADK adds to every system prompt
+('Your internal name is "cardiologist".').
+
+Set ``healthy`` to False to make every endpoint answer 503, e.g. to test
+failover across several stub servers (see backends.py).
+
+Usage:
+    with MockOllamaServer(latency_ms=200, tokens_per_second=40) as server:
+        os.environ["OLLAMA_API_BASE"] = server.url
+        ...
+        print(server.requests)
+"""
+
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+
+# Replies that make the intake coordinator hand the case to the panel
+HANDOFF_REPLIES = {"generate synthesis", "confirm"}
+
+_AGENT_NAME = re.compile(r'Your internal name is "(?P<name>[^"]+)"')
+
+CARDIOLOGY_RESPONSE = json.dumps({
+    "hf_classification": "HFrEF (EF 35%)",
+    "gdmt_status": "Suboptimal",
+    "periop_cardiac_risk": "Not applicable",
+    "key_findings": ["EF 35% with NYHA Class III symptoms", "NT-proBNP 1200 pg/mL after recent decompensation"],
+    "medications": [
+        {"medication": "Carvedilol", "action": "Continue", "detail": "avoid abrupt withdrawal"},
+        {"medication": "Sacubitril/valsartan", "action": "Continue", "detail": "GDMT pillar"},
+        {"medication": "Empagliflozin", "action": "Start", "detail": "fourth GDMT pillar"},
+    ],
+    "risks": ["Recurrent decompensation", "Hyperkalemia with RAAS blockade"],
+    "actions": ["Add SGLT2 inhibitor as fourth GDMT pillar"],
+    "guideline_refs": ["ESC 2023 HF Guidelines", "AHA 2024 HF Guidelines"],
+}, ensure_ascii=False)
+
+NEPHROLOGY_RESPONSE = json.dumps({
+    "ckd_stage": "G3b A2 per KDIGO",
+    "aki_risk": "Moderate — diuretics, RAAS blockade",
+    "dialysis_risk": "Long-term",
+    "key_findings": ["eGFR 42 mL/min/1.73m² with UACR 180 mg/g", "Albuminuria supports SGLT2i for kidney protection"],
+    "medications": [
+        {"medication": "Metformin", "action": "Adjust", "detail": "eGFR 30–44, max 1000 mg/day"},
+        {"medication": "Empagliflozin", "action": "Start", "detail": "fourth GDMT pillar"},
+    ],
+    "risks": ["NSAIDs: avoid", "Hyperkalemia with RAAS blockade"],
+    "actions": ["Recheck eGFR and potassium in 1–2 weeks"],
+    "guideline_refs": ["KDIGO 2024 CKD Guideline"],
+}, ensure_ascii=False)
+
+ENDOCRINOLOGY_RESPONSE = json.dumps({
+    "diabetes_type": "T2DM",
+    "glycemic_control": "HbA1c 8.1% — above target",
+    "hypoglycemia_risk": "Low",
+    "periop_glucose_management": "Not applicable",
+    "key_findings": ["HbA1c 8.1% on metformin", "BMI 32 with established ASCVD risk"],
+    "medications": [
+        {"medication": "Metformin", "action": "Continue", "detail": "reduced dose per eGFR"},
+        {"medication": "Semaglutide", "action": "Start", "detail": "cardiorenal and weight benefit"},
+    ],
+    "risks": ["Hypoglycemia (low)"],
+    "actions": ["Use SGLT2i and GLP-1 RA together"],
+    "guideline_refs": ["ADA Standards of Care 2025"],
+}, ensure_ascii=False)
+
+SNAPSHOT_RESPONSE = json.dumps({
+    "one_line_problem": "68M with CKD G3b, HFrEF and T2DM after recent HF decompensation",
+    "key_facts": ["eGFR 42 mL/min/1.73m² (CKD Stage 3b)", "EF 35%, NYHA III", "NT-proBNP 1200 pg/mL", "HbA1c 8.1%", "UACR 180 mg/g"],
+    "key_risks": ["HF readmission", "CKD progression", "Hyperkalemia", "Hypoglycemia (low)", "Volume overload"],
+    "decisions_needed": "Yes — add SGLT2 inhibitor",
+    "next_steps": [
+        {"action": "Start empagliflozin 10 mg", "owner": "Cardiology", "timing": "today"},
+        {"action": "Recheck BMP", "owner": "Nephrology", "timing": "1–2 weeks"},
+    ],
+}, ensure_ascii=False)
+
+INTAKE_RESPONSE = "Thank you. Please provide the next details, or reply **'Generate synthesis'** to proceed."
+
+# Canned response per agent name; "*" is used for any other agent
+DEFAULT_RESPONSES = {
+    "cardiologist": CARDIOLOGY_RESPONSE,
+    "nephrologist": NEPHROLOGY_RESPONSE,
+    "diabetologist": ENDOCRINOLOGY_RESPONSE,
+    "mediator": SNAPSHOT_RESPONSE,
+    "intake_coordinator": INTAKE_RESPONSE,
+    "*": "Understood.",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate a token count (~4 characters per token)."""
+    return max(1, len(text) // 4) if text else 0
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content)
+
+
+class MockOllamaServer:
+    """Threaded Ollama API stub recording every chat request.
+
+    Attributes:
+        requests: One dict per chat request with 'agent', 'model',
+            'prompt_tokens', 'completion_tokens', 'tool_call', 'stream',
+            'started' and 'finished' (time.perf_counter() values)
+        loaded: Models reported in memory by /api/ps (chat requests load theirs)
+        healthy: When False, every endpoint answers 503
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        tokens_per_second: Optional[float] = None,
+        prompt_tokens_per_second: Optional[float] = None,
+        responses: Optional[Dict[str, str]] = None,
+        models: Optional[List[str]] = None,
+        loaded_models: Optional[List[str]] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.responses = {**DEFAULT_RESPONSES, **(responses or {})}
+        self.models = models or ["qwen2.5:14b"]
+        self.loaded: List[str] = list(loaded_models or [])
+        self.healthy = True
+        self.requests: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockOllamaServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockOllamaServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def reset(self) -> None:
+        """Forget the recorded requests."""
+        with self._lock:
+            self.requests.clear()
+
+    def reply_for(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Choose the assistant message for a chat request.
+
+        Returns:
+            Ollama message dict (content and optional tool_calls) plus the agent name
+        """
+        messages = body.get("messages") or []
+        system = " ".join(_message_text(m) for m in messages if m.get("role") == "system")
+        match = _AGENT_NAME.search(system)
+        agent = match.group("name") if match else "unknown"
+        user_turns = [_message_text(m) for m in messages if m.get("role") == "user"]
+        last_user = user_turns[-1].strip().lower() if user_turns else ""
+        tool_names = {tool.get("function", {}).get("name") for tool in body.get("tools") or []}
+
+        if "transfer_to_agent" in tool_names and last_user in HANDOFF_REPLIES:
+            return {
+                "agent": agent,
+                "message": {
+                    "role": "assistant",
+                    "content": "",
+                    "tool_calls": [
+                        {"function": {"name": "transfer_to_agent", "arguments": {"agent_name": "ckm_panel"}}}
+                    ],
+                },
+            }
+        content = self.responses.get(agent, self.responses["*"])
+        return {"agent": agent, "message": {"role": "assistant", "content": content}}
+
+    def _prompt_seconds(self, prompt_tokens: int) -> float:
+        if not self.prompt_tokens_per_second:
+            return 0.0
+        return prompt_tokens / self.prompt_tokens_per_second
+
+    def _generation_seconds(self, completion_tokens: int) -> float:
+        if not self.tokens_per_second:
+            return 0.0
+        return completion_tokens / self.tokens_per_second
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def _send_json(self, payload: Dict[str, Any], status: int = 200) -> None:
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _read_json(self) -> Dict[str, Any]:
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self) -> None:
+                if not server.healthy:
+                    self._send_json({"error": "unavailable"}, status=503)
+                elif self.path.startswith("/api/tags"):
+                    self._send_json({
+                        "models": [
+                            {"name": name, "model": name, "size": 0, "details": {"family": "mock"}}
+                            for name in server.models
+                        ]
+                    })
+                elif self.path.startswith("/api/ps"):
+                    self._send_json({"models": [{"name": name, "model": name, "size": 0} for name in server.loaded]})
+                elif self.path.startswith("/api/version"):
+                    self._send_json({"version": "0.0.0-mock"})
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def do_POST(self) -> None:
+                body = self._read_json()
+                if not server.healthy:
+                    self._send_json({"error": "unavailable"}, status=503)
+                elif self.path.startswith("/api/show"):
+                    self._send_json({"details": {"family": "mock"}, "model_info": {}, "template": ""})
+                elif self.path.startswith("/api/chat"):
+                    self._chat(body)
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def _chat(self, body: Dict[str, Any]) -> None:
+                started = time.perf_counter()
+                reply = server.reply_for(body)
+                message = reply["message"]
+                prompt_tokens = sum(estimate_tokens(_message_text(m)) for m in body.get("messages") or [])
+                prompt_tokens += estimate_tokens(json.dumps(body.get("tools") or []))
+                completion_tokens = estimate_tokens(message["content"]) or 1
+                stream = body.get("stream", True)
+                model = body.get("model", "")
+                with server._lock:
+                    if model not in server.loaded:
+                        server.loaded.append(model)
+
+                prompt_seconds = server.latency_ms / 1000 + server._prompt_seconds(prompt_tokens)
+                time.sleep(prompt_seconds)
+                if stream:
+                    self._stream_chat(model, message, completion_tokens)
+                else:
+                    time.sleep(server._generation_seconds(completion_tokens))
+                finished = time.perf_counter()
+                final = {
+                    "model": model,
+                    "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                    "message": message if not stream else {"role": "assistant", "content": ""},
+                    "done": True,
+                    "done_reason": "stop",
+                    "total_duration": int((finished - started) * 1e9),
+                    "load_duration": 0,
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": int(prompt_seconds * 1e9),
+                    "eval_count": completion_tokens,
+                    "eval_duration": int(server._generation_seconds(completion_tokens) * 1e9),
+                }
+                if stream:
+                    self._write_chunk(final)
+                    self.wfile.write(b"0\r\n\r\n")
+                else:
+                    self._send_json(final)
+                with server._lock:
+                    server.requests.append({
+                        "agent": reply["agent"],
+                        "model": model,
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "tool_call": bool(message.get("tool_calls")),
+                        "stream": bool(stream),
+                        "started": started,
+                        "finished": finished,
+                    })
+
+            def _write_chunk(self, payload: Dict[str, Any]) -> None:
+                data = json.dumps(payload).encode("utf-8") + b"\n"
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _stream_chat(self, model: str, message: Dict[str, Any], completion_tokens: int) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                if message.get("tool_calls"):
+                    self._write_chunk({"model": model, "message": message, "done": False})
+                    return
+                words = re.findall(r"\S+\s*", message["content"])
+                delay = server._generation_seconds(completion_tokens) / max(1, len(words))
+                for word in words:
+                    if delay:
+                        time.sleep(delay)
+                    self._write_chunk({
+                        "model": model,
+                        "message": {"role": "assistant", "content": word},
+                        "done": False,
+                    })
+
+        return Handler
@@ -0,0 +1,78 @@
+"""Prompt-size benchmark: tokens per agent for every instruction variant.
+
+Agent instructions are assembled per call from prompt modules (see
+src/prompts.py), so their size depends on the case and the conversation
+phase. This builds each agent's request prefix (system instruction plus
+tool declarations, as sent to the model) for every variant and counts its
+tokens with LiteLLM's token counter for the agent's model.
+
+Usage:
+    python -m benchmarks.prompts --output prompts.json
+"""
+
+import argparse
+import asyncio
+import json
+from typing import Dict
+
+import litellm
+from google.adk.sessions import InMemorySessionService
+
+from src.agent import root_agent
+from src.intake_agent import CASE_KEY
+from src.router import PHASE_KEY, PHASE_SNAPSHOT
+from src.warmup import build_request, ollama_agents
+
+# Variant -> session state it is assembled for
+VARIANTS = {
+    "no_case": {},
+    "non_periop": {CASE_KEY: {"periop": False}},
+    "periop": {CASE_KEY: {"periop": True}},
+    "snapshot_non_periop": {CASE_KEY: {"periop": False}, PHASE_KEY: PHASE_SNAPSHOT},
+    "snapshot_periop": {CASE_KEY: {"periop": True}, PHASE_KEY: PHASE_SNAPSHOT},
+}
+
+
+async def measure_prompts() -> Dict[str, Dict[str, Dict[str, int]]]:
+    """Count instruction and tool-declaration tokens per agent and variant."""
+    session_service = InMemorySessionService()
+    results: Dict[str, Dict[str, Dict[str, int]]] = {}
+    for variant, state in VARIANTS.items():
+        session = await session_service.create_session(app_name="ckm_prompts", user_id="bench", state=state)
+        for agent in ollama_agents(root_agent):
+            request = await build_request(agent, session_service, session)
+            instruction = request.config.system_instruction or ""
+            declarations = [
+                declaration.model_dump(exclude_none=True, mode="json")
+                for tool in request.config.tools or []
+                for declaration in getattr(tool, "function_declarations", None) or []
+            ]
+            instruction_tokens = litellm.token_counter(model=agent.model.model, text=str(instruction))
+            tool_tokens = litellm.token_counter(model=agent.model.model, text=json.dumps(declarations)) if declarations else 0
+            results.setdefault(agent.name, {})[variant] = {
+                "instruction_tokens": instruction_tokens,
+                "tool_tokens": tool_tokens,
+                "total_tokens": instruction_tokens + tool_tokens,
+            }
+    return results
+
+
+def main() -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Count prompt-prefix tokens per agent and instruction variant.")
+    parser.add_argument("--output", help="Results JSON path")
+    args = parser.parse_args()
+
+    results = asyncio.run(measure_prompts())
+    print(f"{'agent':<20}" + "".join(f"{variant:>21}" for variant in VARIANTS))
+    for agent_name, variants in results.items():
+        print(f"{agent_name:<20}" + "".join(f"{variants[variant]['total_tokens']:>21}" for variant in VARIANTS))
+    print("(system instruction + tool declaration tokens)")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+"""Benchmark runner: scripted sessions through the real agent tree, offline.
+
+Starts MockOllamaServer, points OLLAMA_API_BASE at it and replays every
+scenario from examples.md through ``root_agent`` with the real routing,
+intake, parallel panel and mediator. Reports:
+- End-to-end turn and session latency (p50/p95/p99)
+- Orchestration overhead per turn (wall time minus time spent inside the mock model)
+- Per-agent latency, LLM calls and prompt/completion tokens
+- LLM calls and tokens per consult (sessions that produced a Consultation Snapshot)
+- Time to first snapshot token and time to complete per consult
+  (--streaming replays the sessions with token streaming on)
+- Scheduler queue depth, wait time and rejections
+- Peak memory
+
+Results are written as JSON; pass a previous file with --baseline to fail
+when model calls or prompt size grew.
+
+Usage:
+    python -m benchmarks.run --output bench.json --latency-ms 50 --tokens-per-second 200
+    python -m benchmarks.run --output new.json --baseline bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Offline: use LiteLLM's bundled model cost map instead of fetching it
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.runners import InMemoryRunner
+from google.genai import types
+
+from .mock_ollama import MockOllamaServer
+from .scenarios import EXAMPLES_PATH, load_scenarios
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+APP_NAME = "ckm_benchmark"
+USER_ID = "benchmark"
+
+# Metrics compared against --baseline: (path in results, allowed relative increase)
+REGRESSION_CHECKS = (
+    (("consult", "llm_calls"), 0.0),
+    (("consult", "prompt_tokens"), 0.05),
+)
+
+
+def percentiles(values: Iterable[float]) -> Dict[str, Optional[float]]:
+    """Nearest-rank p50/p95/p99 plus mean and count, in the input unit."""
+    ordered = sorted(values)
+    if not ordered:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "p99": None}
+
+    def rank(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, max(0, int(-(-p * len(ordered) // 100)) - 1))], 3)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+    }
+
+
+def busy_seconds(intervals: List[Tuple[float, float]], start: float, end: float) -> float:
+    """Length of the union of (started, finished) intervals clipped to [start, end].
+
+    Parallel specialist calls overlap, so their durations cannot simply be summed.
+    """
+    clipped = sorted((max(a, start), min(b, end)) for a, b in intervals if b > start and a < end)
+    total, current_start, current_end = 0.0, None, None
+    for a, b in clipped:
+        if current_end is None or a > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = a, b
+        else:
+            current_end = max(current_end, b)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+def _walk(agent: BaseAgent) -> Iterable[BaseAgent]:
+    yield agent
+    for sub_agent in agent.sub_agents:
+        yield from _walk(sub_agent)
+
+
+def _prepend_callback(agent: BaseAgent, field: str, callback: Any) -> None:
+    existing = getattr(agent, field)
+    if existing is None:
+        existing = []
+    elif not isinstance(existing, list):
+        existing = [existing]
+    setattr(agent, field, [callback, *existing])
+
+
+def instrument_agents(root: BaseAgent) -> Dict[str, List[float]]:
+    """Time every agent in the tree with before/after agent callbacks.
+
+    The timing callbacks run first and always return None, so routing
+    callbacks that short-circuit an agent are unaffected.
+
+    Returns:
+        Dict of agent name -> list of run durations in milliseconds (filled while running)
+    """
+    durations: Dict[str, List[float]] = {}
+    started: Dict[Tuple[str, str], float] = {}
+
+    def before(callback_context: CallbackContext) -> None:
+        started[(callback_context.invocation_id, callback_context.agent_name)] = time.perf_counter()
+
+    def after(callback_context: CallbackContext) -> None:
+        begin = started.pop((callback_context.invocation_id, callback_context.agent_name), None)
+        if begin is not None:
+            durations.setdefault(callback_context.agent_name, []).append((time.perf_counter() - begin) * 1000)
+
+    for agent in _walk(root):
+        _prepend_callback(agent, "before_agent_callback", before)
+        _prepend_callback(agent, "after_agent_callback", after)
+    return durations
+
+
+async def run_scenario(
+    runner: InMemoryRunner,
+    server: MockOllamaServer,
+    scenario: Dict[str, Any],
+    snapshot_key: str,
+    run_config: Optional[RunConfig] = None,
+) -> Dict[str, Any]:
+    """Replay one scripted session and measure each turn.
+
+    Returns:
+        Dict with per-turn wall/overhead times, the mock requests made and
+        whether a Consultation Snapshot was produced
+    """
+    session = await runner.session_service.create_session(app_name=APP_NAME, user_id=USER_ID)
+    first_request = len(server.requests)
+    turns = []
+    session_start = time.perf_counter()
+    for text in scenario["turns"]:
+        message = types.Content(role="user", parts=[types.Part(text=text)])
+        turn_start = time.perf_counter()
+        async for _ in runner.run_async(
+            user_id=USER_ID, session_id=session.id, new_message=message, run_config=run_config
+        ):
+            pass
+        turn_end = time.perf_counter()
+        intervals = [(r["started"], r["finished"]) for r in server.requests[first_request:]]
+        model_seconds = busy_seconds(intervals, turn_start, turn_end)
+        turns.append({
+            "wall_ms": (turn_end - turn_start) * 1000,
+            "overhead_ms": (turn_end - turn_start - model_seconds) * 1000,
+        })
+    session_ms = (time.perf_counter() - session_start) * 1000
+    session = await runner.session_service.get_session(
+        app_name=APP_NAME, user_id=USER_ID, session_id=session.id
+    )
+    return {
+        "turns": turns,
+        "session_ms": session_ms,
+        "requests": server.requests[first_request:],
+        "consult": bool(session.state.get(snapshot_key)),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(EXAMPLES_PATH),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _max_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(
+    runs: List[Dict[str, Any]],
+    agent_durations: Dict[str, List[float]],
+    config: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Aggregate scenario runs into the results document."""
+    agents: Dict[str, Dict[str, Any]] = {}
+    for name, durations in agent_durations.items():
+        agents[name] = {"latency_ms": percentiles(durations), "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    for run in runs:
+        for request in run["requests"]:
+            entry = agents.setdefault(
+                request["agent"],
+                {"latency_ms": percentiles([]), "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0},
+            )
+            entry["llm_calls"] += 1
+            entry["prompt_tokens"] += request["prompt_tokens"]
+            entry["completion_tokens"] += request["completion_tokens"]
+    repeats = max(1, config["repeat"])
+    for entry in agents.values():
+        for field in ("llm_calls", "prompt_tokens", "completion_tokens"):
+            entry[field] = round(entry[field] / repeats, 2)
+
+    scenarios: Dict[str, Dict[str, Any]] = {}
+    for run in runs:
+        entry = scenarios.setdefault(run["name"], {"session_ms": [], "llm_calls": [], "prompt_tokens": [], "completion_tokens": [], "consult": run["consult"]})
+        entry["session_ms"].append(run["session_ms"])
+        entry["llm_calls"].append(len(run["requests"]))
+        entry["prompt_tokens"].append(sum(r["prompt_tokens"] for r in run["requests"]))
+        entry["completion_tokens"].append(sum(r["completion_tokens"] for r in run["requests"]))
+    for entry in scenarios.values():
+        entry["session_ms"] = percentiles(entry["session_ms"])
+        for field in ("llm_calls", "prompt_tokens", "completion_tokens"):
+            entry[field] = round(sum(entry[field]) / len(entry[field]), 2)
+
+    consults = [run for run in runs if run["consult"]]
+
+    def per_consult(field: str) -> Optional[float]:
+        if not consults:
+            return None
+        totals = [sum(r[field] for r in run["requests"]) for run in consults]
+        return round(sum(totals) / len(totals), 2)
+
+    turns = [turn for run in runs for turn in run["turns"]]
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": config,
+        },
+        "end_to_end": {
+            "turn_wall_ms": percentiles(t["wall_ms"] for t in turns),
+            "turn_overhead_ms": percentiles(t["overhead_ms"] for t in turns),
+            "session_ms": percentiles(run["session_ms"] for run in runs),
+        },
+        "consult": {
+            "count": len(consults),
+            "llm_calls": round(sum(len(run["requests"]) for run in consults) / len(consults), 2) if consults else None,
+            "prompt_tokens": per_consult("prompt_tokens"),
+            "completion_tokens": per_consult("completion_tokens"),
+        },
+        "agents": dict(sorted(agents.items())),
+        "scenarios": scenarios,
+    }
+
+
+def compare_to_baseline(results: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """List regressions in model calls or prompt size compared to a previous run."""
+    regressions = []
+    checks = list(REGRESSION_CHECKS)
+    for name in results["agents"]:
+        checks.append((("agents", name, "llm_calls"), 0.0))
+        checks.append((("agents", name, "prompt_tokens"), 0.05))
+    for path, tolerance in checks:
+        new, old = results, baseline
+        for key in path:
+            new = new.get(key) if isinstance(new, dict) else None
+            old = old.get(key) if isinstance(old, dict) else None
+        if isinstance(new, (int, float)) and isinstance(old, (int, float)) and new > old * (1 + tolerance):
+            regressions.append(f"{'.'.join(path)}: {old} -> {new}")
+    return regressions
+
+
+async def run_benchmark(
+    latency_ms: float = 0.0,
+    tokens_per_second: Optional[float] = None,
+    repeat: int = 3,
+    warmup: int = 1,
+    responses: Optional[Dict[str, str]] = None,
+    use_cache: bool = False,
+    trace_memory: bool = False,
+    examples_path: str = EXAMPLES_PATH,
+    streaming: bool = False,
+) -> Dict[str, Any]:
+    """Run every scenario `repeat` times against the mock server.
+
+    Args:
+        latency_ms: Mock time to first token per request
+        tokens_per_second: Mock generation speed (None = instant)
+        repeat: Passes over the scenario list
+        warmup: Unmeasured passes first (lazy imports, connection setup)
+        responses: Canned responses by agent name (merged over the defaults)
+        use_cache: Keep the result cache enabled (off by default so every pass calls the model)
+        trace_memory: Track Python heap peak with tracemalloc (slows the run)
+        examples_path: Markdown file with the scripted sessions
+        streaming: Run with token streaming (StreamingMode.SSE)
+
+    Returns:
+        Results document (see summarize)
+    """
+    if not use_cache:
+        os.environ["CKM_CACHE_DISABLED"] = "1"
+    if trace_memory:
+        tracemalloc.start()
+
+    from src import root_agent
+    from src.mediator import SNAPSHOT_OUTPUT_KEY
+    from src.metrics import consult_metrics
+    from src.scheduler import request_scheduler
+
+    scenarios = load_scenarios(examples_path)
+    agent_durations = instrument_agents(root_agent)
+    run_config = RunConfig(streaming_mode=StreamingMode.SSE if streaming else StreamingMode.NONE)
+    runs = []
+    with MockOllamaServer(latency_ms=latency_ms, tokens_per_second=tokens_per_second, responses=responses) as server:
+        os.environ["OLLAMA_API_BASE"] = server.url
+        runner = InMemoryRunner(agent=root_agent, app_name=APP_NAME)
+        for _ in range(warmup):
+            for scenario in scenarios:
+                await run_scenario(runner, server, scenario, SNAPSHOT_OUTPUT_KEY, run_config)
+        for durations in agent_durations.values():
+            durations.clear()
+        consult_metrics.clear()
+        for _ in range(repeat):
+            for scenario in scenarios:
+                run = await run_scenario(runner, server, scenario, SNAPSHOT_OUTPUT_KEY, run_config)
+                runs.append({"name": scenario["name"], **run})
+
+    config = {
+        "latency_ms": latency_ms,
+        "tokens_per_second": tokens_per_second,
+        "repeat": repeat,
+        "warmup": warmup,
+        "use_cache": use_cache,
+        "streaming": streaming,
+        "scenarios": [s["name"] for s in scenarios],
+    }
+    results = summarize(runs, agent_durations, config)
+    latency = consult_metrics.summary()
+    for field in ("time_to_first_token_seconds", "time_to_complete_seconds"):
+        results["consult"][field] = latency[field]
+    results["safety"] = latency["safety"]
+    results["queue"] = {**latency["queue"], "backends": request_scheduler.stats()}
+    results["memory"] = {"max_rss_mb": _max_rss_mb()}
+    if trace_memory:
+        results["memory"]["python_heap_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        tracemalloc.stop()
+    return results
+
+
+def main() -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Offline benchmark of the CKM agent tree against a mock Ollama server.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Results JSON path")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Mock time to first token (default: 0)")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="Mock generation speed (default: instant)")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the scenarios (default: 3)")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured passes before measuring (default: 1)")
+    parser.add_argument("--responses", help="JSON file of canned responses by agent name")
+    parser.add_argument("--examples", default=EXAMPLES_PATH, help="Markdown file with scripted sessions")
+    parser.add_argument("--use-cache", action="store_true", help="Keep the result cache enabled")
+    parser.add_argument("--streaming", action="store_true", help="Stream tokens (StreamingMode.SSE) like adk web / run_sse")
+    parser.add_argument("--trace-memory", action="store_true", help="Report Python heap peak (tracemalloc)")
+    parser.add_argument("--baseline", help="Previous results JSON; exit 1 if LLM calls or prompt tokens regressed")
+    args = parser.parse_args()
+
+    responses = None
+    if args.responses:
+        with open(args.responses, encoding="utf-8") as handle:
+            responses = json.load(handle)
+    results = asyncio.run(run_benchmark(
+        latency_ms=args.latency_ms,
+        tokens_per_second=args.tokens_per_second,
+        repeat=args.repeat,
+        warmup=args.warmup,
+        responses=responses,
+        use_cache=args.use_cache,
+        trace_memory=args.trace_memory,
+        examples_path=args.examples,
+        streaming=args.streaming,
+    ))
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(results, handle, indent=2, ensure_ascii=False)
+
+    end_to_end = results["end_to_end"]
+    print(f"Results written to {args.output}")
+    print(f"Turn wall ms      p50={end_to_end['turn_wall_ms']['p50']} p95={end_to_end['turn_wall_ms']['p95']} p99={end_to_end['turn_wall_ms']['p99']}")
+    print(f"Turn overhead ms  p50={end_to_end['turn_overhead_ms']['p50']} p95={end_to_end['turn_overhead_ms']['p95']} p99={end_to_end['turn_overhead_ms']['p99']}")
+    consult = results["consult"]
+    print(f"Per consult       llm_calls={consult['llm_calls']} prompt_tokens={consult['prompt_tokens']}")
+    print(f"Consult latency s first_token p50={consult['time_to_first_token_seconds']['p50']} complete p50={consult['time_to_complete_seconds']['p50']}")
+    print(f"Safety            violations={results['safety']['violations']} repaired={results['safety']['repaired']}")
+    waits = results["queue"]["wait_seconds"]
+    print(f"Queue wait s      p50={waits['p50']} p95={waits['p95']} rejected={results['queue']['rejected']}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as handle:
+            regressions = compare_to_baseline(results, json.load(handle))
+        if regressions:
+            print("Regressions against baseline:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
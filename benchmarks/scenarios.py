@@ -0,0 +1,82 @@
+"""Scripted benchmark sessions parsed from examples.md.
+
+Each "## Example N" section becomes one session made of its **User:**
+replies (inline `code` or the following ```text block). The "Expansion
+Examples" replies (A/B/C) are appended to the last session that reaches a
+Consultation Snapshot, since they only make sense after one.
+"""
+
+import os
+import re
+from typing import Dict, List
+
+
+EXAMPLES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples.md")
+
+# Every session opens with a greeting, which the root agent answers with the welcome message
+OPENING_MESSAGE = "Hello"
+
+_SECTION = re.compile(r"^## ", re.MULTILINE)
+_USER_INLINE = re.compile(r"^\*\*User:\*\*\s*`(?P<text>[^`]+)`\s*$")
+_USER_BLOCK = re.compile(r"^\*\*User:\*\*\s*$")
+_SNAPSHOT_REPLIES = {"generate synthesis", "confirm"}
+
+
+def _user_turns(section: str) -> List[str]:
+    turns = []
+    lines = section.splitlines()
+    index = 0
+    while index < len(lines):
+        line = lines[index].strip()
+        inline = _USER_INLINE.match(line)
+        if inline:
+            turns.append(inline.group("text").strip())
+        elif _USER_BLOCK.match(line):
+            # Skip to the fenced block that follows and collect it verbatim
+            index += 1
+            while index < len(lines) and not lines[index].strip().startswith("```"):
+                index += 1
+            block = []
+            index += 1
+            while index < len(lines) and not lines[index].strip().startswith("```"):
+                block.append(lines[index])
+                index += 1
+            turns.append("\n".join(block).strip())
+        index += 1
+    return turns
+
+
+def load_scenarios(path: str = EXAMPLES_PATH) -> List[Dict[str, object]]:
+    """Parse examples.md into scripted sessions.
+
+    Args:
+        path: Markdown file with the example conversations
+
+    Returns:
+        List of {'name': str, 'turns': list[str]} in document order
+    """
+    with open(path, encoding="utf-8") as handle:
+        text = handle.read().replace("\r\n", "\n")
+
+    scenarios: List[Dict[str, object]] = []
+    expansions: List[str] = []
+    target: List[str] = []
+    for section in _SECTION.split(text)[1:]:
+        title = section.splitlines()[0].strip().lower()
+        # Other "## " headings are part of a sample response and continue the current example
+        if title.startswith("example") and ":" in title:
+            name = re.sub(r"[^a-z0-9]+", "_", title.split(":", 1)[1].strip()).strip("_")
+            target = [OPENING_MESSAGE]
+            scenarios.append({"name": name, "turns": target})
+        elif title.startswith("expansion"):
+            target = expansions
+        elif title.startswith("usage"):
+            target = []
+        target.extend(_user_turns(section))
+
+    if expansions:
+        for scenario in reversed(scenarios):
+            if any(turn.lower() in _SNAPSHOT_REPLIES for turn in scenario["turns"]):
+                scenario["turns"] = [*scenario["turns"], *expansions, "Back"]
+                break
+    return scenarios
@@ -0,0 +1,131 @@
+"""Session store soak benchmark: thousands of consults over several simulated days.
+
+Replays synthetic consult sessions (intake turns, three specialist
+assessments with their state deltas, the snapshot, an expansion) straight
+into a session service, on a simulated clock, and reports at checkpoints:
+- Live sessions and stored events
+- Database size (SQLite store)
+- Resident memory
+
+Compare the persistent store against the in-memory service with --backend.
+
+Usage:
+    python -m benchmarks.sessions --consults 5000 --days 5 --output sessions.json
+    python -m benchmarks.sessions --consults 5000 --days 5 --backend memory
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List
+
+from google.adk.events import Event, EventActions
+from google.adk.sessions import BaseSessionService, InMemorySessionService
+from google.genai import types
+
+from src.session_store import CkmSessionService
+
+
+APP_NAME = "ckm_benchmark"
+
+# Roughly the size of a real specialist assessment / snapshot
+_ASSESSMENT = json.dumps({"key_findings": ["finding " * 8] * 5, "medications": [{"medication": "Drug", "action": "Continue", "detail": "detail " * 6}] * 6, "risks": ["risk " * 10] * 4})
+_SNAPSHOT = "**Consultation Snapshot**\n" + "- line of the snapshot text\n" * 40
+_TURNS = ["hi", "2", "68M, eGFR 42, EF 35%, NYHA III, HbA1c 8.1%, T2DM, metformin, empagliflozin", "Confirm", "eGFR 38", "Confirm", "B", "Back"]
+
+
+def _rss_mb() -> float:
+    """Current resident set size (Linux), else the peak."""
+    try:
+        with open("/proc/self/statm") as handle:
+            return round(int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except OSError:
+        import resource
+
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _event(author: str, text: str, invocation_id: str, timestamp: float, delta: Dict[str, Any] = None) -> Event:
+    return Event(
+        author=author,
+        invocation_id=invocation_id,
+        timestamp=timestamp,
+        content=types.Content(role="user" if author == "user" else "model", parts=[types.Part(text=text)]),
+        actions=EventActions(state_delta=delta or {}),
+    )
+
+
+async def run_consult(service: BaseSessionService, user_id: str, start: float, step: float) -> float:
+    """Store one scripted consult session; return the simulated time it ended."""
+    session = await service.create_session(app_name=APP_NAME, user_id=user_id)
+    now = start
+    for turn in _TURNS:
+        invocation_id = str(uuid.uuid4())
+        now += step
+        await service.append_event(session, _event("user", turn, invocation_id, now))
+        if turn == "Confirm":
+            for agent, key in (("cardiologist", "cardiology_assessment"), ("nephrologist", "nephrology_assessment"), ("diabetologist", "endocrinology_assessment")):
+                await service.append_event(session, _event(agent, _ASSESSMENT, invocation_id, now, {key: _ASSESSMENT}))
+            await service.append_event(session, _event("mediator", _SNAPSHOT, invocation_id, now, {"consultation_snapshot": _SNAPSHOT}))
+        else:
+            await service.append_event(session, _event("intake_coordinator", "Reply " * 30, invocation_id, now))
+    return now
+
+
+async def run_soak(backend: str, consults: int, days: float, checkpoints: int, db_path: str) -> Dict[str, Any]:
+    """Spread consults evenly over the simulated days and sample the store at checkpoints."""
+    if backend == "memory":
+        service: BaseSessionService = InMemorySessionService()
+    else:
+        service = CkmSessionService.from_env(db_path)
+    start = clock = time.time()
+    interval = days * 86400 / consults
+    samples: List[Dict[str, Any]] = []
+    every = max(1, consults // checkpoints)
+    started = time.perf_counter()
+    for index in range(1, consults + 1):
+        step = min(60.0, interval / len(_TURNS))
+        clock = await run_consult(service, f"clinician-{index % 20}", clock, step) + interval - step * len(_TURNS)
+        if isinstance(service, CkmSessionService):
+            service.purge_expired(now=clock)
+        if index % every == 0 or index == consults:
+            sample = {"consults": index, "simulated_days": round((clock - start) / 86400, 2), "rss_mb": _rss_mb()}
+            if isinstance(service, CkmSessionService):
+                sample.update(service.stats())
+            else:
+                sample["sessions"] = sum(len(users) for apps in service.sessions.values() for users in apps.values())
+            samples.append(sample)
+            print(json.dumps(sample))
+    return {
+        "config": {"backend": backend, "consults": consults, "days": days, "ttl_seconds": getattr(service, "ttl_seconds", None)},
+        "wall_seconds": round(time.perf_counter() - started, 1),
+        "samples": samples,
+    }
+
+
+def main() -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Soak test of the session store over simulated days of consults.")
+    parser.add_argument("--backend", choices=("sqlite", "memory"), default="sqlite", help="Session service (default: sqlite)")
+    parser.add_argument("--consults", type=int, default=3000, help="Consult sessions to store (default: 3000)")
+    parser.add_argument("--days", type=float, default=3.0, help="Simulated days they are spread over (default: 3)")
+    parser.add_argument("--checkpoints", type=int, default=10, help="Samples taken (default: 10)")
+    parser.add_argument("--db", help="SQLite file (default: a temporary file)")
+    parser.add_argument("--output", help="Results JSON path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db or os.path.join(tmp, "sessions.db")
+        results = asyncio.run(run_soak(args.backend, args.consults, args.days, args.checkpoints, db_path))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""Custom ADK services, loaded by ``adk web .`` / ``adk run .`` / ``adk api_server .``.
+
+Registers the ``ckm`` session service scheme (persistent SQLite store, see
+src/session_store.py):
+    adk web . --session_service_uri ckm://ckm_sessions.db
+"""
+
+from google.adk.cli.service_registry import get_service_registry
+
+from src.session_store import ckm_session_service_factory
+
+
+get_service_registry().register_session_service("ckm", ckm_session_service_factory)
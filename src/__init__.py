@@ -8,21 +8,106 @@ Modules:
 - intake_agent: User intake flow (guided intake and paste mode)
 - specialists: Cardiologist, Nephrologist, Diabetologist agents
 - mediator: Synthesis agent with Consultation Snapshot output
+- expansions: Expansion handler for snapshot details (A, B, C, Back)
+- router: Deterministic routing of control replies
+- cache: Content-addressed result cache for the specialist panel
+- periop_rules: Rule-based peri-op medication stoplight engine
+- case_parser: Deterministic paste-mode case parser
+- calculators: Deterministic clinical calculators (eGFR, KDIGO staging, HF phenotype, dose rules)
+- panel_context: Compiled case context for the specialist panel
+- prompts: Composable agent instructions assembled per call from the case flags
+- triage: Conditional specialist fan-out for the panel
+- reconsult: Incremental re-consultation after the clinician adds details
+- history: Conversation history compaction for the agents that see the transcript
+- assessments: Typed specialist assessments and the merged mediator view
+- snapshot: Deterministic Consultation Snapshot rendering from mediator JSON
+- batch: Headless JSONL batch runner (python -m src.batch)
+- session_store: Persistent SQLite session store with compaction and idle expiry
+- models: Model registry (per-agent model config, shared connection pool)
+- scheduler: Urgency-aware admission control and request queue per model backend
+- backends: Ollama backend pool with load balancing, health probes and failover
+- progress: Streaming progress events for the specialist panel
+- metrics: Time-to-first-token and time-to-complete per consult
+- tracing: Per-call spans with Ollama timing and a trace summary CLI (python -m src.tracing)
+- warmup: Model warm-up and prompt-prefix priming before the first consult (python -m src.warmup)
+- safety: Post-generation safety rules with targeted repair
 - output_templates: Standard output formats and templates
 - utils: Utility functions
 """
 
-from .agent import root_agent, ckm_panel, specialists_parallel, ckm_board, specialists_board
-from .intake_agent import intake_agent, WELCOME_MESSAGE
-from .specialists import cardiologist_agent, nephrologist_agent, diabetologist_agent
-from .mediator import mediator_agent
-from .output_templates import (
-    CONSULTATION_SNAPSHOT_TEMPLATE,
-    PERIOP_MEDICATION_TABLE_TEMPLATE,
-    STANDARD_PERIOP_MEDICATIONS,
-    generate_consultation_snapshot,
-    format_medication_table,
-)
+import importlib
+import sys
+import types
+from typing import TYPE_CHECKING, Any, List
+
+# Exported name -> submodule defining it. Imported on first access, so
+# ``from src import format_medication_table`` does not load google.adk or
+# build the agents; ``src.root_agent`` builds the agent tree.
+_EXPORTS = {
+    "root_agent": "agent",
+    "ckm_panel": "agent",
+    "specialists_parallel": "agent",
+    "ckm_board": "agent",
+    "specialists_board": "agent",
+    "intake_agent": "intake_agent",
+    "WELCOME_MESSAGE": "intake_agent",
+    "cardiologist_agent": "specialists",
+    "nephrologist_agent": "specialists",
+    "diabetologist_agent": "specialists",
+    "mediator_agent": "mediator",
+    "expansion_agent": "expansions",
+    "CONSULTATION_SNAPSHOT_TEMPLATE": "output_templates",
+    "PERIOP_MEDICATION_TABLE_TEMPLATE": "output_templates",
+    "STANDARD_PERIOP_MEDICATIONS": "output_templates",
+    "generate_consultation_snapshot": "output_templates",
+    "format_medication_table": "output_templates",
+    "build_periop_plan": "periop_rules",
+    "periop_medication_plan": "periop_rules",
+    "create_model": "models",
+    "resolve_model_config": "models",
+}
+
+if TYPE_CHECKING:
+    from .agent import root_agent, ckm_panel, specialists_parallel, ckm_board, specialists_board
+    from .intake_agent import intake_agent, WELCOME_MESSAGE
+    from .specialists import cardiologist_agent, nephrologist_agent, diabetologist_agent
+    from .mediator import mediator_agent
+    from .expansions import expansion_agent
+    from .output_templates import (
+        CONSULTATION_SNAPSHOT_TEMPLATE,
+        PERIOP_MEDICATION_TABLE_TEMPLATE,
+        STANDARD_PERIOP_MEDICATIONS,
+        generate_consultation_snapshot,
+        format_medication_table,
+    )
+    from .periop_rules import build_periop_plan, periop_medication_plan
+    from .models import create_model, resolve_model_config
+
+
+def __getattr__(name: str) -> Any:
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    # Cache it so later lookups skip __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_EXPORTS))
+
+
+class _Package(types.ModuleType):
+    def __setattr__(self, name: str, value: Any) -> None:
+        # Importing the src.intake_agent submodule must not shadow the intake_agent export
+        if name in _EXPORTS and isinstance(value, types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
+
 
 __all__ = [
     # Main agents
@@ -33,6 +118,7 @@ __all__ = [
     "specialists_board",  # Backwards compatibility
     "intake_agent",
     "mediator_agent",
+    "expansion_agent",
     # Specialist agents
     "cardiologist_agent",
     "nephrologist_agent",
@@ -44,4 +130,9 @@ __all__ = [
     "STANDARD_PERIOP_MEDICATIONS",
     "generate_consultation_snapshot",
     "format_medication_table",
+    "build_periop_plan",
+    "periop_medication_plan",
+    # Model registry
+    "create_model",
+    "resolve_model_config",
 ]
@@ -12,22 +12,103 @@ UX Flow:
 - Structured case collection
 - Consultation Snapshot output (≤250 words)
 - Expandable details on user request (A, B, C)
+
+Control replies (first turn, "1"/"2", "A"/"B"/"C"/"Back") are routed
+deterministically before the model is called (see router.py).
+
+The panel works from a compiled case object rather than the intake
+transcript (see panel_context.py). With streaming enabled the snapshot is
+streamed token by token, preceded by specialist progress events
+(progress.py); latency per consult is recorded in metrics.py. When the
+clinician adds details after a snapshot, only the specialists whose case
+fields changed are rerun (reconsult.py). Consults are admitted and their
+model requests queued by procedure urgency (scheduler.py). With
+CKM_TRACE_PATH set, every model call is traced under its consult
+(tracing.py). Agent instructions are assembled per call from prompt
+modules, so non-surgical cases and turns before a snapshot skip the
+peri-op and expansion sections (prompts.py). Agents that see the
+transcript get it compacted: finished phases are replaced by the canonical
+case in state, keeping the latest snapshot (history.py).
 """
 
+from typing import Optional
+
 from google.adk import Agent
-from google.adk.models.lite_llm import LiteLlm
-from google.adk.agents import ParallelAgent, SequentialAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.agents import SequentialAgent
+from google.genai import types
 from .specialists import (
     cardiologist_agent,
     nephrologist_agent,
     diabetologist_agent,
 )
 from .mediator import mediator_agent
-from .intake_agent import intake_agent, WELCOME_MESSAGE
+from .intake_agent import intake_agent, WELCOME_MESSAGE, INTAKE_OPENED_KEY
+from .expansions import expansion_agent
+from .history import add_history_compaction
+from .metrics import finish_consult_metrics, start_consult_metrics
+from .models import create_model
+from .panel_context import compile_case, reset_case_state
+from .progress import PanelProgressAgent
+from .prompts import PromptModule, create_instruction, intake_phase, periop_snapshot, snapshot_phase
+from .reconsult import plan_reconsult, remember_consult
+from .scheduler import create_admission_control, end_admission
+from .tracing import end_consult_trace, start_consult_trace, trace_agent_tree
+from .triage import triage_panel
+from .router import (
+    MODE_REPLIES,
+    PHASE_AWAITING_MODE,
+    PHASE_KEY,
+    PHASE_SNAPSHOT,
+    ROUTE_EXPANSION,
+    ROUTE_INTAKE,
+    ROUTE_WELCOME,
+    classify_turn,
+    get_user_text,
+    normalize_control_reply,
+    text_response,
+    transfer_response,
+)
+
+
+def route_control_reply(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """Answer control replies to the root agent without calling the model.
+
+    - New session → static welcome message
+    - "1" / "2" after the welcome or a snapshot → transfer to
+      intake_coordinator, with the case state of any earlier patient cleared
+    - "A" / "B" / "C" / "Back" after a snapshot → transfer to expansion_handler
+
+    Any other turn returns None so the coordinator model handles it.
+    """
+    state = callback_context.state
+    reply = normalize_control_reply(get_user_text(callback_context.user_content))
+    route = classify_turn(state.get(PHASE_KEY), reply)
 
+    if route == ROUTE_WELCOME:
+        state[PHASE_KEY] = PHASE_AWAITING_MODE
+        return text_response(WELCOME_MESSAGE)
+    if route == ROUTE_INTAKE:
+        state[PHASE_KEY] = MODE_REPLIES[reply]
+        state[INTAKE_OPENED_KEY] = False
+        reset_case_state(state)
+        return transfer_response("intake_coordinator")
+    if route == ROUTE_EXPANSION:
+        return transfer_response("expansion_handler")
+    return None
 
-# Create parallel agent for specialist assessments
-specialists_parallel = ParallelAgent(
+
+def mark_snapshot_ready(callback_context: CallbackContext) -> Optional[types.Content]:
+    """Record that a Consultation Snapshot is available for expansion."""
+    callback_context.state[PHASE_KEY] = PHASE_SNAPSHOT
+    return None
+
+
+# Create parallel agent for specialist assessments (streams progress, not specialist drafts)
+specialists_parallel = PanelProgressAgent(
     name="specialists_panel",
     description="Parallel assessment by cardiologist, nephrologist, and diabetologist for CKM Syndrome conditions.",
     sub_agents=[cardiologist_agent, nephrologist_agent, diabetologist_agent],
@@ -41,16 +122,26 @@ ckm_panel = SequentialAgent(
         specialists_parallel,  # Step 1: Parallel assessment
         mediator_agent,        # Step 2: Synthesis → Consultation Snapshot
     ],
+    # Case object → state (panel never sees the transcript), then pick the specialists it needs
+    # and, after added details, the ones whose inputs changed; admit the consult by urgency
+    # (a rejected consult ends before its trace starts)
+    before_agent_callback=[
+        compile_case,
+        triage_panel,
+        plan_reconsult,
+        start_consult_metrics,
+        create_admission_control(
+            agent.model for agent in (cardiologist_agent, nephrologist_agent, diabetologist_agent, mediator_agent)
+        ),
+        start_consult_trace,
+    ],
+    after_agent_callback=[mark_snapshot_ready, remember_consult, finish_consult_metrics, end_admission, end_consult_trace],
 )
 
-# Create root agent that handles the full flow
-root_agent = Agent(
-    model=LiteLlm(model="ollama_chat/qwen2.5:14b", temperature=0,  seed=0),
-    name="ckm_root_agent",
-    description="Root agent for CKM Syndrome multi-agent consultation pattern. Handles intake, coordinates specialist assessments, and manages output expansions.",
-    instruction=f"""You are the coordinator for a Cardio-Kidney-Metabolic (CKM) Syndrome Multi-Specialist Consultation portal.
-
-## WELCOME MESSAGE (First Message Only)
+# Root instruction modules; the intake and expansion sections depend on the phase
+ROOT_PROMPT = (
+    PromptModule("core", """You are the coordinator for a Cardio-Kidney-Metabolic (CKM) Syndrome Multi-Specialist Consultation portal."""),
+    PromptModule("intake", f"""## WELCOME MESSAGE (First Message Only)
 
 When starting a new conversation, ALWAYS begin with this exact welcome message:
 
@@ -74,16 +165,14 @@ After minimum dataset collected, ask: "Ready to generate synthesis, or add more
 Delegate to the intake_coordinator which will:
 1. Accept free text or JSON case
 2. Parse and structure the data
-3. Confirm with user before proceeding
-
-## CONSULTATION PHASE
+3. Confirm with user before proceeding""", intake_phase),
+    PromptModule("consultation", """## CONSULTATION PHASE
 
 When the case is ready (user says "Generate synthesis" or "Confirm"):
 1. Compile the complete case summary
 2. Delegate to ckm_panel sub-agent
-3. Present the mediator's Consultation Snapshot output
-
-## OUTPUT RULES
+3. Present the mediator's Consultation Snapshot output"""),
+    PromptModule("expansions", """## OUTPUT RULES
 
 **Default Output: Consultation Snapshot (≤250 words)**
 The mediator will provide output in this format:
@@ -101,7 +190,8 @@ Followed by: "Reply A for peri-op medication stoplight table, B for specialty ra
 - User replies **C** → Show Citations and Guideline References
 - User replies **Back** → Return to Consultation Snapshot
 
-## CRITICAL RULES
+Delegate all expansion requests to the expansion_handler sub-agent.""", snapshot_phase),
+    PromptModule("rules", """## CRITICAL RULES
 
 1. **Never skip the welcome message** for new conversations
 2. **Limit questions to 3–5 per turn** in guided intake
@@ -112,9 +202,8 @@ Followed by: "Reply A for peri-op medication stoplight table, B for specialty ra
 7. **Flag missing data** explicitly:
    - EF missing: "HF phenotype unclear; EF not provided"
    - eGFR missing: "CKD staging unclear; eGFR not provided"
-   - HbA1c missing: "Glycemic control unclear; HbA1c not provided"
-
-## EXAMPLE PERI-OP MEDICATION TABLE
+   - HbA1c missing: "Glycemic control unclear; HbA1c not provided\""""),
+    PromptModule("periop_table", """## EXAMPLE PERI-OP MEDICATION TABLE
 
 | Medication | Continue | Hold | Restart Criteria | Owner / Guideline |
 |------------|:--------:|:----:|------------------|-------------------|
@@ -123,12 +212,27 @@ Followed by: "Reply A for peri-op medication stoplight table, B for specialty ra
 | Lisinopril (ACEi) |  | 24h pre-op | Hemodynamically stable, euvolemic, K acceptable | Nephrology / Anesthesia |
 | Carvedilol (β-blocker) | ✓ |  | Continue peri-op; avoid abrupt withdrawal | Cardiology |
 | Atorvastatin | ✓ |  | Continue peri-op | Cardiology |
-| Furosemide | Conditional | Day of surgery if hypovolemic | Based on volume status and renal function | Cardiology / Anesthesia |
+| Furosemide | Conditional | Day of surgery if hypovolemic | Based on volume status and renal function | Cardiology / Anesthesia |""", periop_snapshot),
+    PromptModule("closing", """Be professional, clear, and ensure efficient information collection and synthesis."""),
+)
 
-Be professional, clear, and ensure efficient information collection and synthesis.""",
-    sub_agents=[intake_agent, ckm_panel],
+# Create root agent that handles the full flow
+root_agent = Agent(
+    model=create_model("root"),
+    name="ckm_root_agent",
+    description="Root agent for CKM Syndrome multi-agent consultation pattern. Handles intake, coordinates specialist assessments, and manages output expansions.",
+    instruction=create_instruction(*ROOT_PROMPT),
+    sub_agents=[intake_agent, ckm_panel, expansion_agent],
+    before_model_callback=route_control_reply,
 )
 
+# Name the agent of every model call in its trace span
+trace_agent_tree(root_agent)
+
+# Compact the transcript of the agents that see it (the panel works from the compiled case)
+for agent, role in ((root_agent, "root"), (intake_agent, "intake"), (expansion_agent, "expansion")):
+    add_history_compaction(agent, role)
+
 # Backwards compatibility aliases
 ckm_board = ckm_panel
 specialists_board = specialists_parallel
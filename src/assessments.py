@@ -0,0 +1,316 @@
+"""Typed specialist assessments.
+
+Each specialist answers with one JSON object instead of free-form
+markdown. The object is validated against its specialty schema in an
+after_model_callback and stored normalised in session state, so:
+1. Specialists generate short field values instead of a long markdown report
+2. The mediator receives one compact merged view of all consulted
+   specialties, with duplicate medication recommendations collapsed
+3. Markdown is only rendered (deterministically) when the clinician asks
+   for the specialty rationale
+
+Schema (all specialties):
+- classification fields (specialty-specific, see the subclasses)
+- key_findings, risks, actions, guideline_refs: lists of short strings
+- medications: [{"medication", "action", "detail"}]
+
+Answers that are not valid JSON fall back to the markdown parser in
+utils.py, so older sessions and off-format replies still load.
+"""
+
+import json
+import logging
+import re
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple, Type
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmResponse
+from google.genai import types
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
+
+from .triage import SPECIALTY_NAMES
+from .utils import parse_assessment, parse_medication_recommendation
+
+
+logger = logging.getLogger(__name__)
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+
+class MedicationRecommendation(BaseModel):
+    """One medication decision of a specialist."""
+
+    model_config = ConfigDict(extra="ignore")
+
+    medication: str
+    action: str = Field("", description="Continue / Hold / Adjust / Start / Stop")
+    detail: str = Field("", description="Dose, timing, restart criteria or reason")
+
+
+class SpecialistAssessment(BaseModel):
+    """Fields shared by every specialty."""
+
+    model_config = ConfigDict(extra="ignore")
+
+    key_findings: List[str] = []
+    medications: List[MedicationRecommendation] = []
+    risks: List[str] = []
+    actions: List[str] = []
+    guideline_refs: List[str] = []
+    # Free text kept when a reply could not be parsed into the fields above
+    notes: str = ""
+
+    @field_validator("key_findings", "risks", "actions", "guideline_refs", mode="before")
+    @classmethod
+    def _as_text_list(cls, value: Any) -> Any:
+        # Accept a single string where a list of strings is expected
+        if isinstance(value, str):
+            return [value] if value.strip() else []
+        if isinstance(value, list):
+            return [str(item) for item in value if item not in (None, "")]
+        return value
+
+    @field_validator("medications", mode="before")
+    @classmethod
+    def _parse_medication_strings(cls, value: Any) -> Any:
+        # Models sometimes keep the old "Med: Action — reason" bullet style
+        if not isinstance(value, list):
+            return value
+        items = []
+        for item in value:
+            if isinstance(item, str):
+                name, action, detail = parse_medication_recommendation(item)
+                item = {"medication": name, "action": action, "detail": detail}
+            items.append(item)
+        return items
+
+    @classmethod
+    def classification_fields(cls) -> Dict[str, str]:
+        """Return classification field name -> display label."""
+        return {
+            name: field.title or name
+            for name, field in cls.model_fields.items()
+            if name not in SpecialistAssessment.model_fields
+        }
+
+    def classification(self) -> Dict[str, str]:
+        """Return display label -> value of the classification fields."""
+        return {label: getattr(self, name) for name, label in self.classification_fields().items()}
+
+
+class CardiologyAssessment(SpecialistAssessment):
+    hf_classification: str = Field("EF not provided", title="HF Classification")
+    gdmt_status: str = Field("Not specified", title="Current GDMT Status")
+    periop_cardiac_risk: str = Field("Not applicable", title="Peri-op Cardiac Risk")
+
+
+class NephrologyAssessment(SpecialistAssessment):
+    ckd_stage: str = Field("eGFR not provided", title="CKD Stage")
+    aki_risk: str = Field("Not specified", title="AKI Risk")
+    dialysis_risk: str = Field("Not specified", title="Dialysis Risk")
+
+
+class EndocrinologyAssessment(SpecialistAssessment):
+    diabetes_type: str = Field("Not specified", title="Diabetes Type")
+    glycemic_control: str = Field("HbA1c not provided", title="Glycemic Control")
+    hypoglycemia_risk: str = Field("Not specified", title="Hypoglycemia Risk")
+    periop_glucose_management: str = Field("Not applicable", title="Peri-op Glucose Management")
+
+
+# Schema of each specialist agent's answer
+ASSESSMENT_SCHEMAS: Dict[str, Type[SpecialistAssessment]] = {
+    "cardiologist": CardiologyAssessment,
+    "nephrologist": NephrologyAssessment,
+    "diabetologist": EndocrinologyAssessment,
+}
+
+# Markdown section headings of the old free-form format -> schema list field
+_MARKDOWN_SECTIONS = {
+    "Key Findings": "key_findings",
+    "Medication Recommendations": "medications",
+    "Risks": "risks",
+    "Nephrotoxin Alerts": "risks",
+    "Priority Actions": "actions",
+    "Kidney Protection": "actions",
+    "Cardiorenal Benefits to Optimize": "actions",
+    "Guideline References": "guideline_refs",
+    "Guidelines Referenced": "guideline_refs",
+}
+
+
+def _from_markdown(schema: Type[SpecialistAssessment], text: str) -> SpecialistAssessment:
+    parsed = parse_assessment(text)
+    labels = {label.lower(): name for name, label in schema.classification_fields().items()}
+    data: Dict[str, Any] = {}
+    for label, value in parsed["fields"].items():
+        if label.lower() in labels:
+            data[labels[label.lower()]] = value
+        elif _MARKDOWN_SECTIONS.get(label) == "guideline_refs":
+            data.setdefault("guideline_refs", []).append(value)
+    for label, items in parsed["sections"].items():
+        field = _MARKDOWN_SECTIONS.get(label)
+        if field:
+            data.setdefault(field, []).extend(items)
+    if not data:
+        data["notes"] = text.strip()
+    return schema.model_validate(data)
+
+
+def parse_specialist_output(agent_name: str, text: str) -> SpecialistAssessment:
+    """Parse a specialist's answer into its typed assessment.
+
+    Args:
+        agent_name: Specialist agent name (key of ASSESSMENT_SCHEMAS)
+        text: JSON object (optionally inside a code fence) or legacy markdown
+
+    Returns:
+        Validated assessment; unparseable text ends up in 'notes'
+    """
+    schema = ASSESSMENT_SCHEMAS[agent_name]
+    match = _JSON_OBJECT.search(text or "")
+    if match:
+        try:
+            return schema.model_validate(json.loads(match.group(0)))
+        except (ValueError, ValidationError) as exc:
+            logger.warning("%s returned an invalid assessment, falling back to text: %s", agent_name, exc)
+    return _from_markdown(schema, text or "")
+
+
+def load_assessments(
+    state: Mapping[str, Any],
+    output_keys: Mapping[str, str],
+    skipped: Optional[Mapping[str, str]] = None,
+) -> Dict[str, SpecialistAssessment]:
+    """Load the consulted specialists' assessments from session state.
+
+    Args:
+        state: Session state
+        output_keys: Agent name -> state key of its output
+        skipped: Agents skipped by triage (their "not consulted" note is ignored)
+
+    Returns:
+        Agent name -> assessment, in output_keys order
+    """
+    assessments = {}
+    for agent_name, key in output_keys.items():
+        text = state.get(key)
+        if text and agent_name not in (skipped or {}):
+            assessments[agent_name] = parse_specialist_output(agent_name, text)
+    return assessments
+
+
+def create_assessment_validator(agent_name: str) -> Callable[[CallbackContext, LlmResponse], Optional[LlmResponse]]:
+    """Create an after_model_callback that validates a specialist's answer.
+
+    The final text answer is replaced in place by the normalised JSON, so
+    the result cache (registered after this callback) and the output_key
+    both store the validated object. Tool calls and partial chunks pass
+    through untouched.
+    """
+
+    def validate_assessment(callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+        content = llm_response.content
+        if llm_response.partial or not content or not content.parts:
+            return None
+        if any(part.function_call for part in content.parts):
+            return None
+        text = "".join(part.text or "" for part in content.parts if not part.thought)
+        if not text.strip():
+            return None
+        assessment = parse_specialist_output(agent_name, text)
+        llm_response.content = types.Content(role="model", parts=[types.Part(text=assessment.model_dump_json())])
+        return None
+
+    return validate_assessment
+
+
+def group_medications(assessments: Mapping[str, SpecialistAssessment]) -> Dict[str, Dict[str, Any]]:
+    """Group the specialists' medication recommendations by drug.
+
+    Returns:
+        Normalised drug name -> {'name': str, 'votes': [(specialty, action, detail), ...]}
+    """
+    grouped: Dict[str, Dict[str, Any]] = {}
+    for agent_name, assessment in assessments.items():
+        specialty = SPECIALTY_NAMES.get(agent_name, agent_name)
+        for item in assessment.medications:
+            key = item.medication.split("(")[0].strip().lower()
+            if not key or not item.action:
+                continue
+            entry = grouped.setdefault(key, {"name": item.medication, "votes": []})
+            entry["votes"].append((specialty, item.action, item.detail))
+    return grouped
+
+
+def _dedupe(items: List[Tuple[str, str]], tagged: bool = False) -> List[str]:
+    """Collapse identical items (case/whitespace-insensitive), optionally listing their sources."""
+    merged: Dict[str, List[str]] = {}
+    texts: Dict[str, str] = {}
+    for source, text in items:
+        key = " ".join(text.lower().split()).rstrip(".")
+        texts.setdefault(key, text)
+        if source not in merged.setdefault(key, []):
+            merged[key].append(source)
+    if not tagged:
+        return list(texts.values())
+    return [f"{texts[key]} ({', '.join(sources)})" for key, sources in merged.items()]
+
+
+def merge_assessments(
+    assessments: Mapping[str, SpecialistAssessment],
+    skipped: Optional[Mapping[str, str]] = None,
+) -> str:
+    """Render the compact merged specialist view sent to the mediator.
+
+    Medication recommendations are grouped per drug: identical advice is
+    written once with all specialties that gave it, differing advice is
+    written on one line so conflicts are obvious.
+
+    Args:
+        assessments: Agent name -> assessment of the consulted specialists
+        skipped: Agent name -> reason for specialties skipped by triage
+
+    Returns:
+        Markdown-light text block
+    """
+    lines = ["## Specialist Assessments (merged)"]
+    for agent_name, specialty in SPECIALTY_NAMES.items():
+        if agent_name in (skipped or {}):
+            lines.append(f"- {specialty}: **NOT CONSULTED** — {skipped[agent_name]}")
+        elif agent_name in assessments:
+            assessment = assessments[agent_name]
+            values = "; ".join(f"{label} {value}" for label, value in assessment.classification().items())
+            lines.append(f"- {specialty}: {values}")
+            if assessment.notes:
+                lines.append(f"  Notes: {assessment.notes}")
+        else:
+            lines.append(f"- {specialty}: (no assessment available)")
+
+    medications = []
+    for entry in group_medications(assessments).values():
+        advice: Dict[str, List[str]] = {}
+        for specialty, action, detail in entry["votes"]:
+            text = f"{action} — {detail}" if detail else action
+            advice.setdefault(text, []).append(specialty)
+        views = "; ".join(f"{text} ({', '.join(specialties)})" for text, specialties in advice.items())
+        marker = " **CONFLICT**" if len({text.split(" — ")[0].lower() for text in advice}) > 1 else ""
+        medications.append(f"{entry['name']}: {views}{marker}")
+
+    def collect(field: str, tagged: bool = False) -> List[str]:
+        items = [(SPECIALTY_NAMES[name], text) for name, a in assessments.items() for text in getattr(a, field)]
+        return _dedupe(items, tagged)
+
+    # Only actions keep their specialties: the mediator uses them as owners in Next Steps
+    sections = {
+        "Medications": medications,
+        "Key findings": collect("key_findings"),
+        "Risks": collect("risks"),
+        "Priority actions": collect("actions", tagged=True),
+        "Guidelines": collect("guideline_refs"),
+    }
+    for title, items in sections.items():
+        if items:
+            lines.append(f"\n### {title}")
+            lines.extend(f"- {item}" for item in items)
+    return "\n".join(lines)
+
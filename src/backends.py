@@ -0,0 +1,256 @@
+"""Ollama backend pool: load balancing, health probes and failover.
+
+By default every agent sends its requests to the single OLLAMA_API_BASE.
+With several Ollama hosts listed in CKM_OLLAMA_BACKENDS, each request of
+the model registry picks a backend instead:
+1. Only healthy backends that have the model pulled are candidates
+2. Backends with a free slot come before saturated ones
+3. Among those, the backend with the fewest outstanding requests (in
+   flight or queued in its scheduler) wins, so the three parallel
+   specialists land on separate hosts when several are idle. A backend
+   without the model loaded (``/api/ps``) counts one extra outstanding
+   request, so a warm backend wins ties instead of paying a cold load
+
+A background thread probes every backend with the same ``GET /api/tags``
+check as verify_setup.py (plus ``/api/ps`` for the loaded models). A
+backend that fails a probe, or a call with a connection or server error,
+is ejected until a later probe succeeds, and the failed call is retried
+on another backend (only before any output was streamed).
+
+Agents pinned to one endpoint with CKM_<ROLE>_API_BASE (see models.py)
+bypass the pool.
+
+Configuration (environment variables):
+- CKM_OLLAMA_BACKENDS: comma-separated Ollama URLs (default: OLLAMA_API_BASE only)
+- CKM_BACKEND_PROBE_SECONDS: health probe interval (default 15)
+- CKM_BACKEND_PROBE_TIMEOUT_SECONDS: probe request timeout (default 5)
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from .models import resolve_api_base
+
+
+logger = logging.getLogger(__name__)
+
+
+def ollama_model_name(model: str) -> str:
+    """Return the Ollama model name of a LiteLLM model id ("ollama_chat/qwen2.5:14b" -> "qwen2.5:14b")."""
+    name = str(model).split("/", 1)[1] if "/" in str(model) else str(model)
+    return name if ":" in name else f"{name}:latest"
+
+
+def check_backend(api_base: str, timeout: float = 5.0) -> Tuple[bool, Any]:
+    """Probe an Ollama server like verify_setup.py: GET /api/tags.
+
+    Returns:
+        (True, list of pulled model names) or (False, error text)
+    """
+    import requests
+
+    try:
+        response = requests.get(f"{api_base}/api/tags", timeout=timeout)
+        if response.status_code == 200:
+            return True, [m.get("name", "") for m in response.json().get("models", [])]
+        return False, f"HTTP {response.status_code}"
+    except Exception as exc:
+        return False, str(exc)
+
+
+def loaded_models(api_base: str, timeout: float = 5.0) -> Optional[List[str]]:
+    """Return the models an Ollama server has in memory (GET /api/ps), or None if unknown."""
+    import requests
+
+    try:
+        response = requests.get(f"{api_base}/api/ps", timeout=timeout)
+        if response.status_code == 200:
+            return [m.get("name") or m.get("model", "") for m in response.json().get("models", [])]
+    except Exception:
+        pass
+    return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed call may succeed on another backend (connection or server error)."""
+    import httpx
+    import litellm
+
+    return isinstance(
+        error,
+        (
+            httpx.TransportError,
+            litellm.APIConnectionError,
+            litellm.ServiceUnavailableError,
+            litellm.InternalServerError,
+            litellm.BadGatewayError,
+        ),
+    )
+
+
+class Backend:
+    """State of one Ollama server as seen by the pool."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        # None until the first successful probe (every model is assumed pulled)
+        self.available: Optional[Set[str]] = None
+        self.loaded: Set[str] = set()
+        self.probed_at: Optional[float] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "loaded": sorted(self.loaded),
+            "probed_at": self.probed_at,
+        }
+
+
+class BackendPool:
+    """Least-outstanding-requests pool of Ollama backends with health probes.
+
+    Backends come from CKM_OLLAMA_BACKENDS (read on every selection, so a
+    change applies without rebuilding the agents). Probing starts with the
+    first selection when more than one backend is configured.
+    """
+
+    def __init__(
+        self,
+        urls: Optional[Iterable[str]] = None,
+        probe_interval: float = 15.0,
+        probe_timeout: float = 5.0,
+        slots: int = 4,
+    ):
+        self.urls = [url.rstrip("/") for url in urls] if urls else None
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.slots = slots
+        self._backends: Dict[str, Backend] = {}
+        self._lock = threading.Lock()
+        self._prober: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls) -> "BackendPool":
+        """Build a pool configured from CKM_BACKEND_* environment variables."""
+        return cls(
+            probe_interval=float(os.getenv("CKM_BACKEND_PROBE_SECONDS", "15")),
+            probe_timeout=float(os.getenv("CKM_BACKEND_PROBE_TIMEOUT_SECONDS", "5")),
+            # Same per-backend concurrency as the scheduler
+            slots=int(os.getenv("CKM_SCHEDULER_CONCURRENCY") or os.getenv("OLLAMA_NUM_PARALLEL") or "4"),
+        )
+
+    def backend_urls(self) -> List[str]:
+        """Return the configured backend URLs."""
+        if self.urls:
+            return list(self.urls)
+        configured = os.getenv("CKM_OLLAMA_BACKENDS", "")
+        urls = [url.strip().rstrip("/") for url in configured.split(",") if url.strip()]
+        return urls or [resolve_api_base()]
+
+    def _current(self) -> List[Backend]:
+        backends = []
+        for url in self.backend_urls():
+            backend = self._backends.get(url)
+            if backend is None:
+                backend = self._backends[url] = Backend(url)
+            backends.append(backend)
+        return backends
+
+    def select(self, model: str, exclude: Iterable[str] = ()) -> Backend:
+        """Pick the backend for a request and count it as outstanding there.
+
+        Args:
+            model: LiteLLM model id of the request
+            exclude: URLs already tried for this request
+
+        Raises:
+            RuntimeError: Every backend was already tried
+        """
+        name = ollama_model_name(model)
+        excluded = set(exclude)
+        with self._lock:
+            backends = [backend for backend in self._current() if backend.url not in excluded]
+            if not backends:
+                raise RuntimeError("No Ollama backend left to try")
+            if len(self._backends) > 1:
+                self._start_probing()
+            healthy = [b for b in backends if b.healthy] or backends
+            candidates = [b for b in healthy if b.available is None or name in b.available] or healthy
+            backend = min(
+                candidates,
+                key=lambda b: (b.outstanding >= self.slots, b.outstanding + (name not in b.loaded), b.requests),
+            )
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def release(self, backend: Backend, model: str, error: Optional[BaseException] = None) -> None:
+        """Record the end of a request; a connection or server error ejects the backend."""
+        with self._lock:
+            backend.outstanding = max(0, backend.outstanding - 1)
+            if error is None:
+                backend.failures = 0
+                backend.loaded.add(ollama_model_name(model))
+            elif is_retryable(error):
+                backend.failures += 1
+                backend.healthy = False
+                backend.last_error = str(error)[:200]
+                logger.warning("Ollama backend %s ejected after a failed call: %s", backend.url, backend.last_error)
+
+    def probe(self) -> None:
+        """Probe every backend once and update health and model lists."""
+        with self._lock:
+            backends = list(self._current())
+        for backend in backends:
+            ok, result = check_backend(backend.url, self.probe_timeout)
+            loaded = loaded_models(backend.url, self.probe_timeout) if ok else None
+            with self._lock:
+                backend.probed_at = time.time()
+                if ok:
+                    if not backend.healthy:
+                        logger.info("Ollama backend %s is healthy again", backend.url)
+                    backend.healthy, backend.available = True, set(result)
+                    if loaded is not None:
+                        backend.loaded = set(loaded)
+                else:
+                    if backend.healthy:
+                        logger.warning("Ollama backend %s failed its health probe: %s", backend.url, result)
+                    backend.healthy, backend.last_error = False, str(result)[:200]
+
+    def _start_probing(self) -> None:
+        if self._prober is not None and self._prober.is_alive():
+            return
+        self._stop.clear()
+        self._prober = threading.Thread(target=self._probe_loop, name="ckm-backend-probe", daemon=True)
+        self._prober.start()
+
+    def _probe_loop(self) -> None:
+        while not self._stop.is_set():
+            self.probe()
+            self._stop.wait(self.probe_interval)
+
+    def stop(self) -> None:
+        """Stop the probe thread."""
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return health, outstanding requests and loaded models per backend."""
+        with self._lock:
+            return {url: backend.stats() for url, backend in self._backends.items()}
+
+
+# Shared pool used by every registry model
+backend_pool = BackendPool.from_env()
@@ -0,0 +1,198 @@
+"""Headless batch consultation runner.
+
+Runs cases from a JSONL file straight through ``ckm_panel`` (skipping the
+intake dialogue) for nightly pre-op clinic lists:
+1. Each input line is a case (JSON case object, or {"id": ..., "case": "free text"})
+2. Up to N cases run at a time under a concurrency limit
+3. Each result (snapshot + typed specialist assessments + wall time) is appended
+   to the output JSONL as soon as that case finishes
+4. Re-running with the same output file skips cases already completed
+
+Usage:
+    python -m src.batch cases.jsonl results.jsonl --concurrency 3
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from .agent import ckm_panel
+from .assessments import load_assessments
+from .case_parser import parse_case
+from .intake_agent import CASE_KEY
+from .mediator import SNAPSHOT_OUTPUT_KEY
+from .metrics import CONSULT_METRICS_KEY
+from .periop_rules import PERIOP_PLAN_KEY
+from .specialists import SPECIALIST_OUTPUT_KEYS
+from .triage import TRIAGE_KEY
+
+
+APP_NAME = "ckm_batch"
+USER_ID = "batch"
+
+
+def read_cases(path: str) -> Iterator[Tuple[str, Dict[str, Any], str]]:
+    """Yield (case_id, parsed case, case text) for each line of a JSONL file.
+
+    Args:
+        path: Input JSONL path
+
+    Returns:
+        Iterator over cases; the id comes from "id"/"case_id" or the line number
+    """
+    with open(path, encoding="utf-8") as handle:
+        for line_number, line in enumerate(handle, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            case_id = str(record.pop("id", None) or record.pop("case_id", None) or line_number)
+            record.pop("case_id", None)
+            raw = record.get("case", record)
+            text = raw if isinstance(raw, str) else json.dumps(raw, ensure_ascii=False)
+            case, _ = parse_case(text)
+            yield case_id, case, text
+
+
+def completed_case_ids(path: str) -> set[str]:
+    """Return the ids of cases already completed successfully in an output file."""
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a truncated last line
+                continue
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+async def run_case(
+    runner: Runner, case_id: str, case: Dict[str, Any], text: str
+) -> Dict[str, Any]:
+    """Run one case through the panel and collect its outputs.
+
+    The parsed case is put in session state and the submitted text is sent
+    as the only user turn; the panel compiles its context from both.
+
+    Returns:
+        Result record with status, wall time, snapshot and specialist outputs
+    """
+    started = time.perf_counter()
+    session = await runner.session_service.create_session(
+        app_name=APP_NAME,
+        user_id=USER_ID,
+        session_id=f"{case_id}-{uuid.uuid4().hex[:8]}",
+        state={CASE_KEY: case},
+    )
+    message = types.Content(role="user", parts=[types.Part(text=text)])
+    try:
+        async for _ in runner.run_async(user_id=USER_ID, session_id=session.id, new_message=message):
+            pass
+    except Exception as exc:  # one failing case must not stop the batch
+        return {
+            "id": case_id,
+            "status": "error",
+            "error": f"{type(exc).__name__}: {exc}",
+            "elapsed_seconds": round(time.perf_counter() - started, 3),
+        }
+    session = await runner.session_service.get_session(
+        app_name=APP_NAME, user_id=USER_ID, session_id=session.id
+    )
+    await runner.session_service.delete_session(
+        app_name=APP_NAME, user_id=USER_ID, session_id=session.id
+    )
+    return {
+        "id": case_id,
+        "status": "ok",
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+        "snapshot": session.state.get(SNAPSHOT_OUTPUT_KEY),
+        "specialists": {
+            name: assessment.model_dump()
+            for name, assessment in load_assessments(session.state, SPECIALIST_OUTPUT_KEYS).items()
+        },
+        "periop_medication_plan": (
+            session.state.get(PERIOP_PLAN_KEY) if (session.state.get(CASE_KEY) or {}).get("periop") else None
+        ),
+        "triage": session.state.get(TRIAGE_KEY),
+        "latency": session.state.get(CONSULT_METRICS_KEY),
+    }
+
+
+async def run_batch(
+    input_path: str,
+    output_path: str,
+    concurrency: int = 2,
+    runner: Optional[Runner] = None,
+) -> Dict[str, Any]:
+    """Run every pending case of a JSONL file and stream results to a JSONL file.
+
+    Args:
+        input_path: Cases JSONL
+        output_path: Results JSONL (appended to; completed ids are skipped)
+        concurrency: Maximum number of cases in flight
+        runner: Runner to use (defaults to ckm_panel with in-memory sessions)
+
+    Returns:
+        Summary with counts and per-case wall time statistics
+    """
+    runner = runner or Runner(
+        agent=ckm_panel, app_name=APP_NAME, session_service=InMemorySessionService()
+    )
+    done = completed_case_ids(output_path)
+    pending = [case for case in read_cases(input_path) if case[0] not in done]
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded(case_id: str, case: Dict[str, Any], text: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await run_case(runner, case_id, case, text)
+
+    timings, failures = [], 0
+    with open(output_path, "a", encoding="utf-8") as output:
+        for finished in asyncio.as_completed([bounded(*case) for case in pending]):
+            result = await finished
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+            timings.append(result["elapsed_seconds"])
+            failures += result["status"] != "ok"
+            print(f"[{result['status']}] {result['id']} {result['elapsed_seconds']:.1f}s", file=sys.stderr)
+
+    timings.sort()
+    return {
+        "skipped": len(done),
+        "completed": len(timings) - failures,
+        "failed": failures,
+        "wall_seconds": {
+            "min": timings[0] if timings else None,
+            "median": timings[len(timings) // 2] if timings else None,
+            "max": timings[-1] if timings else None,
+            "total": round(sum(timings), 3),
+        },
+    }
+
+
+def main() -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Run CKM consultations for a JSONL case file.")
+    parser.add_argument("input", help="Cases JSONL (one case per line)")
+    parser.add_argument("output", help="Results JSONL (resumes if it already exists)")
+    parser.add_argument("--concurrency", type=int, default=2, help="Cases in flight at once (default: 2)")
+    args = parser.parse_args()
+    summary = asyncio.run(run_batch(args.input, args.output, concurrency=args.concurrency))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""Content-addressed result cache for the specialist panel.
+
+All panel agents run with ``temperature=0, seed=0``, so the same compiled
+case sent through ``ckm_panel`` yields the same assessments. This module
+caches each agent's model response keyed on a hash of:
+1. The normalised request contents (the case summary the agent sees)
+2. The agent's instruction text
+3. The model name and sampling parameters
+4. The names of the tools declared to the model (peri-op tools are only
+   declared for peri-op cases, see prompts.drop_periop_tools)
+
+Because the instruction text is part of the key, editing a prompt in
+specialists.py or mediator.py automatically stops matching old entries,
+which then age out through TTL and size-based eviction.
+
+Two tiers are used:
+- In-memory LRU (always on)
+- On-disk SQLite (optional, enabled by setting CKM_CACHE_DB)
+
+Configuration (environment variables):
+- CKM_CACHE_DISABLED: set to "1" to bypass the cache
+- CKM_CACHE_DB: path of the SQLite file for the on-disk tier
+- CKM_CACHE_TTL_SECONDS: entry lifetime (default 86400)
+- CKM_CACHE_MAX_ENTRIES: in-memory entries (default 256)
+- CKM_CACHE_MAX_DISK_ENTRIES: on-disk entries (default 4096)
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.models.lite_llm import LiteLlm
+from google.genai import types
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Request config fields that change the sampled output
+_SAMPLING_FIELDS = ("temperature", "top_p", "top_k", "seed", "max_output_tokens")
+
+# Model arguments that do not change the output (endpoint, model residency)
+_TRANSPORT_ARGS = ("api_base", "keep_alive")
+
+
+def normalize_contents(contents: list[types.Content]) -> str:
+    """Render request contents as a canonical string for hashing.
+
+    Text is whitespace-collapsed so cosmetic differences (trailing spaces,
+    blank lines after a page reload) still hit the same entry.
+    """
+    lines = []
+    for content in contents:
+        for part in content.parts or []:
+            if part.text:
+                lines.append(f"{content.role}: {_WHITESPACE.sub(' ', part.text).strip()}")
+            elif part.function_call:
+                lines.append(f"{content.role}: call {part.function_call.model_dump_json(exclude_none=True)}")
+            elif part.function_response:
+                lines.append(f"{content.role}: result {part.function_response.model_dump_json(exclude_none=True)}")
+    return "\n".join(lines)
+
+
+def tool_names(config: Optional[types.GenerateContentConfig]) -> List[str]:
+    """Return the sorted function-declaration names of a request's tools."""
+    names = []
+    for tool in (config.tools if config is not None else None) or []:
+        for declaration in getattr(tool, "function_declarations", None) or []:
+            names.append(declaration.name)
+    return sorted(names)
+
+
+def make_cache_key(
+    case_text: str,
+    instruction: str,
+    model_name: str,
+    sampling: Dict[str, Any],
+    tools: Iterable[str] = (),
+) -> str:
+    """Hash the inputs that fully determine a deterministic model response.
+
+    Args:
+        case_text: Normalised request contents
+        instruction: Agent instruction (system prompt) text
+        model_name: Model identifier, e.g. "ollama_chat/qwen2.5:14b"
+        sampling: Sampling parameters (temperature, seed, ...)
+        tools: Names of the tools declared to the model (order is ignored)
+
+    Returns:
+        Hex SHA-256 digest
+
+    >>> key = make_cache_key("case", "prompt", "ollama_chat/qwen2.5:14b", {"seed": 0}, ["periop_medication_plan"])
+    >>> key == make_cache_key("case", "prompt", "ollama_chat/qwen2.5:14b", {"seed": 0})
+    False
+    """
+    payload = json.dumps(
+        [case_text, instruction, model_name, sampling, sorted(tools)],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Two-tier (memory LRU + optional SQLite) cache of agent responses.
+
+    Entries are namespaced by agent name; hit/miss counters are kept per
+    agent and reported by stats().
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl_seconds: Optional[float] = 86400,
+        db_path: Optional[str] = None,
+        max_disk_entries: int = 4096,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " agent TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " created_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (agent, key))"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)"
+            )
+            self._db.commit()
+            self.purge_expired()
+
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        """Build a cache configured from CKM_CACHE_* environment variables."""
+        ttl = float(os.getenv("CKM_CACHE_TTL_SECONDS", "86400"))
+        return cls(
+            max_entries=int(os.getenv("CKM_CACHE_MAX_ENTRIES", "256")),
+            ttl_seconds=ttl if ttl > 0 else None,
+            db_path=os.getenv("CKM_CACHE_DB") or None,
+            max_disk_entries=int(os.getenv("CKM_CACHE_MAX_DISK_ENTRIES", "4096")),
+        )
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def get(self, agent_name: str, key: str) -> Optional[str]:
+        """Return the cached value for an agent's key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get((agent_name, key))
+            if entry is not None and self._expired(entry[1], now):
+                del self._memory[(agent_name, key)]
+                entry = None
+            if entry is not None:
+                self._memory.move_to_end((agent_name, key))
+                value = entry[0]
+            else:
+                value = self._get_from_disk(agent_name, key, now)
+            counters = self._hits if value is not None else self._misses
+            counters[agent_name] = counters.get(agent_name, 0) + 1
+            return value
+
+    def _get_from_disk(self, agent_name: str, key: str, now: float) -> Optional[str]:
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT value, created_at FROM results WHERE agent = ? AND key = ?",
+            (agent_name, key),
+        ).fetchone()
+        if row is None:
+            return None
+        value, created_at = row
+        if self._expired(created_at, now):
+            self._db.execute("DELETE FROM results WHERE agent = ? AND key = ?", (agent_name, key))
+            self._db.commit()
+            return None
+        self._db.execute(
+            "UPDATE results SET accessed_at = ? WHERE agent = ? AND key = ?",
+            (now, agent_name, key),
+        )
+        self._db.commit()
+        self._put_in_memory(agent_name, key, value, created_at)
+        return value
+
+    def _put_in_memory(self, agent_name: str, key: str, value: str, created_at: float) -> None:
+        self._memory[(agent_name, key)] = (value, created_at)
+        self._memory.move_to_end((agent_name, key))
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def set(self, agent_name: str, key: str, value: str) -> None:
+        """Store a value in both tiers, evicting the least recently used entries."""
+        now = time.time()
+        with self._lock:
+            self._put_in_memory(agent_name, key, value, now)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (agent, key, value, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (agent_name, key, value, now, now),
+            )
+            self._db.execute(
+                "DELETE FROM results WHERE rowid IN ("
+                " SELECT rowid FROM results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,),
+            )
+            self._db.commit()
+
+    def purge_expired(self) -> None:
+        """Drop expired entries from both tiers."""
+        if self.ttl_seconds is None:
+            return
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            for cache_key in [k for k, (_, created) in self._memory.items() if created < cutoff]:
+                del self._memory[cache_key]
+            if self._db is not None:
+                self._db.execute("DELETE FROM results WHERE created_at < ?", (cutoff,))
+                self._db.commit()
+
+    def clear(self) -> None:
+        """Remove every entry and reset the counters."""
+        with self._lock:
+            self._memory.clear()
+            self._hits.clear()
+            self._misses.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters per agent and in total."""
+        with self._lock:
+            agents = sorted(set(self._hits) | set(self._misses))
+            return {
+                "hits": sum(self._hits.values()),
+                "misses": sum(self._misses.values()),
+                "memory_entries": len(self._memory),
+                "agents": {
+                    name: {"hits": self._hits.get(name, 0), "misses": self._misses.get(name, 0)}
+                    for name in agents
+                },
+            }
+
+
+# Shared cache used by the panel agents
+result_cache = ResultCache.from_env()
+
+
+def create_cache_callbacks(
+    model: LiteLlm,
+    cache: Optional[ResultCache] = None,
+    on_hit: Iterable[Callable[[CallbackContext, LlmResponse], Optional[LlmResponse]]] = (),
+) -> Tuple[Callable[..., Optional[LlmResponse]], Callable[..., Optional[LlmResponse]]]:
+    """Create before/after model callbacks that serve and fill the cache.
+
+    Args:
+        model: The agent's model; its name and sampling arguments go into the key
+        cache: Cache to use (defaults to the shared result_cache)
+        on_hit: after_model callbacks to run on a cached response; ADK skips
+            the agent's after_model callbacks when before_model answers
+
+    Returns:
+        (before_model_callback, after_model_callback) pair for an Agent
+    """
+    # LiteLlm keeps the extra completion kwargs (temperature, seed, ...) privately
+    sampling = {
+        k: v for k, v in model._additional_args.items()
+        if isinstance(v, (int, float, str, bool)) and k not in _TRANSPORT_ARGS
+    }
+    pending_keys: Dict[Tuple[str, str], str] = {}
+    on_hit = list(on_hit)
+
+    def lookup(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+        target = cache or result_cache
+        if os.getenv("CKM_CACHE_DISABLED") == "1":
+            return None
+        request_sampling = dict(sampling)
+        config = llm_request.config
+        if config is not None:
+            request_sampling.update(
+                {f: getattr(config, f) for f in _SAMPLING_FIELDS if getattr(config, f, None) is not None}
+            )
+        instruction = config.system_instruction if config is not None else ""
+        key = make_cache_key(
+            normalize_contents(llm_request.contents),
+            instruction if isinstance(instruction, str) else str(instruction),
+            llm_request.model or model.model,
+            request_sampling,
+            tool_names(config),
+        )
+        cached = target.get(callback_context.agent_name, key)
+        if cached is not None:
+            response = LlmResponse(content=types.Content.model_validate_json(cached))
+            for callback in on_hit:
+                callback(callback_context, response)
+            return response
+        pending_keys[(callback_context.invocation_id, callback_context.agent_name)] = key
+        return None
+
+    def store(callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+        target = cache or result_cache
+        if llm_response.partial:
+            return None
+        key = pending_keys.pop((callback_context.invocation_id, callback_context.agent_name), None)
+        if key is None or llm_response.error_code or not llm_response.content:
+            return None
+        target.set(
+            callback_context.agent_name,
+            key,
+            llm_response.content.model_dump_json(exclude_none=True),
+        )
+        return None
+
+    return lookup, store
@@ -0,0 +1,245 @@
+"""Deterministic clinical calculators for the specialist panel.
+
+The specialists used to derive staging and dose bands themselves (CKD G/A
+stage and metformin rules from eGFR, HF phenotype from EF), and the
+mediator had to reconcile their arithmetic slips. These are computed in
+code instead:
+- eGFR from creatinine, age and sex (CKD-EPI 2021, race-free)
+- KDIGO GFR (G1–G5) and albuminuria (A1–A3) categories and risk
+- HF phenotype from EF (HFrEF ≤40%, HFmrEF 41–49%, HFpEF ≥50%)
+- Metformin and SGLT2 inhibitor eGFR rules (KDIGO 2024, FDA label)
+- BMI and its WHO class
+
+``calculate_case`` adds the results to the case object when the panel
+starts (see panel_context.py), so every agent reads them as facts in the
+compiled case. ``clinical_calculators`` exposes the same functions as an
+agent tool for values the case does not contain.
+"""
+
+import math
+from typing import Any, Dict, Optional
+
+
+# Case fields written by calculate_case (recomputed on every compile)
+CALCULATED_FIELDS = (
+    "egfr_calculated",
+    "ckd_stage",
+    "ckd_risk",
+    "hf_phenotype",
+    "metformin_rule",
+    "sglt2i_rule",
+    "bmi_class",
+)
+
+# KDIGO risk of CKD progression: GFR category -> risk for A1, A2, A3
+_KDIGO_RISK = {
+    "G1": ("low", "moderate", "high"),
+    "G2": ("low", "moderate", "high"),
+    "G3a": ("moderate", "high", "very high"),
+    "G3b": ("high", "very high", "very high"),
+    "G4": ("very high", "very high", "very high"),
+    "G5": ("very high", "very high", "very high"),
+}
+
+
+def ckd_epi_2021(creatinine: float, age: float, sex: str) -> float:
+    """Estimate GFR with the CKD-EPI 2021 creatinine equation (no race term).
+
+    Args:
+        creatinine: Serum creatinine in mg/dL
+        age: Age in years
+        sex: "M" or "F"
+
+    Returns:
+        eGFR in mL/min/1.73m², rounded to a whole number
+    """
+    female = str(sex).strip().upper().startswith("F")
+    kappa, alpha = (0.7, -0.241) if female else (0.9, -0.302)
+    ratio = creatinine / kappa
+    egfr = 142 * min(ratio, 1.0) ** alpha * max(ratio, 1.0) ** -1.200 * 0.9938 ** age
+    return float(round(egfr * (1.012 if female else 1.0)))
+
+
+def gfr_category(egfr: float) -> str:
+    """KDIGO GFR category (G1–G5) of an eGFR in mL/min/1.73m²."""
+    for threshold, category in ((90, "G1"), (60, "G2"), (45, "G3a"), (30, "G3b"), (15, "G4")):
+        if egfr >= threshold:
+            return category
+    return "G5"
+
+
+def albuminuria_category(uacr: float) -> str:
+    """KDIGO albuminuria category (A1–A3) of a UACR in mg/g."""
+    if uacr < 30:
+        return "A1"
+    return "A2" if uacr <= 300 else "A3"
+
+
+def kdigo_risk(egfr: float, uacr: float) -> str:
+    """KDIGO heat-map risk (low, moderate, high, very high) of CKD progression."""
+    return _KDIGO_RISK[gfr_category(egfr)][int(albuminuria_category(uacr)[1]) - 1]
+
+
+def hf_phenotype(ef: float) -> str:
+    """Heart failure phenotype by ejection fraction (ESC 2021 / universal definition)."""
+    if ef <= 40:
+        return "HFrEF"
+    return "HFmrEF" if ef < 50 else "HFpEF"
+
+
+def metformin_rule(egfr: float) -> str:
+    """Metformin action for an eGFR (KDIGO 2024, FDA label)."""
+    if egfr >= 45:
+        return "Continue at full dose (eGFR ≥45)"
+    if egfr >= 30:
+        return "Adjust: max 1000 mg/day, do not start (eGFR 30–44)"
+    return "Stop: contraindicated (eGFR <30)"
+
+
+def sglt2i_rule(egfr: float) -> str:
+    """SGLT2 inhibitor action for an eGFR (KDIGO 2024)."""
+    if egfr >= 20:
+        note = "; glucose lowering reduced below 45" if egfr < 45 else ""
+        return f"Start or continue for kidney/HF protection (eGFR ≥20{note})"
+    return "Do not start; continue if already on it until dialysis (eGFR <20)"
+
+
+def body_mass_index(weight_kg: float, height_cm: float) -> float:
+    """BMI in kg/m², rounded to one decimal."""
+    return round(weight_kg / (height_cm / 100) ** 2, 1)
+
+
+def bmi_class(bmi: float) -> str:
+    """WHO BMI class."""
+    if bmi < 18.5:
+        return "Underweight"
+    for limit, label in ((25, "Normal weight"), (30, "Overweight"), (35, "Obesity class I"), (40, "Obesity class II")):
+        if bmi < limit:
+            return label
+    return "Obesity class III"
+
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) and number > 0 else None
+
+
+def calculate(
+    creatinine: Optional[float] = None,
+    age: Optional[float] = None,
+    sex: Optional[str] = None,
+    egfr: Optional[float] = None,
+    uacr: Optional[float] = None,
+    ef: Optional[float] = None,
+    bmi: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Run every calculator its inputs allow.
+
+    A reported eGFR wins over the one calculated from creatinine for
+    staging and dose rules.
+
+    Returns:
+        Dict with the CALCULATED_FIELDS that could be computed
+    """
+    creatinine, age, egfr, uacr, ef, bmi = map(_number, (creatinine, age, egfr, uacr, ef, bmi))
+    results: Dict[str, Any] = {}
+    if creatinine is not None and age is not None and sex:
+        results["egfr_calculated"] = ckd_epi_2021(creatinine, age, sex)
+    if egfr is None:
+        egfr = results.get("egfr_calculated")
+    if egfr is not None:
+        results["ckd_stage"] = gfr_category(egfr) + (f" {albuminuria_category(uacr)}" if uacr is not None else "")
+        if uacr is not None:
+            results["ckd_risk"] = kdigo_risk(egfr, uacr)
+        results["metformin_rule"] = metformin_rule(egfr)
+        results["sglt2i_rule"] = sglt2i_rule(egfr)
+    if ef is not None:
+        results["hf_phenotype"] = hf_phenotype(ef)
+    if bmi is not None:
+        results["bmi_class"] = bmi_class(bmi)
+    return results
+
+
+def calculate_case(case: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace the calculated fields of a case with freshly computed ones.
+
+    Args:
+        case: Canonical case object (see case_parser.CASE_SCHEMA); updated in place
+
+    Returns:
+        The same case
+    """
+    for field in CALCULATED_FIELDS:
+        case.pop(field, None)
+    case.update(calculate(
+        creatinine=case.get("creatinine"),
+        age=case.get("age"),
+        sex=case.get("sex"),
+        egfr=case.get("egfr"),
+        uacr=case.get("uacr"),
+        ef=case.get("ef"),
+        bmi=case.get("bmi"),
+    ))
+    return case
+
+
+def format_calculations(case: Dict[str, Any]) -> Optional[str]:
+    """Render the calculated fields of a case as a markdown section, or None if there are none."""
+    lines = []
+    if "egfr_calculated" in case:
+        lines.append(f"- **eGFR (CKD-EPI 2021):** {case['egfr_calculated']:g} mL/min/1.73m²")
+    if "ckd_stage" in case:
+        risk = f" (KDIGO risk: {case['ckd_risk']})" if "ckd_risk" in case else ""
+        lines.append(f"- **CKD stage:** {case['ckd_stage']}{risk}")
+    if "hf_phenotype" in case:
+        lines.append(f"- **HF phenotype:** {case['hf_phenotype']}")
+    if "metformin_rule" in case:
+        lines.append(f"- **Metformin:** {case['metformin_rule']}")
+    if "sglt2i_rule" in case:
+        lines.append(f"- **SGLT2i:** {case['sglt2i_rule']}")
+    if "bmi_class" in case:
+        lines.append(f"- **BMI class:** {case['bmi_class']}")
+    if not lines:
+        return None
+    return "## Calculated (deterministic; use as given)\n" + "\n".join(lines)
+
+
+def clinical_calculators(
+    creatinine: Optional[float] = None,
+    age: Optional[float] = None,
+    sex: Optional[str] = None,
+    egfr: Optional[float] = None,
+    uacr: Optional[float] = None,
+    ef: Optional[float] = None,
+    bmi: Optional[float] = None,
+    weight_kg: Optional[float] = None,
+    height_cm: Optional[float] = None,
+) -> dict:
+    """Compute eGFR (CKD-EPI 2021), KDIGO stage, HF phenotype, metformin/SGLT2i eGFR rules and BMI class.
+
+    Only for values missing from the case's "Calculated" section; pass only the values you have.
+
+    Args:
+        creatinine: Serum creatinine, mg/dL.
+        age: Years.
+        sex: "M" or "F".
+        egfr: Reported eGFR, mL/min/1.73m².
+        uacr: Urine albumin-to-creatinine ratio, mg/g.
+        ef: LVEF, %.
+        bmi: kg/m².
+        weight_kg: Weight, kg (with height_cm when BMI is unknown).
+        height_cm: Height, cm.
+
+    Returns:
+        The calculated fields (and 'bmi') the inputs allow.
+    """
+    weight_kg, height_cm = _number(weight_kg), _number(height_cm)
+    if bmi is None and weight_kg is not None and height_cm is not None:
+        bmi = body_mass_index(weight_kg, height_cm)
+    results = calculate(creatinine=creatinine, age=age, sex=sex, egfr=egfr, uacr=uacr, ef=ef, bmi=bmi)
+    if bmi is not None and "bmi_class" in results:
+        results["bmi"] = float(bmi)
+    return results
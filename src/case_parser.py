@@ -0,0 +1,467 @@
+"""Deterministic case parser for paste-mode intake.
+
+Most pasted cases are either JSON from the EHR integration or
+semi-structured text ("EF 35%", "eGFR 42", "HbA1c 8.1%"). This module:
+1. Validates JSON input against CASE_SCHEMA (with common key aliases)
+2. Extracts the CKM essentials from free text with compiled regexes
+3. Renders the result as a compact, canonical case summary
+
+The intake agent only calls the model for fields the parser could not fill.
+"""
+
+import json
+import re
+from typing import Any, Dict, Optional, Tuple
+
+
+# Canonical case fields and their types
+CASE_SCHEMA = {
+    "age": int,
+    "sex": str,
+    "primary_question": str,
+    "periop": bool,
+    "procedure": str,
+    "urgency": str,
+    "contrast": bool,
+    "ef": float,
+    "nyha": str,
+    "nt_probnp": float,
+    "bnp": float,
+    "heart_rate": float,
+    "egfr": float,
+    "creatinine": float,
+    "uacr": float,
+    "hba1c": float,
+    "diabetes_type": str,
+    "bmi": float,
+    "diagnoses": list,
+    "medications": list,
+    "notes": str,
+}
+
+# Fields without which the case cannot go to the panel
+REQUIRED_FIELDS = ("age", "sex", "medications")
+
+# Fields a free-text message after a snapshot may update (measurements,
+# medications, diagnoses, demographics); the consult context (periop,
+# procedure, contrast, question) changes only through "Add details: ..."
+UPDATE_FIELDS = (
+    "age", "sex", "ef", "nyha", "nt_probnp", "bnp", "heart_rate", "egfr", "creatinine",
+    "uacr", "hba1c", "diabetes_type", "bmi", "diagnoses", "medications",
+)
+
+# Alternative JSON keys mapped to canonical fields (compared lower-case, "_" for spaces/dashes)
+FIELD_ALIASES = {
+    "age_years": "age",
+    "gender": "sex",
+    "question": "primary_question",
+    "clinical_question": "primary_question",
+    "reason": "primary_question",
+    "chief_complaint": "primary_question",
+    "perioperative": "periop",
+    "peri_op": "periop",
+    "surgery": "procedure",
+    "planned_procedure": "procedure",
+    "contrast_planned": "contrast",
+    "ejection_fraction": "ef",
+    "lvef": "ef",
+    "nyha_class": "nyha",
+    "ntprobnp": "nt_probnp",
+    "nt_pro_bnp": "nt_probnp",
+    "hr": "heart_rate",
+    "scr": "creatinine",
+    "serum_creatinine": "creatinine",
+    "a1c": "hba1c",
+    "diabetes": "diabetes_type",
+    "meds": "medications",
+    "current_medications": "medications",
+    "conditions": "diagnoses",
+    "medical_history": "diagnoses",
+    "comorbidities": "diagnoses",
+}
+
+_NUMBER = r"(\d+(?:\.\d+)?)"
+_SEP = r"\s*(?:of|:|=|is)?\s*"
+
+_PATTERNS = {
+    "ef": re.compile(r"\b(?:LV)?EF" + _SEP + _NUMBER + r"(?![\d.])|ejection fraction" + _SEP + _NUMBER, re.I),
+    "egfr": re.compile(r"\beGFR" + _SEP + _NUMBER, re.I),
+    "creatinine": re.compile(r"\bcreatinine" + _SEP + _NUMBER, re.I),
+    "uacr": re.compile(r"\bUACR" + _SEP + _NUMBER, re.I),
+    "hba1c": re.compile(r"\b(?:HbA1c|A1c)" + _SEP + _NUMBER, re.I),
+    "bmi": re.compile(r"\bBMI" + _SEP + _NUMBER, re.I),
+    "nt_probnp": re.compile(r"\bNT-?pro-?BNP" + _SEP + _NUMBER, re.I),
+    "bnp": re.compile(r"(?<![-\w])BNP" + _SEP + _NUMBER, re.I),
+    "heart_rate": re.compile(r"\b(?:HR|heart rate)" + _SEP + _NUMBER, re.I),
+}
+_NYHA = re.compile(r"\bNYHA\s*(?:class\s*)?(IV|I{1,3}|[1-4])\b", re.I)
+_AGE_SEX = re.compile(
+    r"\b(\d{1,3})\s*(?:-?\s*(?:year|yr)s?[- ]old|yo|y/o|y\.o\.)?\s*(male|female|man|woman|M|F)\b", re.I
+)
+_AGE = re.compile(r"\bage\s*:\s*(\d{1,3})", re.I)
+_SEX = re.compile(r"\b(?:sex|gender)\s*:\s*(male|female|M|F)\b", re.I)
+_DIABETES = re.compile(r"\b(?:T([12])DM|type\s*([12])\s*diabetes)\b", re.I)
+_URGENCY = re.compile(r"\b(elective|urgent|emergent|emergency)\b", re.I)
+_NEGATED_URGENCY = re.compile(r"\b(?:non|not)(?:\s+an?)?[\s-]*$", re.I)
+_PROCEDURE = re.compile(r"\b(?:procedure|surgery|operation)\s*(?:type)?\s*:\s*(.+)", re.I)
+_SCHEDULED = re.compile(r"\b(?:scheduled|planned|presenting)\s+for\s+(?:an?\s+)?([^.\n;]+)", re.I)
+_PERIOP = re.compile(
+    r"\b(surgery|surgical|operation|pre-?op(?:erative)?|peri-?op(?:erative)?|arthroplasty|procedure|anesthesia)\b", re.I
+)
+# "No surgery planned", "not scheduled for surgery", "Surgery: none planned"
+_NO_PERIOP = re.compile(
+    r"\b(?:no|not|without)\s+(?:\w+\s+){0,2}?(?:surgery|surgical|operation|procedure|peri-?op)"
+    r"|\b(?:surgery|operation|procedure|peri-?op\w*)\s*(?::\s*|\s+(?:is\s+|was\s+)?)(?:none|no|not)\b",
+    re.I,
+)
+_CONTRAST = re.compile(r"\bcontrast\b", re.I)
+_NO_CONTRAST = re.compile(r"\b(?:no|without)\s+(?:iodinated\s+)?contrast\b|contrast\s*(?:planned)?\s*:\s*no\b", re.I)
+_MEDS_HEADER = re.compile(r"^\s*(?:current\s+)?(?:medications|meds)\s*:?\s*(.*)$", re.I)
+_HISTORY_HEADER = re.compile(r"^\s*(?:medical history|past medical history|PMH|diagnoses|comorbidities)\s*:?\s*(.*)$", re.I)
+_QUESTION_HEADER = re.compile(r"^\s*(?:chief complaint|primary (?:clinical )?question|clinical question|reason for consult)\s*:?\s*(.*)$", re.I)
+_HEADER = re.compile(r"^\s*[A-Za-z][A-Za-z /&-]{1,40}:\s*$")
+_LIST_ITEM = re.compile(r"^\s*(?:[-•*]|\d+[.)])\s*(.+)$")
+# A bare medication line, e.g. "Metformin 1000mg BID" or "- Insulin glargine 20 units qHS"
+_DOSE_LINE = re.compile(
+    r"^\s*(?:[-•*]\s*)?[A-Za-z][\w/-]*(?:\s+[A-Za-z][\w/-]*){0,3}\s+\d+(?:\.\d+)?\s*(?:mg|mcg|µg|units?|IU)\b", re.I
+)
+# A sentence boundary inside a line ("… CKD 3b. Meds: …"), not inside "b.i.d."
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])(?<!\.\w\.)\s+(?=\w)")
+_JSON_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+_ADD_DETAILS = re.compile(r"^\W*add details\b\W*", re.I)
+
+
+_SEX_VALUES = {"f": "F", "female": "F", "woman": "F", "m": "M", "male": "M", "man": "M"}
+
+
+def _key(name: str) -> str:
+    normalized = re.sub(r"[\s\-]+", "_", name.strip().lower())
+    return FIELD_ALIASES.get(normalized, normalized)
+
+
+def _coerce(field: str, value: Any) -> Any:
+    """Coerce a JSON value to the schema type of a field, or raise ValueError."""
+    expected = CASE_SCHEMA[field]
+    if value is None or value == "":
+        return None
+    if expected is list:
+        if isinstance(value, str):
+            return [item.strip() for item in re.split(r"[;,\n]", value) if item.strip()]
+        return [
+            item if isinstance(item, str) else " ".join(str(v) for v in item.values() if v)
+            if isinstance(item, dict) else str(item)
+            for item in value
+        ]
+    if expected is bool:
+        if isinstance(value, str):
+            return value.strip().lower() in ("yes", "true", "y", "1")
+        return bool(value)
+    if expected in (int, float):
+        if isinstance(value, str):
+            match = re.search(_NUMBER, value)
+            if not match:
+                raise ValueError(f"{field}: expected a number, got {value!r}")
+            value = match.group(1)
+        return expected(float(value))
+    if field == "sex":
+        return _normalize_sex(str(value))
+    return str(value).strip()
+
+
+def _normalize_sex(value: str) -> Optional[str]:
+    """Return "F" or "M", or None for an unrecognised value (the field stays missing).
+
+    >>> [_normalize_sex(value) for value in ("Female", "m", "man", "unknown", "")]
+    ['F', 'M', 'M', None, None]
+    """
+    return _SEX_VALUES.get(value.strip().lower())
+
+
+def _flatten(data: Dict[str, Any], case: Dict[str, Any], errors: list[str]) -> None:
+    for name, value in data.items():
+        field = _key(name)
+        if isinstance(value, dict) and field not in CASE_SCHEMA:
+            _flatten(value, case, errors)
+        elif field in CASE_SCHEMA:
+            try:
+                coerced = _coerce(field, value)
+            except (TypeError, ValueError) as exc:
+                errors.append(str(exc))
+                continue
+            if coerced is not None:
+                case[field] = coerced
+        else:
+            case.setdefault("other", {})[name] = value
+
+
+def parse_json_case(data: Dict[str, Any]) -> Tuple[Dict[str, Any], list[str]]:
+    """Validate a JSON case against CASE_SCHEMA.
+
+    Nested objects (e.g. ``{"labs": {"egfr": 42}}``) are flattened and keys
+    are matched through FIELD_ALIASES. Unknown keys are kept under 'other'.
+
+    Args:
+        data: Decoded JSON object
+
+    Returns:
+        (case, errors) where errors lists values that failed validation
+    """
+    case: Dict[str, Any] = {}
+    errors: list[str] = []
+    _flatten(data, case, errors)
+    if "ef" in case and not 5 <= case["ef"] <= 90:
+        errors.append(f"ef: {case.pop('ef')} is outside 5–90%")
+    if case.get("procedure") and "periop" not in case:
+        case["periop"] = True
+    return case, errors
+
+
+def _first_number(pattern: re.Pattern, text: str) -> Optional[float]:
+    match = pattern.search(text)
+    if not match:
+        return None
+    return float(next(group for group in match.groups() if group is not None))
+
+
+def _match_header(line: str, header_pattern: re.Pattern) -> Optional[re.Match]:
+    """Match a header opening a line, or one with a colon after a sentence boundary."""
+    header = header_pattern.match(line.strip("-•* "))
+    if header:
+        return header
+    for boundary in _SENTENCE_BREAK.finditer(line):
+        sentence = line[boundary.end():]
+        header = header_pattern.match(sentence)
+        if header and ":" in sentence[: header.start(1)]:
+            return header
+    return None
+
+
+def _extract_section(text: str, header_pattern: re.Pattern) -> list[str]:
+    """Return the items listed under a header, inline ("Meds: a, b") or as lines below it.
+
+    >>> _extract_section("72F with CKD 3b. Meds: lisinopril, metformin. eGFR 40.", _MEDS_HEADER)
+    ['lisinopril', 'metformin']
+    """
+    lines = text.splitlines()
+    for index, line in enumerate(lines):
+        header = _match_header(line, header_pattern)
+        if not header:
+            continue
+        inline = _SENTENCE_BREAK.split(header.group(1))[0].strip().rstrip(".")
+        if inline:
+            return [item.strip() for item in re.split(r"[;,]", inline) if item.strip()]
+        items = []
+        for follower in lines[index + 1:]:
+            if not follower.strip() or _HEADER.match(follower):
+                if items:
+                    break
+                continue
+            item = _LIST_ITEM.match(follower)
+            items.append((item.group(1) if item else follower).strip())
+        return items
+    return []
+
+
+def _parse_urgency(text: str) -> Optional[str]:
+    """Return the first urgency term not negated by "non-"/"not" (e.g. "non-emergent")."""
+    for match in _URGENCY.finditer(text):
+        if not _NEGATED_URGENCY.search(text[: match.start()]):
+            return match.group(1).lower()
+    return None
+
+
+def parse_free_text_case(text: str) -> Dict[str, Any]:
+    """Extract CKM essentials from a free-text case with compiled regexes.
+
+    Args:
+        text: Pasted case text
+
+    Returns:
+        Case dict containing only the fields that were found
+
+    Urgency is parsed in any answer, not only next to the procedure, and
+    negated terms are skipped:
+
+    >>> parse_free_text_case("Hip replacement, emergent, about 2 hours")["urgency"]
+    'emergent'
+    >>> parse_free_text_case("Pre-op for non-emergent knee surgery").get("urgency") is None
+    True
+    >>> parse_free_text_case("Not an emergency; elective knee surgery")["urgency"]
+    'elective'
+
+    Negated surgery is not peri-operative:
+
+    >>> [parse_free_text_case(text).get("periop") for text in (
+    ...     "72F, eGFR 40. No surgery planned.", "Not scheduled for surgery", "Surgery: none planned", "Pre-op for knee surgery")]
+    [False, False, False, True]
+
+    Contrast is only set when it is mentioned:
+
+    >>> [parse_free_text_case(text).get("ef") for text in ("EF 35", "ejection fraction of 35", "LVEF: 30 %")]
+    [35.0, 35.0, 30.0]
+    >>> [parse_free_text_case(text).get("contrast") for text in ("Knee surgery", "CT with contrast before surgery", "Surgery, no contrast")]
+    [None, True, False]
+    """
+    case: Dict[str, Any] = {}
+    for field, pattern in _PATTERNS.items():
+        value = _first_number(pattern, text)
+        if value is not None:
+            case[field] = value
+
+    age_sex = _AGE_SEX.search(text)
+    age, sex = _AGE.search(text), _SEX.search(text)
+    if age_sex:
+        case["age"] = int(age_sex.group(1))
+        if _normalize_sex(age_sex.group(2)):
+            case["sex"] = _normalize_sex(age_sex.group(2))
+    if age:
+        case["age"] = int(age.group(1))
+    if sex and _normalize_sex(sex.group(1)):
+        case["sex"] = _normalize_sex(sex.group(1))
+
+    nyha = _NYHA.search(text)
+    if nyha:
+        case["nyha"] = {"1": "I", "2": "II", "3": "III", "4": "IV"}.get(nyha.group(1), nyha.group(1).upper())
+    diabetes = _DIABETES.search(text)
+    if diabetes:
+        case["diabetes_type"] = f"T{diabetes.group(1) or diabetes.group(2)}DM"
+
+    if _PERIOP.search(text) and not _NO_PERIOP.search(text):
+        case["periop"] = True
+        procedure = _PROCEDURE.search(text) or _SCHEDULED.search(text)
+        if procedure:
+            case["procedure"] = procedure.group(1).strip()
+        if _CONTRAST.search(text):
+            case["contrast"] = not _NO_CONTRAST.search(text)
+    elif _NO_PERIOP.search(text):
+        case["periop"] = False
+    urgency = _parse_urgency(text)
+    if urgency:
+        case["urgency"] = urgency
+
+    for field, header_pattern in (
+        ("medications", _MEDS_HEADER),
+        ("diagnoses", _HISTORY_HEADER),
+        ("primary_question", _QUESTION_HEADER),
+    ):
+        items = _extract_section(text, header_pattern)
+        if items:
+            case[field] = items if CASE_SCHEMA[field] is list else ", ".join(items)
+    if "medications" not in case:
+        # Guided-intake answers often list medications without a header
+        dose_lines = [line.strip(" -•*") for line in text.splitlines() if _DOSE_LINE.match(line)]
+        if dose_lines:
+            case["medications"] = dose_lines
+    return case
+
+
+def parse_case(text: str) -> Tuple[Dict[str, Any], list[str]]:
+    """Parse a pasted case, as JSON when possible and as free text otherwise.
+
+    Args:
+        text: Pasted case (JSON object or free text)
+
+    Returns:
+        (case, errors) — see parse_json_case
+    """
+    stripped = _JSON_FENCE.sub("", text.strip())
+    if stripped.startswith("{"):
+        try:
+            data = json.loads(stripped)
+        except json.JSONDecodeError:
+            data = None
+        if isinstance(data, dict):
+            return parse_json_case(data)
+    return parse_free_text_case(text), []
+
+
+def parse_case_update(text: str) -> Tuple[Dict[str, Any], list[str]]:
+    """Parse a message sent after a snapshot as an update of the case.
+
+    JSON and messages opening with "Add details" are parsed in full; other
+    free text only updates UPDATE_FIELDS, so a follow-up question that
+    mentions surgery does not change the case.
+
+    >>> parse_case_update("Would surgery change the metformin plan?")
+    ({}, [])
+    >>> parse_case_update("eGFR 38 now, before surgery")
+    ({'egfr': 38.0}, [])
+    >>> parse_case_update("Add details: elective knee surgery")[0]["urgency"]
+    'elective'
+
+    Returns:
+        (case, errors) — see parse_case
+    """
+    explicit = _ADD_DETAILS.match(text)
+    if explicit:
+        return parse_case(text[explicit.end():])
+    case, errors = parse_case(text)
+    if _JSON_FENCE.sub("", text.strip()).startswith("{"):
+        return case, errors
+    return {field: value for field, value in case.items() if field in UPDATE_FIELDS}, errors
+
+
+def missing_fields(case: Dict[str, Any]) -> list[str]:
+    """Return the REQUIRED_FIELDS the case does not contain."""
+    return [field for field in REQUIRED_FIELDS if not case.get(field)]
+
+
+def _format_number(value: float) -> str:
+    return f"{value:g}"
+
+
+def format_case_summary(case: Dict[str, Any]) -> str:
+    """Render a case dict as the canonical structured summary.
+
+    Missing CKM essentials are flagged with the same wording the panel uses
+    (e.g. "EF not provided").
+
+    Args:
+        case: Case dict (see CASE_SCHEMA)
+
+    Returns:
+        Markdown case summary
+    """
+    def join(*items: Optional[str]) -> str:
+        return " · ".join(item for item in items if item)
+
+    def value(field: str, template: str) -> Optional[str]:
+        return template.format(_format_number(case[field])) if field in case else None
+
+    patient = join(
+        f"{case['age']}{case.get('sex', '')}" if "age" in case else case.get("sex"),
+        case.get("diabetes_type"),
+    )
+    lines = [f"- **Patient:** {patient or 'Age/sex not provided'}"]
+    if case.get("primary_question"):
+        lines.append(f"- **Primary question:** {case['primary_question']}")
+    if case.get("diagnoses"):
+        lines.append(f"- **Diagnoses:** {'; '.join(case['diagnoses'])}")
+    if case.get("periop"):
+        contrast = {True: "yes", False: "no"}.get(case.get("contrast"), "not stated")
+        details = join(case.get("urgency"), f"contrast: {contrast}")
+        lines.append(f"- **Peri-operative:** Yes — {case.get('procedure', 'procedure not specified')} ({details})")
+    elif case.get("periop") is False:
+        lines.append("- **Peri-operative:** No")
+    lines.append("- **Cardiac:** " + join(
+        value("ef", "EF {}%") or "EF not provided",
+        f"NYHA {case['nyha']}" if case.get("nyha") else None,
+        value("nt_probnp", "NT-proBNP {} pg/mL"),
+        value("bnp", "BNP {} pg/mL"),
+        value("heart_rate", "HR {} bpm"),
+    ))
+    lines.append("- **Kidney:** " + join(
+        value("egfr", "eGFR {} mL/min/1.73m²") or "eGFR not provided",
+        value("creatinine", "creatinine {} mg/dL"),
+        value("uacr", "UACR {} mg/g"),
+    ))
+    lines.append("- **Metabolic:** " + join(
+        value("hba1c", "HbA1c {}%") or "HbA1c not provided",
+        value("bmi", "BMI {}"),
+    ))
+    lines.append(f"- **Medications:** {'; '.join(case['medications']) if case.get('medications') else 'not provided'}")
+    if case.get("notes"):
+        lines.append(f"- **Notes:** {case['notes']}")
+    for name, extra in case.get("other", {}).items():
+        lines.append(f"- **{name}:** {extra if isinstance(extra, str) else json.dumps(extra, ensure_ascii=False)}")
+    return "\n".join(lines)
@@ -0,0 +1,223 @@
+"""Expansion handler for the Consultation Snapshot.
+
+After the mediator has produced a Consultation Snapshot, the clinician can
+reply with an expansion code:
+- A: Peri-op Medication Stoplight Table
+- B: Specialty Rationale
+- C: Citations
+- Back: Return to the Consultation Snapshot
+
+These replies are routed here directly (see router.py), so no model is
+consulted just to recognise a one-letter reply. The sections are rendered
+from the specialist assessments and the snapshot persisted in session
+state when ckm_panel finished, so they return immediately and match the
+snapshot the clinician already saw. The model is only used as a fallback
+when that state is missing.
+"""
+
+from typing import Any, Mapping, Optional, Tuple
+
+from google.adk import Agent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+
+from .assessments import SpecialistAssessment, group_medications, load_assessments
+from .intake_agent import CASE_KEY
+from .mediator import SNAPSHOT_OUTPUT_KEY
+from .models import create_model
+from .output_templates import (
+    generate_citations,
+    generate_medication_table,
+    generate_specialty_rationale,
+)
+from .periop_rules import PERIOP_PLAN_KEY, classify_medication, resolve_conflict
+from .router import (
+    EXPANSION_REPLIES,
+    get_user_text,
+    normalize_control_reply,
+    text_response,
+    transfer_response,
+)
+from .specialists import SPECIALIST_OUTPUT_KEYS
+from .triage import TRIAGE_KEY
+
+
+# Specialty headings and the specialist agent that writes each one
+SPECIALTIES = {
+    "Cardiology": "cardiologist",
+    "Nephrology": "nephrologist",
+    "Endocrinology": "diabetologist",
+}
+
+_HOLD_WORDS = ("hold", "stop", "discontinue", "avoid")
+
+
+def _action_kind(action: str) -> str:
+    lowered = action.lower()
+    if lowered.startswith("continue"):
+        return "continue"
+    if lowered.startswith(_HOLD_WORDS):
+        return "hold"
+    return "conditional"
+
+
+def collect_medication_rows(
+    assessments: Mapping[str, SpecialistAssessment], periop: bool = False
+) -> Tuple[list[dict], list[str], list[str]]:
+    """Merge the specialists' medication recommendations into table rows.
+
+    Recommendations for the same medication are merged into one row (owners
+    are combined) and reported as agreements or conflicts depending on
+    whether the specialties' actions match. In a peri-op case, conflicts
+    are settled by the peri-op safety overrides where one applies;
+    otherwise the first specialty's action is kept.
+
+    Args:
+        assessments: Agent name -> typed assessment (see assessments.py)
+        periop: The case is peri-operative (case "periop")
+
+    Returns:
+        (rows, agreements, conflicts)
+    """
+    rows, agreements, conflicts = [], [], []
+    for entry in group_medications(assessments).values():
+        specialty, action, reason = entry["votes"][0]
+        conflicting = len({_action_kind(vote[1]) for vote in entry["votes"]}) > 1
+        override = (
+            resolve_conflict(classify_medication(entry["name"]), [vote[1] for vote in entry["votes"]]) if periop else None
+        )
+        if conflicting and override:
+            action = override
+        kind = _action_kind(action)
+        rows.append({
+            "name": entry["name"],
+            "continue": {"continue": "✓", "hold": "", "conditional": "Conditional"}[kind],
+            "hold": action if kind == "hold" else "",
+            "restart": reason or (action if kind != "hold" else ""),
+            "owner": " / ".join(dict.fromkeys(vote[0] for vote in entry["votes"])),
+        })
+        if len(entry["votes"]) < 2:
+            continue
+        if not conflicting:
+            owners = ", ".join(vote[0] for vote in entry["votes"])
+            agreements.append(f"{entry['name']}: {action} ({owners})")
+        else:
+            views = "; ".join(f"{vote[0]} — {vote[1]}" for vote in entry["votes"])
+            resolution = f" → **{override}** (safety override)" if override else ""
+            conflicts.append(f"{entry['name']}: {views}{resolution}")
+    return rows, agreements, conflicts
+
+
+def _rationale_bullets(assessment: Optional[SpecialistAssessment]) -> list[str]:
+    if not assessment:
+        return []
+    bullets = [f"**{label}:** {value}" for label, value in assessment.classification().items()]
+    return bullets + assessment.key_findings[:3] + ([assessment.notes] if assessment.notes else [])
+
+
+def render_expansion(reply: str, state: Mapping[str, Any]) -> Optional[str]:
+    """Render an expansion section from persisted panel state.
+
+    Args:
+        reply: Normalized expansion reply ("a", "b", "c" or "back")
+        state: Session state holding the specialist assessments and snapshot
+
+    Returns:
+        Rendered markdown, or None when the state needed is missing
+    """
+    if reply == "back":
+        return state.get(SNAPSHOT_OUTPUT_KEY)
+    skipped = (state.get(TRIAGE_KEY) or {}).get("skipped", {})
+    assessments = load_assessments(state, SPECIALIST_OUTPUT_KEYS, skipped)
+    if not assessments:
+        return None
+    periop = bool((state.get(CASE_KEY) or {}).get("periop"))
+    if reply == "a":
+        plan = state.get(PERIOP_PLAN_KEY) if periop else None
+        rows = plan["rows"] if plan else collect_medication_rows(assessments, periop)[0]
+        return generate_medication_table(rows)
+    if reply == "b":
+        _, agreements, conflicts = collect_medication_rows(assessments, periop)
+        bullets = {
+            specialty: [f"Not consulted — {skipped[agent_name]}"] if agent_name in skipped
+            else _rationale_bullets(assessments.get(agent_name))
+            for specialty, agent_name in SPECIALTIES.items()
+        }
+        return generate_specialty_rationale(
+            cardiology=bullets["Cardiology"],
+            nephrology=bullets["Nephrology"],
+            endocrinology=bullets["Endocrinology"],
+            agreements=agreements,
+            conflicts_resolved=conflicts,
+        )
+    if reply == "c":
+        references = {
+            specialty: assessments[agent_name].guideline_refs if agent_name in assessments else []
+            for specialty, agent_name in SPECIALTIES.items()
+        }
+        return generate_citations(
+            cardiology=references["Cardiology"],
+            nephrology=references["Nephrology"],
+            endocrinology=references["Endocrinology"],
+        )
+    return None
+
+
+def render_expansion_from_state(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """Answer expansion replies from session state without calling the model.
+
+    Replies that are not expansion codes are handed back to the root agent.
+    """
+    reply = normalize_control_reply(get_user_text(callback_context.user_content))
+    if reply not in EXPANSION_REPLIES:
+        return transfer_response("ckm_root_agent")
+    rendered = render_expansion(reply, callback_context.state)
+    if rendered:
+        return text_response(rendered)
+    return None
+
+
+def create_expansion_agent() -> Agent:
+    """Create the Expansion handler agent.
+
+    Renders the detail view requested after a Consultation Snapshot from the
+    persisted panel state; the model is only a fallback for sessions without it.
+    """
+    return Agent(
+        model=create_model("expansion"),
+        name="expansion_handler",
+        description="Renders the expandable details (A: medication table, B: specialty rationale, C: citations, Back: snapshot) of the latest Consultation Snapshot.",
+        instruction="""You render expandable details for the latest Consultation Snapshot in this conversation.
+
+Use ONLY the specialist assessments and the Consultation Snapshot already present in the conversation. Do not add new clinical recommendations.
+
+**Reply A → Peri-op Medication Stoplight Table:**
+Generate a markdown table with columns:
+| Medication | Continue | Hold | Restart Criteria | Owner / Guideline |
+
+**Reply B → Specialty Rationale:**
+Provide brief summaries from each specialty:
+- Cardiology: [2-3 bullet points]
+- Nephrology: [2-3 bullet points]
+- Endocrinology: [2-3 bullet points]
+- Areas of Agreement
+- Conflict Resolution (if any)
+
+**Reply C → Citations:**
+List the guideline references used:
+- ESC 2023/AHA 2024 (Cardiology)
+- KDIGO 2024 (Nephrology)
+- ADA 2024 (Endocrinology)
+
+**Reply Back → Consultation Snapshot:**
+Repeat the latest Consultation Snapshot exactly as it was shown.
+
+End every expansion with the reply options for the other sections.""",
+        before_model_callback=render_expansion_from_state,
+    )
+
+
+# Export the expansion agent
+expansion_agent = create_expansion_agent()
@@ -0,0 +1,229 @@
+"""Conversation history compaction for long consultation sessions.
+
+The root agent, intake coordinator and expansion handler send the session
+history with every model call (the panel works from the compiled case, see
+panel_context.py). A clinician who works one patient through intake, a
+snapshot, A/B/C/Back and "Add details" cycles builds a transcript that is
+re-evaluated on every turn, so each turn is slower than the last until the
+context window (num_ctx) truncates the oldest, often most important, part.
+
+Before each model call of those agents, the request history is rewritten
+(the session events themselves are not changed):
+1. Once a Consultation Snapshot exists, the finished phases before the
+   latest consult (intake Q&A, details added before a re-consult,
+   specialist outputs, superseded snapshots) are replaced by one summary of
+   the canonical case, with pointers to the state keys holding it
+2. The latest snapshot is kept verbatim
+3. Expansions already shown (A/B/C/Back) are reduced to one line; they are
+   re-rendered from session state on request (expansions.py)
+4. Agent handoffs (transfer_to_agent calls and results) are dropped from
+   earlier turns
+5. If the history is still over the agent's token budget, the oldest
+   remaining turns are dropped
+
+The current turn (the clinician's latest message and everything after it,
+e.g. transfers and tool results) is never changed.
+
+Configuration (environment variables):
+- CKM_HISTORY_TOKENS: history budget in tokens for every agent (default 3000, 0 = no budget)
+- CKM_<ROLE>_HISTORY_TOKENS: budget of one agent role (root, intake, expansion; see models.py)
+- CKM_HISTORY_COMPACTION_DISABLED: set to "1" to send the full history
+"""
+
+import json
+import os
+import re
+from typing import Any, Callable, List, Mapping, Optional
+
+from google.adk.agents import LlmAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
+
+from .case_parser import format_case_summary
+from .intake_agent import CASE_KEY
+from .mediator import mediator_agent
+from .panel_context import COMPILED_CASE_KEY
+from .router import EXPANSION_REPLIES, PHASE_KEY, PHASE_SNAPSHOT, get_user_text, normalize_control_reply
+
+
+DEFAULT_HISTORY_TOKENS = 3000
+
+# Expansion replies and the section each one shows
+EXPANSION_SECTIONS = {
+    "a": "peri-op medication table (A)",
+    "b": "specialty rationale (B)",
+    "c": "citations (C)",
+    "back": "Consultation Snapshot (Back)",
+}
+
+# ADK relays other agents' turns as user messages opening with this preamble,
+# one "[agent_name] said: ..." part per turn
+_RELAY_PREAMBLE = "For context:"
+_RELAY_AGENT = re.compile(r"^\[(?P<agent>[^\]]+)\] ")
+_RELAY_HANDOFF = re.compile(r"^\[[^\]]+\] (called tool `transfer_to_agent`|`transfer_to_agent` tool returned)")
+
+TRANSFER_TOOL = "transfer_to_agent"
+
+Turn = List[types.Content]
+
+
+def history_budget(role: str) -> int:
+    """Return the history token budget of an agent role (0 = no budget)."""
+    value = os.getenv(f"CKM_{role.upper()}_HISTORY_TOKENS") or os.getenv("CKM_HISTORY_TOKENS")
+    return int(value) if value else DEFAULT_HISTORY_TOKENS
+
+
+def estimate_tokens(contents: List[types.Content]) -> int:
+    """Approximate the tokens of request contents (~4 characters per token)."""
+    characters = 0
+    for content in contents:
+        for part in content.parts or []:
+            if part.text:
+                characters += len(part.text)
+            elif part.function_call:
+                characters += len(json.dumps(part.function_call.args or {}, ensure_ascii=False))
+            elif part.function_response:
+                characters += len(json.dumps(part.function_response.response or {}, ensure_ascii=False, default=str))
+    return characters // 4
+
+
+def is_clinician_message(content: types.Content) -> bool:
+    """True for a message the clinician typed (not a relayed agent turn or tool result)."""
+    if content.role != "user" or not content.parts:
+        return False
+    if any(part.function_response for part in content.parts):
+        return False
+    texts = [part.text for part in content.parts if part.text]
+    return bool(texts) and not texts[0].startswith(_RELAY_PREAMBLE)
+
+
+def relayed_agents(content: types.Content) -> set:
+    """Names of the other agents whose turns a user message relays."""
+    if content.role != "user":
+        return set()
+    return {
+        match.group("agent")
+        for part in content.parts or []
+        if part.text and (match := _RELAY_AGENT.match(part.text))
+    }
+
+
+def is_handoff(content: types.Content) -> bool:
+    """True for an agent handoff: a transfer_to_agent call or result, own or relayed."""
+    parts = [part for part in content.parts or [] if not (part.text and part.text.startswith(_RELAY_PREAMBLE))]
+    if not parts:
+        return False
+    for part in parts:
+        call = part.function_call or part.function_response
+        if call is not None:
+            if call.name != TRANSFER_TOOL:
+                return False
+        elif not (part.text and _RELAY_HANDOFF.match(part.text)):
+            return False
+    return True
+
+
+def split_turns(contents: List[types.Content]) -> List[Turn]:
+    """Split request contents into turns, each opening with a clinician message."""
+    turns: List[Turn] = [[]]
+    for content in contents:
+        if is_clinician_message(content) and turns[-1]:
+            turns.append([])
+        turns[-1].append(content)
+    return turns
+
+
+def _note(text: str) -> types.Content:
+    return types.Content(role="user", parts=[types.Part(text=text)])
+
+
+def _reply(turn: Turn) -> str:
+    return normalize_control_reply(get_user_text(turn[0])) if is_clinician_message(turn[0]) else ""
+
+
+def case_note(state: Mapping[str, Any], superseded: int) -> types.Content:
+    """Summarise the finished phases as the canonical case stored in state."""
+    lines = [
+        "[Conversation summary] The intake, the specialist assessments and earlier turns of this "
+        f"consultation are compacted. The canonical case is stored in session state ('{CASE_KEY}'; "
+        f"the text sent to the specialist panel is '{COMPILED_CASE_KEY}'):",
+        format_case_summary(state.get(CASE_KEY) or {}),
+    ]
+    if superseded:
+        lines.append(f"{superseded} earlier Consultation Snapshot(s) were superseded by the re-consult below.")
+    return _note("\n".join(lines))
+
+
+def compact_history(contents: List[types.Content], state: Mapping[str, Any], budget: int) -> List[types.Content]:
+    """Return the compacted request history (see the module docstring).
+
+    Args:
+        contents: Request contents built by ADK from the session events
+        state: Session state holding the canonical case
+        budget: History token budget (0 = no budget)
+    """
+    turns = split_turns(contents)
+    past, current = turns[:-1], turns[-1]
+    pinned: List[Turn] = []
+    later = [[content for content in turn if not is_handoff(content)] for turn in past]
+    later = [turn for turn in later if turn]
+    consults = [
+        index for index, turn in enumerate(later)
+        if any(mediator_agent.name in relayed_agents(content) for content in turn)
+    ]
+    if state.get(PHASE_KEY) == PHASE_SNAPSHOT and consults:
+        latest = later[consults[-1]]
+        snapshot = [content for content in latest if mediator_agent.name in relayed_agents(content)]
+        opening = [latest[0]] if is_clinician_message(latest[0]) else []
+        pinned = [[case_note(state, len(consults) - 1)], opening + snapshot]
+        after_snapshot, later, shown = later[consults[-1] + 1:], [], []
+        for turn in after_snapshot:
+            reply = _reply(turn)
+            if reply in EXPANSION_REPLIES:
+                if EXPANSION_SECTIONS[reply] not in shown:
+                    shown.append(EXPANSION_SECTIONS[reply])
+            else:
+                later.append(turn)
+        if shown:
+            pinned.append([_note(
+                f"[Already shown after the snapshot: {', '.join(shown)}. "
+                "These sections are re-rendered from session state on request.]"
+            )])
+
+    if budget:
+        fixed = estimate_tokens([content for turn in (*pinned, current) for content in turn])
+        sizes = [estimate_tokens(turn) for turn in later]
+        dropped = 0
+        while dropped < len(later) and fixed + sum(sizes[dropped:]) > budget:
+            dropped += 1
+        if dropped:
+            later = [[_note(f"[{dropped} earlier turn(s) omitted to fit the conversation history budget.]")], *later[dropped:]]
+    return [content for turn in (*pinned, *later, current) for content in turn]
+
+
+def create_history_compactor(budget: int) -> Callable[[CallbackContext, LlmRequest], Optional[LlmResponse]]:
+    """Create a before_model_callback compacting the request history.
+
+    Args:
+        budget: History token budget (0 = no budget)
+
+    Returns:
+        before_model_callback; register it after the routing callbacks, so
+        turns answered without the model skip it
+    """
+
+    def compact_request_history(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+        if os.getenv("CKM_HISTORY_COMPACTION_DISABLED") == "1" or not llm_request.contents:
+            return None
+        llm_request.contents = compact_history(llm_request.contents, callback_context.state, budget)
+        return None
+
+    return compact_request_history
+
+
+def add_history_compaction(agent: LlmAgent, role: str) -> None:
+    """Append a history compactor with the role's budget to an agent's before_model_callback."""
+    existing = agent.before_model_callback
+    callbacks = existing if isinstance(existing, list) else [existing] if existing else []
+    agent.before_model_callback = [*callbacks, create_history_compactor(history_budget(role))]
@@ -8,8 +8,26 @@ The intake agent collects decision-critical information before
 delegating to the specialist panel.
 """
 
+from typing import Optional
+
 from google.adk import Agent
-from google.adk.models.lite_llm import LiteLlm
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+
+from .case_parser import format_case_summary, missing_fields, parse_case, parse_case_update
+from .models import create_model
+from .router import (
+    MODE_REPLIES,
+    PHASE_GUIDED_INTAKE,
+    PHASE_KEY,
+    PHASE_PASTE_INTAKE,
+    PHASE_SNAPSHOT,
+    get_user_text,
+    normalize_control_reply,
+    route_expansion_reply,
+    text_response,
+    transfer_response,
+)
 
 
 # Welcome message shown at the start of conversation
@@ -47,10 +65,93 @@ GUIDED_INTAKE_QUESTIONS = {
 }
 
 
+# Static opening turns for each intake mode
+PASTE_MODE_PROMPT = "Please paste your case (free text or JSON format). I'll structure it for the specialist panel."
+
+GUIDED_INTAKE_OPENING = "Great! Let's start with the essential information.\n\n" + "\n".join(
+    f"{i + 1}. {q}" for i, q in enumerate(GUIDED_INTAKE_QUESTIONS["initial"])
+)
+
+# Session state flag set once the opening turn of the chosen mode has been shown
+INTAKE_OPENED_KEY = "ckm_intake_opened"
+
+# Session state key holding the parsed case (see case_parser.CASE_SCHEMA)
+CASE_KEY = "ckm_case"
+
+CASE_CONFIRMATION = "Is this correct? Reply **'Confirm'** to proceed or provide corrections."
+CONFIRM_REPLIES = {"confirm", "generate synthesis"}
+
+
+def open_intake_mode(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """Answer the mode-selection reply with the static opening of that mode.
+
+    The opening questions of guided intake and the paste-mode prompt are
+    fixed text, so they are returned without calling the model.
+    """
+    state = callback_context.state
+    reply = normalize_control_reply(get_user_text(callback_context.user_content))
+    if state.get(INTAKE_OPENED_KEY) or MODE_REPLIES.get(reply) != state.get(PHASE_KEY):
+        return None
+    state[INTAKE_OPENED_KEY] = True
+    if state.get(PHASE_KEY) == PHASE_GUIDED_INTAKE:
+        return text_response(GUIDED_INTAKE_OPENING)
+    return text_response(PASTE_MODE_PROMPT)
+
+
+def structure_pasted_case(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """Parse a pasted case deterministically and only ask the model for gaps.
+
+    - JSON or semi-structured text is parsed into session state (corrections
+      are merged into the stored case)
+    - A complete case is echoed as the canonical summary for confirmation
+    - "Confirm" on a complete case hands off to ckm_panel directly
+    - Otherwise the model is told which fields are still missing
+
+    Details added after a snapshot (either mode) are handled the same way,
+    so the panel can rerun only the specialists they affect. Only messages
+    that update case data count as details (see parse_case_update); other
+    follow-up messages, e.g. questions, go to the model.
+    """
+    state = callback_context.state
+    if state.get(PHASE_KEY) not in (PHASE_PASTE_INTAKE, PHASE_SNAPSHOT) or not state.get(INTAKE_OPENED_KEY):
+        return None
+    text = get_user_text(callback_context.user_content)
+    case = dict(state.get(CASE_KEY) or {})
+
+    if normalize_control_reply(text) in CONFIRM_REPLIES:
+        if case and not missing_fields(case):
+            return transfer_response("ckm_panel", text=format_case_summary(case))
+        return None
+
+    parse = parse_case_update if state.get(PHASE_KEY) == PHASE_SNAPSHOT else parse_case
+    parsed, errors = parse(text)
+    if not parsed:
+        return None
+    case.update(parsed)
+    state[CASE_KEY] = case
+    summary = format_case_summary(case)
+    missing = missing_fields(case)
+    if not missing and not errors:
+        return text_response(f"**Structured case:**\n{summary}\n\n{CASE_CONFIRMATION}")
+
+    gaps = ", ".join(missing + errors)
+    llm_request.append_instructions([
+        "The pasted case has already been parsed into this structured summary:\n"
+        f"{summary}\n\n"
+        f"Do NOT re-extract these fields. Only extract or ask for: {gaps}. "
+        f"Then display the completed summary and ask: \"{CASE_CONFIRMATION}\""
+    ])
+    return None
+
+
 def create_intake_agent() -> Agent:
     """Create the Intake agent for structured case collection."""
     return Agent(
-        model=LiteLlm(model="ollama_chat/qwen2.5:14b", temperature=0, seed=0),
+        model=create_model("intake"),
         name="intake_coordinator",
         description="Intake coordinator for CKM Syndrome Multi-Specialist Consultation. Handles guided intake and paste mode.",
         instruction=f"""You are the intake coordinator for the Cardio-Kidney-Metabolic (CKM) Syndrome Multi-Specialist Consultation portal.
@@ -94,11 +195,11 @@ Ask only **3–5 decision-critical questions per turn**. Use decision-first bran
 ## PASTE MODE
 
 When user selects paste mode:
-1. Output **EXACTLY** this phrase: "Please paste your case (free text or JSON format). I'll structure it for the specialist panel."
+1. Output **EXACTLY** this phrase: "{PASTE_MODE_PROMPT}"
 2. **STOP IMMEDIATELY after that sentence.** Do NOT add any internal codes like "_REPLY_..." or instructions like "Reply 1 or 2".
 3. After receiving the case, parse and extract key data.
 4. Display extracted data in a structured format.
-5. Ask: "Is this correct? Reply **'Confirm'** to proceed or provide corrections."
+5. Ask: "{CASE_CONFIRMATION}"
 
 ---
 
@@ -111,6 +212,7 @@ When ready to generate synthesis (user says "Generate synthesis" or "Confirm"):
    **CRITICAL RULE:** Do NOT print "Submitting case..." or any closing text. The output MUST end with the structured case summary, followed immediately by the tool call.
 
 **CRITICAL:** Never generate medical recommendations yourself. Your only job is intake and structuring. The specialist panel handles clinical assessment.""",
+        before_model_callback=[route_expansion_reply, open_intake_mode, structure_pasted_case],
     )
 
 
@@ -5,29 +5,40 @@ all specialist agents have completed their parallel assessments.
 The mediator synthesizes the three independent assessments into
 a unified treatment plan using the "output gate" pattern:
 - Specialists can be verbose internally
-- Mediator emits only the Consultation Snapshot by default
+- Mediator emits only the Consultation Snapshot by default, as JSON
+  field values rendered through the standard template (snapshot.py)
 - Details revealed only on user request
+
+The peri-op safety override and tool are only sent for cases with planned
+surgery (see prompts.py).
 """
 
 from google.adk import Agent
-from google.adk.models.lite_llm import LiteLlm
 
-
-def create_mediator_agent() -> Agent:
-    """Create the Mediator agent for synthesizing specialist recommendations.
-    
-    The mediator reads outputs from all three specialists and provides
-    a unified treatment plan with conflict resolution.
-    
-    Implements the "output gate" pattern:
-    - Default output: Consultation Snapshot (≤250 words)
-    - Expandable sections on request: A, B, or C
-    """
-    return Agent(
-        model=LiteLlm(model="ollama_chat/qwen2.5:14b", temperature=0,  seed=0),
-        name="mediator",
-        description="Mediator agent that synthesizes recommendations from cardiologist, nephrologist, and diabetologist into a unified CKM treatment plan using the Consultation Snapshot format.",
-        instruction="""You are a senior clinical coordinator and mediator for Cardio-Kidney-Metabolic (CKM) conditions.
+from .cache import create_cache_callbacks
+from .metrics import record_first_token
+from .models import create_model
+from .panel_context import create_case_context_callback
+from .periop_rules import periop_medication_plan
+from .prompts import (
+    PERIOP_STATUS_UNKNOWN,
+    PromptModule,
+    create_instruction,
+    drop_periop_tools,
+    non_periop_case,
+    periop_case,
+)
+from .safety import create_safety_validator, snapshot_line_is_safe
+from .snapshot import SNAPSHOT_OUTPUT_FORMAT, create_snapshot_renderer
+from .specialists import SPECIALIST_OUTPUT_KEYS
+from .triage import create_mediator_skip
+
+
+# Session state key where the latest Consultation Snapshot is persisted
+SNAPSHOT_OUTPUT_KEY = "consultation_snapshot"
+
+MEDIATOR_PROMPT = (
+    PromptModule("core", f"""You are a senior clinical coordinator and mediator for Cardio-Kidney-Metabolic (CKM) conditions.
 
 **CRITICAL DATA INTEGRITY RULE:**
 You must extract the Patient Demographics (Age, Sex) **ONLY** from the current input provided by the specialists. 
@@ -39,80 +50,20 @@ Verify the age and sex matches the INPUT content exactly before generating the o
 Your role is to synthesize independent assessments from three specialist agents into a **Consultation Snapshot** output.
 
 ## INPUT
-You will receive outputs from all three specialists:
-- The cardiologist's assessment
-- The nephrologist's assessment  
-- The diabetologist's assessment
-
-## OUTPUT FORMAT - CONSULTATION SNAPSHOT (Default)
-
-**CRITICAL: Your default output MUST be ≤250 words and follow this exact template:**
-
----
-## 📋 Consultation Snapshot
-
-**A) One-Line Problem:**
-[Single sentence: e.g., "**[Exact Age][Sex]** with CKD, HFrEF, T2DM presenting for..."]
-
-**B) 5 Key Facts:**
-  1. [Fact with value, e.g., "eGFR [Value] mL/min/1.73m² (CKD Stage [Stage])"]
-  2. [Fact]
-  3. [Fact]
-  4. [Fact]
-  5. [Fact]
-
-**C) 5 Key Risks:**
-  1. [Risk]
-  2. [Risk]
-  3. [Risk]
-  4. [Risk]
-  5. [Risk]
-
-**D) Decisions Needed Today:**
-[Yes/No] — [Brief explanation]
-
-**E) Next Steps:**
-  • **[Action]** — [Owner] ([Timing])
-  • **[Action]** — [Owner] ([Timing])
-  • **[Action]** — [Owner] ([Timing])
-
----
-*Reply: **A** for peri-op medication stoplight table | **B** for specialty rationale | **C** for citations*
----
-
-## EXPANSION HANDLING
-
-If user replies with expansion code, provide the requested detail:
-
-**Reply A → Peri-op Medication Stoplight Table:**
-Generate a markdown table with columns:
-| Medication | Continue | Hold | Restart Criteria | Owner / Guideline |
-
-Standard medications to include (if applicable):
-- SGLT2 inhibitors: Hold 3–4 days pre-op
-- Metformin: Hold day of surgery (48h post-op if contrast)
-- ACE inhibitors/ARBs: Hold 24h pre-op
-- Beta-blockers: Continue (avoid abrupt withdrawal)
-- Statins: Continue
-- Diuretics: Conditional (based on volume status)
-- Aspirin: Case-dependent
-- Insulin: Adjust based on NPO status
-- GLP-1 RAs (weekly): Hold 1 week pre-op (aspiration risk)
-
-**Reply B → Specialty Rationale:**
-Provide brief summaries from each specialty:
-- Cardiology: [2-3 bullet points]
-- Nephrology: [2-3 bullet points]
-- Endocrinology: [2-3 bullet points]
-- Areas of Agreement
-- Conflict Resolution (if any)
-
-**Reply C → Citations:**
-List the guideline references used:
-- ESC 2023/AHA 2024 (Cardiology)
-- KDIGO 2024 (Nephrology)
-- ADA 2024 (Endocrinology)
-- Any other relevant guidelines
+You will receive the compiled case and one merged view of the specialists consulted:
+- One classification line per specialty (cardiologist, nephrologist, diabetologist)
+- Medication recommendations grouped per drug; identical advice is listed once with every specialty that gave it, and differing advice is marked **CONFLICT**
+- De-duplicated key findings, risks, priority actions (tagged with their specialties) and guidelines
+
+A specialty marked **NOT CONSULTED** was skipped by triage because the case shows its domain is not involved. Do NOT make recommendations for that domain; add "[Specialty] not consulted — [reason]" as one of the Key Facts.
+
+## OUTPUT FORMAT - CONSULTATION SNAPSHOT FIELDS (Default)
+
+You write only the field values of the Consultation Snapshot; it is rendered from them in code.
+
+{SNAPSHOT_OUTPUT_FORMAT}
+
+Expansion replies (A, B, C, Back) are rendered from the panel state and never reach you.
 
 ## DE-DUPLICATION RULES
 
@@ -132,17 +83,17 @@ When specialists disagree, prioritize in this order:
 1. Patient safety and immediate risks
 2. Evidence-based medicine (guideline-directed)
 3. Drug interactions and contraindications
-4. Risk of disease progression
-
-## SAFETY OVERRIDES (TRUTH TABLE)
+4. Risk of disease progression"""),
+    PromptModule("safety", """## SAFETY OVERRIDES (TRUTH TABLE)
 If you detect conflicting advice on these specific topics, apply these overrides AUTOMATICALLY:
 
-1. **Peri-op Beta-Blockers:** If one agent says "Hold" and another says "Continue", usually **CONTINUE** (unless strict contraindication like bradycardia <50).
-2. **Peri-op SGLT2 Inhibitors:** If ANY agent says "Hold 3-4 days" (due to DKA risk), that overrides "Continue". Recommend **HOLD**.
-3. **Peri-op ACEi/ARB:** Recommend **HOLD 24h** pre-op over "Continue".
-4. **Hyperkalemia & SGLT2i:** If an agent claims SGLT2i causes hyperkalemia, IGNORE that claim. SGLT2i do not cause hyperkalemia.
-
-## CKM INTERACTIONS TO HIGHLIGHT
+- **Hyperkalemia & SGLT2i:** If an agent claims SGLT2i causes hyperkalemia, IGNORE that claim. SGLT2i do not cause hyperkalemia."""),
+    PERIOP_STATUS_UNKNOWN,
+    PromptModule("periop", """## PERI-OPERATIVE OVERRIDES
+- **Peri-op Beta-Blockers, SGLT2 Inhibitors, ACEi/ARB:** Call the `periop_medication_plan` tool; it applies the peri-op overrides (beta-blockers CONTINUE, SGLT2i HOLD, ACEi/ARB HOLD 24h). Its rows win over any conflicting specialist advice.""", periop_case),
+    PromptModule("no_periop", """## NO SURGERY PLANNED
+Give no peri-op Continue/Hold advice; recommendations cover chronic management only.""", non_periop_case),
+    PromptModule("interactions", """## CKM INTERACTIONS TO HIGHLIGHT
 
 Pay special attention to:
 - Medications benefiting multiple conditions (e.g., SGLT2i for heart, kidney, and glucose)
@@ -150,7 +101,33 @@ Pay special attention to:
 - Dosing adjustments needed for kidney function
 - Cardiovascular and kidney protection strategies
 
-**REMEMBER: Default output is ONLY the Board Snapshot. Keep it ≤250 words. Hide details behind expansions.**""",
+**REMEMBER: Output ONLY the JSON snapshot fields, within the length limits. Details stay behind the expansions.**"""),
+)
+
+
+def create_mediator_agent() -> Agent:
+    """Create the Mediator agent for synthesizing specialist recommendations.
+    
+    The mediator reads outputs from all three specialists and provides
+    a unified treatment plan with conflict resolution.
+    
+    Implements the "output gate" pattern:
+    - Default output: Consultation Snapshot (≤250 words)
+    - Expandable sections on request: A, B, or C
+    """
+    model = create_model("mediator")
+    cache_lookup, cache_store = create_cache_callbacks(model, on_hit=[record_first_token])
+    return Agent(
+        model=model,
+        name="mediator",
+        output_key=SNAPSHOT_OUTPUT_KEY,
+        description="Mediator agent that synthesizes recommendations from cardiologist, nephrologist, and diabetologist into a unified CKM treatment plan using the Consultation Snapshot format.",
+        instruction=create_instruction(*MEDIATOR_PROMPT),
+        tools=[periop_medication_plan],
+        include_contents="none",
+        before_agent_callback=create_mediator_skip(SNAPSHOT_OUTPUT_KEY),
+        before_model_callback=[create_case_context_callback(SPECIALIST_OUTPUT_KEYS), drop_periop_tools, cache_lookup],
+        after_model_callback=[create_safety_validator("mediator", model), create_snapshot_renderer(snapshot_line_is_safe), record_first_token, cache_store],
     )
 
 # Export the mediator agent
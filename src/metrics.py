@@ -0,0 +1,217 @@
+"""Per-consult latency metrics for the specialist panel.
+
+With token streaming the clinician sees the Consultation Snapshot as soon
+as the mediator starts writing, so perceived latency and throughput are
+tracked separately for every ``ckm_panel`` run:
+- time to first token: panel start → first mediator text chunk
+- time to complete: panel start → snapshot finished
+- per-specialist durations (from the panel progress events)
+- safety rule violations caught and repaired (see safety.py)
+- admission (priority, queue position, rejection) and time spent waiting
+  for a model backend slot (see scheduler.py)
+
+Without streaming (or on a result cache hit) the first token arrives with
+the complete mediator response, so both numbers only differ by the
+mediator's own post-processing.
+
+Each finished consult is written to session state (CONSULT_METRICS_KEY),
+kept in memory for consult_metrics.summary(), and appended to a JSONL file
+when CKM_METRICS_PATH is set.
+
+Configuration (environment variables):
+- CKM_METRICS_PATH: JSONL file receiving one record per consult
+- CKM_METRICS_MAX_RECORDS: records kept in memory (default 1000)
+"""
+
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.run_config import StreamingMode
+from google.adk.models import LlmResponse
+from google.genai import types
+
+
+# Session state key holding the metrics of the latest consult
+CONSULT_METRICS_KEY = "ckm_consult_metrics"
+
+
+def _percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class ConsultMetrics:
+    """Recorder of time-to-first-token and time-to-complete per consult.
+
+    Consults are keyed by invocation id while running; finished records are
+    kept in a bounded in-memory list and optionally appended to a JSONL file.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_records: int = 1000):
+        self.path = path
+        self._records: Deque[Dict[str, Any]] = deque(maxlen=max_records)
+        self._running: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ConsultMetrics":
+        """Build a recorder configured from CKM_METRICS_* environment variables."""
+        return cls(
+            path=os.getenv("CKM_METRICS_PATH") or None,
+            max_records=int(os.getenv("CKM_METRICS_MAX_RECORDS", "1000")),
+        )
+
+    def start(self, invocation_id: str, session_id: str, streaming: bool) -> None:
+        """Mark the start of a consult."""
+        with self._lock:
+            self._running[invocation_id] = {
+                "session_id": session_id,
+                "streaming": streaming,
+                "started_at": time.time(),
+                "_start": time.perf_counter(),
+                "_first_token": None,
+                "specialists": {},
+                "safety": [],
+                "admission": {},
+                "queue_wait": 0.0,
+            }
+
+    def _elapsed(self, consult: Dict[str, Any]) -> float:
+        return round(time.perf_counter() - consult["_start"], 3)
+
+    def specialist_finished(self, invocation_id: str, agent_name: str, status: str) -> Optional[float]:
+        """Record a specialist finishing; returns its duration in seconds."""
+        with self._lock:
+            consult = self._running.get(invocation_id)
+            if consult is None:
+                return None
+            seconds = self._elapsed(consult)
+            consult["specialists"][agent_name] = {"status": status, "seconds": seconds}
+            return seconds
+
+    def first_token(self, invocation_id: str) -> None:
+        """Record the first mediator text chunk of a consult (later calls are ignored)."""
+        with self._lock:
+            consult = self._running.get(invocation_id)
+            if consult is not None and consult["_first_token"] is None:
+                consult["_first_token"] = self._elapsed(consult)
+
+    def safety_violations(self, invocation_id: str, agent_name: str, violations: List[Dict[str, Any]]) -> None:
+        """Record the safety rule violations found in one agent's answer."""
+        with self._lock:
+            consult = self._running.get(invocation_id)
+            if consult is not None:
+                consult["safety"].extend({"agent": agent_name, **violation} for violation in violations)
+
+    def admission(self, invocation_id: str, admission: Dict[str, Any]) -> None:
+        """Record how the scheduler admitted a consult."""
+        with self._lock:
+            consult = self._running.get(invocation_id)
+            if consult is not None:
+                consult["admission"] = dict(admission)
+
+    def queue_wait(self, invocation_id: str, seconds: float) -> None:
+        """Add time one of the consult's model requests waited for a backend slot."""
+        with self._lock:
+            consult = self._running.get(invocation_id)
+            if consult is not None:
+                consult["queue_wait"] += seconds
+
+    def finish(self, invocation_id: str) -> Optional[Dict[str, Any]]:
+        """Close a consult and return its record."""
+        with self._lock:
+            consult = self._running.pop(invocation_id, None)
+            if consult is None:
+                return None
+            complete = self._elapsed(consult)
+            record = {
+                "invocation_id": invocation_id,
+                "session_id": consult["session_id"],
+                "started_at": consult["started_at"],
+                "streaming": consult["streaming"],
+                "time_to_first_token_seconds": consult["_first_token"] if consult["_first_token"] is not None else complete,
+                "time_to_complete_seconds": complete,
+                "specialists": consult["specialists"],
+                "safety_violations": consult["safety"],
+                "admission": consult["admission"],
+                "queue_wait_seconds": round(consult["queue_wait"], 3),
+            }
+            self._records.append(record)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as handle:
+                    handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+            return record
+
+    def records(self) -> List[Dict[str, Any]]:
+        """Return the finished consult records kept in memory."""
+        with self._lock:
+            return list(self._records)
+
+    def summary(self) -> Dict[str, Any]:
+        """Return p50/p95 time to first token and time to complete, safety violations and queueing."""
+        records = self.records()
+        admitted = [r for r in records if not r.get("admission", {}).get("rejected")]
+        waits = [r.get("queue_wait_seconds", 0.0) for r in admitted]
+        ttft = [r["time_to_first_token_seconds"] for r in admitted]
+        complete = [r["time_to_complete_seconds"] for r in admitted]
+        violations = [v for r in records for v in r.get("safety_violations", [])]
+        return {
+            "consults": len(records),
+            "time_to_first_token_seconds": {"p50": _percentile(ttft, 50), "p95": _percentile(ttft, 95)},
+            "time_to_complete_seconds": {"p50": _percentile(complete, 50), "p95": _percentile(complete, 95)},
+            "safety": {
+                "violations": len(violations),
+                "repaired": sum(1 for v in violations if v["outcome"] in ("patched", "reprompted")),
+                "by_rule": dict(Counter(v["rule"] for v in violations)),
+                "by_outcome": dict(Counter(v["outcome"] for v in violations)),
+            },
+            "queue": {
+                "rejected": len(records) - len(admitted),
+                "wait_seconds": {"p50": _percentile(waits, 50), "p95": _percentile(waits, 95)},
+                "by_priority": dict(Counter(r["admission"]["priority"] for r in records if r.get("admission"))),
+            },
+        }
+
+    def clear(self) -> None:
+        """Drop all finished records."""
+        with self._lock:
+            self._records.clear()
+
+
+# Shared recorder used by the panel
+consult_metrics = ConsultMetrics.from_env()
+
+
+def start_consult_metrics(callback_context: CallbackContext) -> Optional[types.Content]:
+    """ckm_panel before_agent_callback: start timing the consult."""
+    run_config = callback_context.run_config
+    consult_metrics.start(
+        callback_context.invocation_id,
+        callback_context.session.id,
+        streaming=run_config is not None and run_config.streaming_mode == StreamingMode.SSE,
+    )
+    return None
+
+
+def record_first_token(callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+    """Mediator after_model_callback (also run on a cache hit): note the first chunk carrying snapshot text."""
+    content = llm_response.content
+    if content and any(part.text and not part.thought for part in content.parts or []):
+        consult_metrics.first_token(callback_context.invocation_id)
+    return None
+
+
+def finish_consult_metrics(callback_context: CallbackContext) -> Optional[types.Content]:
+    """ckm_panel after_agent_callback: store the consult's metrics in state."""
+    record = consult_metrics.finish(callback_context.invocation_id)
+    if record is not None:
+        callback_context.state[CONSULT_METRICS_KEY] = record
+    return None
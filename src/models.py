@@ -0,0 +1,299 @@
+"""Central model registry for the CKM agents.
+
+Every agent factory asks this module for its model instead of building its
+own ``LiteLlm``, so the model, endpoint and Ollama options of each agent
+can be changed without editing source (e.g. routing and intake on a small
+fast model, specialists on 14b or 32b).
+
+Agent roles: root, intake, cardiologist, nephrologist, diabetologist,
+mediator, expansion.
+
+Configuration (highest precedence first):
+1. Per-role environment variables: CKM_<ROLE>_MODEL, CKM_<ROLE>_API_BASE,
+   CKM_<ROLE>_NUM_CTX, CKM_<ROLE>_NUM_PREDICT, CKM_<ROLE>_KEEP_ALIVE
+   (e.g. CKM_INTAKE_MODEL=ollama_chat/llama3.2:3b)
+2. JSON file named by CKM_MODEL_CONFIG, with a "default" entry and one
+   entry per role: {"default": {"model": "..."}, "mediator": {"num_ctx": 16384}}
+3. Global environment defaults: CKM_MODEL, CKM_NUM_CTX, CKM_NUM_PREDICT,
+   CKM_KEEP_ALIVE (and OLLAMA_API_BASE for the endpoint)
+4. DEFAULT_MODEL_CONFIG
+
+All Ollama agents share one keep-alive HTTP connection pool per backend
+(api_base), so the parallel specialists reuse open connections instead of
+opening new ones for every call. Agents without a per-role endpoint spread
+their requests over the Ollama backend pool (see backends.py), and every
+request goes through its backend's urgency-aware scheduler (see
+scheduler.py). With CKM_TRACE_PATH set, every Ollama call is recorded as a
+span with Ollama's timing fields (see tracing.py).
+"""
+
+import asyncio
+import json
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+from google.adk.models.lite_llm import LiteLlm, LiteLLMClient
+
+from .tracing import OllamaTimingTransport, activate_span, deactivate_span, tracer
+
+
+DEFAULT_API_BASE = "http://localhost:11434"
+
+DEFAULT_MODEL_CONFIG: Dict[str, Any] = {
+    "model": "ollama_chat/qwen2.5:14b",
+    "api_base": None,
+    "num_ctx": None,
+    "num_predict": None,
+    "keep_alive": None,
+}
+
+AGENT_ROLES = ("root", "intake", "cardiologist", "nephrologist", "diabetologist", "mediator", "expansion")
+
+# Settings read as integers from the environment
+_INT_SETTINGS = ("num_ctx", "num_predict")
+
+# Connection pool sizing per backend
+POOL_MAX_CONNECTIONS = int(os.getenv("CKM_POOL_MAX_CONNECTIONS", "16"))
+POOL_KEEPALIVE_SECONDS = float(os.getenv("CKM_POOL_KEEPALIVE_SECONDS", "300"))
+# Local models can take minutes to answer; only connecting should fail fast
+REQUEST_TIMEOUT = httpx.Timeout(600.0, connect=10.0)
+
+# First chunk of a streamed response that ended without any
+_END = object()
+
+
+def _env_settings(prefix: str) -> Dict[str, Any]:
+    settings: Dict[str, Any] = {}
+    for name in DEFAULT_MODEL_CONFIG:
+        value = os.getenv(f"{prefix}{name.upper()}")
+        if value:
+            settings[name] = int(value) if name in _INT_SETTINGS else value
+    return settings
+
+
+def _file_settings() -> Dict[str, Dict[str, Any]]:
+    path = os.getenv("CKM_MODEL_CONFIG")
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def resolve_model_config(role: str) -> Dict[str, Any]:
+    """Return the effective model settings of an agent role.
+
+    Args:
+        role: One of AGENT_ROLES
+
+    Returns:
+        Dict with 'model', 'api_base', 'num_ctx', 'num_predict', 'keep_alive'
+        (None where unset)
+    """
+    if role not in AGENT_ROLES:
+        raise ValueError(f"Unknown agent role {role!r}; expected one of {', '.join(AGENT_ROLES)}")
+    file_settings = _file_settings()
+    config = dict(DEFAULT_MODEL_CONFIG)
+    config.update(_env_settings("CKM_"))
+    config.update(file_settings.get("default", {}))
+    config.update(file_settings.get(role, {}))
+    config.update(_env_settings(f"CKM_{role.upper()}_"))
+    return config
+
+
+def configured_models() -> Dict[str, Dict[str, Any]]:
+    """Return the effective settings of every agent role."""
+    return {role: resolve_model_config(role) for role in AGENT_ROLES}
+
+
+class ConnectionPool:
+    """One keep-alive HTTP client per backend, shared by all agents.
+
+    httpx connections belong to the event loop that opened them, so a new
+    client is created when the registry is used from another loop (e.g. a
+    second ``asyncio.run`` in batch mode).
+    """
+
+    def __init__(self, max_connections: int = POOL_MAX_CONNECTIONS, keepalive_seconds: float = POOL_KEEPALIVE_SECONDS):
+        self.max_connections = max_connections
+        self.keepalive_seconds = keepalive_seconds
+        self._clients: Dict[str, Tuple[asyncio.AbstractEventLoop, Any]] = {}
+
+    def client_for(self, api_base: str) -> Any:
+        """Return the shared LiteLLM HTTP handler for a backend."""
+        from litellm.llms.custom_httpx.http_handler import AsyncHTTPHandler
+
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(api_base)
+        if entry is None or entry[0] is not loop:
+            transport = OllamaTimingTransport(httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=self.keepalive_seconds,
+                )
+            ))
+            entry = (loop, AsyncHTTPHandler(timeout=REQUEST_TIMEOUT, transport=transport, client_alias=api_base))
+            self._clients[api_base] = entry
+        return entry[1]
+
+    async def aclose(self) -> None:
+        """Close the clients opened on the running event loop."""
+        loop = asyncio.get_running_loop()
+        for api_base, (client_loop, handler) in list(self._clients.items()):
+            if client_loop is loop:
+                await handler.close()
+                del self._clients[api_base]
+
+
+# Shared pool used by every registry model
+connection_pool = ConnectionPool()
+
+
+def resolve_api_base(api_base: Optional[str] = None) -> str:
+    """Return the Ollama endpoint of a request.
+
+    Resolved per call so OLLAMA_API_BASE changes apply without rebuilding agents.
+    """
+    return api_base or os.getenv("OLLAMA_API_BASE") or DEFAULT_API_BASE
+
+
+def model_backends(model: LiteLlm) -> List[str]:
+    """Return the Ollama endpoints a registry model may currently send requests to.
+
+    A model pinned with CKM_<ROLE>_API_BASE uses that endpoint; the others
+    share the backend pool (see backends.py).
+    """
+    pinned = model._additional_args.get("api_base")
+    if pinned:
+        return [resolve_api_base(pinned)]
+    from .backends import backend_pool
+
+    return backend_pool.backend_urls()
+
+
+class PooledLiteLLMClient(LiteLLMClient):
+    """LiteLLM client that sends Ollama requests through the backend pool, connection pool and scheduler."""
+
+    def __init__(self, pool: Optional[ConnectionPool] = None):
+        self.pool = pool or connection_pool
+
+    async def acompletion(self, model: Any, messages: Any, tools: Any, **kwargs: Any) -> Any:
+        if not str(model).startswith("ollama"):
+            return await super().acompletion(model=model, messages=messages, tools=tools, **kwargs)
+        # backends.py and scheduler.py import this module
+        from .backends import backend_pool, is_retryable
+        from .scheduler import scheduling_enabled
+
+        scheduled = scheduling_enabled()
+        pinned = kwargs.get("api_base")
+        span = tracer.start_llm(str(model), stream=bool(kwargs.get("stream")))
+        # The connection pool's transport reads Ollama's timing into the span
+        token = activate_span(span)
+        tried: List[str] = []
+        try:
+            while True:
+                backend = None if pinned else backend_pool.select(model, exclude=tried)
+                api_base = backend.url if backend else resolve_api_base(pinned)
+                if span:
+                    span.set(**{"ckm.backend": api_base, "ckm.attempts": len(tried) + 1})
+                call_kwargs = {**kwargs, "api_base": api_base, "client": kwargs.get("client") or self.pool.client_for(api_base)}
+                try:
+                    response, first = await self._complete_on(api_base, scheduled, span, model, messages, tools, call_kwargs)
+                except BaseException as exc:
+                    if backend is not None:
+                        backend_pool.release(backend, model, exc)
+                        tried.append(api_base)
+                    # Retry a connection or server error on another backend
+                    if backend is None or not is_retryable(exc) or len(tried) >= len(backend_pool.backend_urls()):
+                        if span:
+                            span.end(exc)
+                        raise
+                    continue
+                if not kwargs.get("stream"):
+                    if backend:
+                        backend_pool.release(backend, model)
+                    if span:
+                        span.end()
+                    return response
+                return self._release_after_stream(response, first, api_base, scheduled, span, backend, model)
+        finally:
+            deactivate_span(token)
+
+    async def _complete_on(
+        self, api_base: str, scheduled: bool, span: Any, model: Any, messages: Any, tools: Any, kwargs: Dict[str, Any]
+    ) -> Tuple[Any, Any]:
+        """Send a request to one backend, through its scheduler if scheduled.
+
+        A streamed response is read up to its first chunk, so a backend that
+        fails before answering can still be swapped for another.
+
+        Returns:
+            (response, first chunk or _END for a streamed response)
+        """
+        from .scheduler import request_scheduler
+
+        if scheduled:
+            waited = await request_scheduler.acquire(api_base)
+            if span:
+                span.set(**{"ckm.queue_wait_seconds": round(waited, 4)})
+        try:
+            response = await super().acompletion(model=model, messages=messages, tools=tools, **kwargs)
+            if not kwargs.get("stream"):
+                if scheduled:
+                    request_scheduler.release(api_base)
+                return response, None
+            response = response.__aiter__()
+            try:
+                first = await response.__anext__()
+            except StopAsyncIteration:
+                first = _END
+            return response, first
+        except BaseException:
+            if scheduled:
+                request_scheduler.release(api_base)
+            raise
+
+    async def _release_after_stream(
+        self, chunks: AsyncIterator[Any], first: Any, api_base: str, scheduled: bool, span: Any, backend: Any, model: Any
+    ) -> AsyncIterator[Any]:
+        """Hold the backend slot until a streamed response is fully read (or abandoned)."""
+        from .backends import backend_pool
+        from .scheduler import request_scheduler
+
+        error: Optional[BaseException] = None
+        try:
+            if first is not _END:
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            if scheduled:
+                request_scheduler.release(api_base)
+            if backend:
+                backend_pool.release(backend, model, error)
+            if span:
+                span.end(error)
+
+
+def create_model(role: str, **overrides: Any) -> LiteLlm:
+    """Build the LiteLlm model of an agent role from the registry.
+
+    Panel agents keep deterministic sampling (temperature=0, seed=0) so the
+    result cache stays valid.
+
+    Args:
+        role: One of AGENT_ROLES
+        **overrides: Extra LiteLlm/completion arguments
+
+    Returns:
+        LiteLlm instance using the shared connection pool
+    """
+    config = resolve_model_config(role)
+    kwargs: Dict[str, Any] = {"temperature": 0, "seed": 0}
+    kwargs.update({k: v for k, v in config.items() if k != "model" and v is not None})
+    kwargs.update(overrides)
+    return LiteLlm(model=config["model"], llm_client=PooledLiteLLMClient(), **kwargs)
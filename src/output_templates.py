@@ -176,13 +176,111 @@ def format_medication_table(medications: list[str]) -> str:
     Returns:
         Formatted markdown table rows
     """
-    rows = []
-    for med_key in medications:
-        if med_key in STANDARD_PERIOP_MEDICATIONS:
-            med = STANDARD_PERIOP_MEDICATIONS[med_key]
-            row = f"| {med['name']} | {med['continue']} | {med['hold']} | {med['restart']} | {med['owner']} |"
-            rows.append(row)
-    return "\n".join(rows)
+    return format_medication_rows(
+        [STANDARD_PERIOP_MEDICATIONS[key] for key in medications if key in STANDARD_PERIOP_MEDICATIONS]
+    )
+
+
+def format_medication_rows(rows: list[dict]) -> str:
+    """Format medication row dicts into markdown table rows.
+    
+    Args:
+        rows: Dicts with 'name', 'continue', 'hold', 'restart', 'owner' keys
+        
+    Returns:
+        Formatted markdown table rows
+    """
+    return "\n".join(
+        f"| {row['name']} | {row['continue']} | {row['hold']} | {row['restart']} | {row['owner']} |"
+        for row in rows
+    )
+
+
+def generate_medication_table(rows: list[dict]) -> str:
+    """Generate the full Peri-op Medication Stoplight Table expansion.
+    
+    Args:
+        rows: Dicts with 'name', 'continue', 'hold', 'restart', 'owner' keys
+        
+    Returns:
+        Formatted medication table string
+    """
+    return PERIOP_MEDICATION_TABLE_TEMPLATE.format(medication_rows=format_medication_rows(rows))
+
+
+def _format_bullets(items: list[str], empty: str) -> str:
+    return "\n".join(f"• {item}" for item in items) if items else empty
+
+
+def generate_specialty_rationale(
+    cardiology: list[str],
+    nephrology: list[str],
+    endocrinology: list[str],
+    agreements: list[str],
+    conflicts_resolved: list[str]
+) -> str:
+    """Generate the Specialty Rationale expansion.
+    
+    Args:
+        cardiology: Bullet points from the cardiology assessment
+        nephrology: Bullet points from the nephrology assessment
+        endocrinology: Bullet points from the endocrinology assessment
+        agreements: Recommendations shared by more than one specialty
+        conflicts_resolved: Recommendations on which specialties differed
+        
+    Returns:
+        Formatted Specialty Rationale string
+    """
+    return SPECIALTY_RATIONALE_TEMPLATE.format(
+        cardiology_summary=_format_bullets(cardiology, "Not assessed"),
+        nephrology_summary=_format_bullets(nephrology, "Not assessed"),
+        endocrinology_summary=_format_bullets(endocrinology, "Not assessed"),
+        agreements=_format_bullets(agreements, "No shared recommendations"),
+        conflicts_resolved=_format_bullets(conflicts_resolved, "No conflicting recommendations"),
+    )
+
+
+def generate_citations(
+    cardiology: list[str],
+    nephrology: list[str],
+    endocrinology: list[str]
+) -> str:
+    """Generate the Citations expansion.
+    
+    Args:
+        cardiology: Guideline references cited by cardiology
+        nephrology: Guideline references cited by nephrology
+        endocrinology: Guideline references cited by endocrinology
+        
+    Returns:
+        Formatted Citations string
+    """
+    return CITATIONS_TEMPLATE.format(
+        cardiology_citations=_format_bullets(cardiology, "• ESC 2023 / AHA 2024 Heart Failure Guidelines"),
+        nephrology_citations=_format_bullets(nephrology, "• KDIGO 2024 CKD Guideline"),
+        endocrinology_citations=_format_bullets(endocrinology, "• ADA 2024 Standards of Care in Diabetes"),
+    )
+
+
+# Per-field limits that keep the rendered snapshot within 250 words
+SNAPSHOT_MAX_ITEMS = {"key_facts": 5, "key_risks": 5, "next_steps": 3}
+SNAPSHOT_MAX_WORDS = {
+    "one_line_problem": 20,
+    "key_fact": 10,
+    "key_risk": 8,
+    "decisions_needed": 20,
+    "action": 8,
+    "owner": 2,
+    "timing": 3,
+}
+
+
+def limit_words(text: str, max_words: int) -> str:
+    """Cut text to max_words words, marking the cut with an ellipsis."""
+    words = str(text or "").split()
+    if len(words) <= max_words:
+        return " ".join(words)
+    return " ".join(words[:max_words]).rstrip(",;:—-") + "…"
 
 
 def generate_consultation_snapshot(
@@ -194,6 +292,9 @@ def generate_consultation_snapshot(
 ) -> str:
     """Generate a formatted Consultation Snapshot.
     
+    Values longer than SNAPSHOT_MAX_WORDS are cut and lists are capped at
+    SNAPSHOT_MAX_ITEMS, so the snapshot never exceeds 250 words.
+    
     Args:
         one_line_problem: Single sentence summarizing the case
         key_facts: List of 5 key clinical facts
@@ -204,19 +305,27 @@ def generate_consultation_snapshot(
     Returns:
         Formatted Consultation Snapshot string
     """
-    facts_formatted = "\n".join(f"  {i+1}. {fact}" for i, fact in enumerate(key_facts[:5]))
-    risks_formatted = "\n".join(f"  {i+1}. {risk}" for i, risk in enumerate(key_risks[:5]))
+    facts = key_facts[:SNAPSHOT_MAX_ITEMS["key_facts"]]
+    risks = key_risks[:SNAPSHOT_MAX_ITEMS["key_risks"]]
+    facts_formatted = "\n".join(
+        f"  {i+1}. {limit_words(fact, SNAPSHOT_MAX_WORDS['key_fact'])}" for i, fact in enumerate(facts)
+    )
+    risks_formatted = "\n".join(
+        f"  {i+1}. {limit_words(risk, SNAPSHOT_MAX_WORDS['key_risk'])}" for i, risk in enumerate(risks)
+    )
     
     steps_formatted = "\n".join(
-        f"  • **{step.get('action', '')}** — {step.get('owner', '')} ({step.get('timing', '')})"
-        for step in next_steps
+        f"  • **{limit_words(step.get('action', ''), SNAPSHOT_MAX_WORDS['action'])}**"
+        f" — {limit_words(step.get('owner', ''), SNAPSHOT_MAX_WORDS['owner'])}"
+        f" ({limit_words(step.get('timing', ''), SNAPSHOT_MAX_WORDS['timing'])})"
+        for step in next_steps[:SNAPSHOT_MAX_ITEMS["next_steps"]]
     )
     
     return CONSULTATION_SNAPSHOT_TEMPLATE.format(
-        one_line_problem=one_line_problem,
+        one_line_problem=limit_words(one_line_problem, SNAPSHOT_MAX_WORDS["one_line_problem"]),
         key_facts=facts_formatted,
         key_risks=risks_formatted,
-        decisions_needed=decisions_needed,
+        decisions_needed=limit_words(decisions_needed, SNAPSHOT_MAX_WORDS["decisions_needed"]),
         next_steps=steps_formatted
     )
 
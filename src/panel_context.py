@@ -0,0 +1,215 @@
+"""Compiled case context for the specialist panel.
+
+Without this, every agent in ``ckm_panel`` sees the full session history
+(welcome message, every intake question and answer, confirmation turns),
+so a long intake dialogue is evaluated three times over by the specialists.
+Instead:
+1. On handoff, ``compile_case`` merges the clinician's intake answers and
+   the parsed case into one canonical case object in session state, with
+   the deterministic calculations (eGFR, staging, dose rules; see
+   calculators.py) added to it
+2. Specialists build their request only from that compiled case
+3. The mediator builds its request from the compiled case plus one
+   merged view of the specialists' typed assessments (assessments.py),
+   with specialties skipped by triage marked NOT CONSULTED
+
+Details the clinician adds after a snapshot are compiled as updates on top
+of the previous consult's case (see reconsult.py for which specialists
+rerun).
+
+Tool calls an agent makes during its own turn (e.g. periop_medication_plan)
+are kept, so tool use keeps working.
+"""
+
+import json
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.events import Event
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
+
+from .assessments import load_assessments, merge_assessments
+from .calculators import calculate_case, format_calculations
+from .case_parser import format_case_summary, parse_case, parse_case_update
+from .intake_agent import CASE_KEY, CONFIRM_REPLIES
+from .periop_rules import PERIOP_PLAN_KEY
+from .router import EXPANSION_REPLIES, MODE_REPLIES, get_user_text, normalize_control_reply
+from .triage import TRIAGE_KEY
+
+
+# Session state key holding the compiled case text sent to the panel
+COMPILED_CASE_KEY = "ckm_compiled_case"
+
+# Session state key holding the latest consult's case, consulted specialists and intake
+# turns ('turns': compiled for it, 'intake_turns': compiled for the intake's first consult)
+PREVIOUS_CONSULT_KEY = "ckm_previous_consult"
+
+# User replies that steer the dialogue but carry no case information
+_CONTROL_REPLIES = set(MODE_REPLIES) | CONFIRM_REPLIES | EXPANSION_REPLIES
+
+# Session state keys describing the current patient; cleared when a new intake starts
+CASE_STATE_KEYS = (CASE_KEY, COMPILED_CASE_KEY, PREVIOUS_CONSULT_KEY, PERIOP_PLAN_KEY)
+
+
+def reset_case_state(state: Any) -> None:
+    """Forget the previous patient's case, consult and peri-op plan (new intake)."""
+    for key in CASE_STATE_KEYS:
+        state[key] = None
+
+
+def collect_case_turns(events: List[Event]) -> List[str]:
+    """Return the clinician's case answers from the current intake.
+
+    Only user turns after the latest mode selection ("1"/"2") are used, and
+    control replies (mode choice, "Confirm", A/B/C/Back) are dropped.
+    """
+    turns: List[str] = []
+    for event in events:
+        if event.author != "user":
+            continue
+        text = get_user_text(event.content).strip()
+        reply = normalize_control_reply(text)
+        if reply in MODE_REPLIES:
+            turns = []
+        elif text and reply not in _CONTROL_REPLIES and text not in turns:
+            turns.append(text)
+    return turns
+
+
+def case_updates(turns: List[str], seen: Optional[List[str]]) -> Optional[List[str]]:
+    """Return the turns added after an earlier consult of the same intake.
+
+    Args:
+        turns: Current clinician answers (see collect_case_turns)
+        seen: Answers compiled for the earlier consult
+
+    Returns:
+        New turns (possibly empty), or None when there was no earlier
+        consult or the intake was restarted since
+    """
+    if seen is None or turns[: len(seen)] != seen:
+        return None
+    return turns[len(seen):]
+
+
+def _is_json(text: str) -> bool:
+    try:
+        return isinstance(json.loads(text), dict)
+    except ValueError:
+        return False
+
+
+def compile_case_text(
+    turns: List[str],
+    stored_case: Optional[Dict[str, Any]] = None,
+    updates: Optional[List[str]] = None,
+) -> tuple[Dict[str, Any], str]:
+    """Merge intake answers and the stored case into the canonical case.
+
+    Args:
+        turns: Clinician answers (see collect_case_turns)
+        stored_case: Case already parsed into state (paste mode, batch); wins over the answers
+        updates: Answers added after the previous snapshot (a tail of turns);
+            they win over the stored case and are listed separately
+
+    Returns:
+        (case, compiled text) — the structured summary and calculated
+        facts, followed by validation notes and the free-text answers
+        verbatim, so details the parser does not extract (primary question,
+        procedure, history) still reach the panel
+    """
+    case: Dict[str, Any] = {}
+    errors: List[str] = []
+    free_text: List[str] = []
+    updates = updates or []
+    earlier = turns[: len(turns) - len(updates)]
+    for turn in earlier:
+        parsed, turn_errors = parse_case(turn)
+        case.update(parsed)
+        errors.extend(turn_errors)
+        if not _is_json(turn):
+            free_text.append(turn)
+    case.update(stored_case or {})
+    for turn in updates:
+        parsed, turn_errors = parse_case_update(turn)
+        case.update(parsed)
+        errors.extend(turn_errors)
+    calculate_case(case)
+
+    sections = [f"## Compiled Case\n{format_case_summary(case)}"]
+    calculations = format_calculations(case)
+    if calculations:
+        sections.append(calculations)
+    if errors:
+        sections.append("**Validation notes:** " + "; ".join(errors))
+    if free_text:
+        sections.append("## Clinician Input (verbatim)\n" + "\n\n".join(free_text))
+    update_text = [turn for turn in updates if not _is_json(turn)]
+    if update_text:
+        sections.append("## Clinician Updates (supersede the input above)\n" + "\n\n".join(update_text))
+    return case, "\n\n".join(sections)
+
+
+def compile_case(callback_context: CallbackContext) -> Optional[types.Content]:
+    """Write the canonical case into session state when the panel starts.
+
+    The previous consult's peri-op medication plan is cleared; the
+    specialists' tool calls of this consult write a new one.
+    """
+    state = callback_context.state
+    state[PERIOP_PLAN_KEY] = None
+    turns = collect_case_turns(callback_context.session.events)
+    previous = state.get(PREVIOUS_CONSULT_KEY)
+    # Everything added after the intake's first snapshot is listed as an update
+    updates = case_updates(turns, (previous or {}).get("intake_turns"))
+    # The stored case is this intake's (paste mode, batch, earlier consult), never an earlier patient's
+    stored_case = state.get(CASE_KEY) if not previous or updates is not None else None
+    case, text = compile_case_text(turns, stored_case, updates)
+    state[CASE_KEY] = case
+    state[COMPILED_CASE_KEY] = text
+    return None
+
+
+def _own_turn_contents(contents: List[types.Content]) -> List[types.Content]:
+    """Keep the agent's own tool calls and results from the current turn.
+
+    With include_contents="none" the request holds the message that started
+    the turn followed by the agent's own function calls (role "model") and
+    their responses.
+    """
+    for index, content in enumerate(contents):
+        if content.role == "model":
+            return contents[index:]
+    return []
+
+
+def create_case_context_callback(
+    assessment_keys: Optional[Mapping[str, str]] = None,
+) -> Callable[[CallbackContext, LlmRequest], Optional[LlmResponse]]:
+    """Create a before_model_callback that sends only the compiled case.
+
+    Args:
+        assessment_keys: Agent name -> state key of the specialist outputs
+            merged after the case (used by the mediator)
+
+    Returns:
+        before_model_callback; register it before the cache lookup so the
+        cache key is the compiled context
+    """
+
+    def use_compiled_case(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+        state = callback_context.state
+        compiled = state.get(COMPILED_CASE_KEY)
+        if not compiled:
+            # Agent run on its own (e.g. picked in adk web): keep the default contents
+            return None
+        sections = [compiled]
+        if assessment_keys:
+            skipped = (state.get(TRIAGE_KEY) or {}).get("skipped", {})
+            sections.append(merge_assessments(load_assessments(state, assessment_keys, skipped), skipped))
+        context = types.Content(role="user", parts=[types.Part(text="\n\n".join(sections))])
+        llm_request.contents = [context, *_own_turn_contents(llm_request.contents)]
+        return None
+
+    return use_compiled_case
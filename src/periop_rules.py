@@ -0,0 +1,211 @@
+"""Rule-based peri-operative medication plan (stoplight table engine).
+
+The peri-op hold/continue rules used to live only as prompt text in the
+cardiologist, nephrologist, diabetologist and mediator instructions. This
+module applies them deterministically on top of STANDARD_PERIOP_MEDICATIONS:
+1. Medications are classified by drug name into the standard classes
+2. Procedure details (contrast, urgency) and labs (eGFR, heart rate) adjust rows
+3. The mediator's SAFETY OVERRIDES truth table is applied in code
+
+Agents call ``periop_medication_plan`` as a tool instead of regenerating
+the table, and the expansion handler renders the stored plan for "A".
+"""
+
+import copy
+import re
+from typing import Any, Dict, Iterable, Optional
+
+from google.adk.tools.tool_context import ToolContext
+
+from .output_templates import STANDARD_PERIOP_MEDICATIONS, format_medication_rows
+
+
+# Session state key holding the medication plan computed in the current consult (cleared when the panel starts)
+PERIOP_PLAN_KEY = "periop_medication_plan"
+
+# Drug names (lower-case) recognised for each standard medication class
+MEDICATION_CLASSES = {
+    "sglt2i": ["sglt2", "empagliflozin", "dapagliflozin", "canagliflozin", "ertugliflozin", "sotagliflozin", "jardiance", "farxiga"],
+    "metformin": ["metformin", "glucophage"],
+    "acei_arb": [
+        "ace inhibitor", "acei", "arb", "arni", "lisinopril", "enalapril", "ramipril", "perindopril",
+        "captopril", "losartan", "valsartan", "candesartan", "irbesartan", "telmisartan", "olmesartan",
+        "sacubitril", "entresto",
+    ],
+    "beta_blocker": ["beta-blocker", "beta blocker", "carvedilol", "metoprolol", "bisoprolol", "nebivolol", "atenolol", "propranolol"],
+    "statin": ["statin", "atorvastatin", "rosuvastatin", "simvastatin", "pravastatin"],
+    "loop_diuretic": ["loop diuretic", "furosemide", "torsemide", "bumetanide", "lasix"],
+    "aspirin": ["aspirin", "asa"],
+    "anticoagulant": ["anticoagulant", "warfarin", "apixaban", "rivaroxaban", "dabigatran", "edoxaban"],
+    "insulin": ["insulin", "glargine", "degludec", "detemir", "lispro", "aspart"],
+    "sulfonylurea": ["sulfonylurea", "glipizide", "glyburide", "glimepiride", "gliclazide"],
+    "glp1ra": ["glp-1", "glp1", "semaglutide", "liraglutide", "dulaglutide", "exenatide", "tirzepatide", "ozempic"],
+}
+
+# Short class labels used in table rows
+CLASS_LABELS = {
+    "sglt2i": "SGLT2i",
+    "metformin": "",
+    "acei_arb": "ACEi/ARB",
+    "beta_blocker": "β-blocker",
+    "statin": "Statin",
+    "loop_diuretic": "Loop diuretic",
+    "aspirin": "",
+    "anticoagulant": "Anticoagulant",
+    "insulin": "",
+    "sulfonylurea": "Sulfonylurea",
+    "glp1ra": "GLP-1 RA",
+}
+
+URGENT_PROCEDURES = {"urgent", "emergent", "emergency"}
+
+_WORD = re.compile(r"[a-z0-9-]+")
+
+
+def classify_medication(medication: str) -> Optional[str]:
+    """Map a free-text medication entry to a STANDARD_PERIOP_MEDICATIONS key.
+
+    Args:
+        medication: Medication as written, e.g. "Empagliflozin 10mg daily"
+
+    Returns:
+        Medication class key, or None if the drug is not covered by the rules
+    """
+    lowered = medication.lower()
+    words = set(_WORD.findall(lowered))
+    for key, names in MEDICATION_CLASSES.items():
+        for name in names:
+            if (" " in name and name in lowered) or name in words:
+                return key
+    return None
+
+
+def _drug_name(medication: str) -> str:
+    """Return the drug name without dose and schedule ("Metformin 500mg BID" → "Metformin")."""
+    name = re.split(r"\s+\d", medication.strip(), maxsplit=1)[0]
+    return name.strip(" ,;-") or medication.strip()
+
+
+def _row_name(names: list[str], key: str) -> str:
+    label = CLASS_LABELS[key]
+    joined = ", ".join(dict.fromkeys(names))
+    return f"{joined} ({label})" if label and label.lower() not in joined.lower() else joined
+
+
+def _apply_metformin_rules(row: Dict[str, str], contrast: bool, egfr: Optional[float]) -> None:
+    if egfr is not None and egfr < 30:
+        row.update({
+            "continue": "",
+            "hold": "Discontinue (eGFR < 30)",
+            "restart": "Do not restart while eGFR < 30",
+            "owner": "Nephrology / Endocrinology (KDIGO, FDA labeling)",
+        })
+        return
+    row["hold"] = "Day of surgery (and 48h post-op)" if contrast else "Day of surgery"
+    if contrast:
+        row["restart"] = "eGFR re-checked at 48h and stable, no AKI, contrast risk resolved"
+    if egfr is not None and egfr < 45:
+        row["restart"] += "; resume at 50% dose (max 1000 mg/day) for eGFR 30–44"
+
+
+def build_periop_plan(
+    medications: Iterable[str],
+    contrast: bool = False,
+    urgency: str = "elective",
+    egfr: Optional[float] = None,
+    heart_rate: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Compute the peri-op stoplight rows for a medication list.
+
+    Args:
+        medications: Medication entries as written in the case
+        contrast: Whether iodinated contrast is planned
+        urgency: "elective", "urgent" or "emergent"
+        egfr: Latest eGFR in mL/min/1.73m², if known
+        heart_rate: Resting heart rate in bpm, if known
+
+    Returns:
+        Dict with 'rows' (dicts with 'key', 'name', 'continue', 'hold',
+        'restart', 'owner') and 'unmatched' (medications outside the rules)
+    """
+    grouped: Dict[str, list[str]] = {}
+    unmatched = []
+    for medication in medications:
+        if not medication or not medication.strip():
+            continue
+        key = classify_medication(medication)
+        if key is None:
+            unmatched.append(medication.strip())
+        else:
+            grouped.setdefault(key, []).append(_drug_name(medication))
+
+    urgent = (urgency or "").strip().lower() in URGENT_PROCEDURES
+    rows = []
+    for key in STANDARD_PERIOP_MEDICATIONS:
+        if key not in grouped:
+            continue
+        row = {"key": key, **copy.deepcopy(STANDARD_PERIOP_MEDICATIONS[key])}
+        row["name"] = _row_name(grouped[key], key)
+        if key == "metformin":
+            _apply_metformin_rules(row, contrast, egfr)
+        elif key == "sglt2i" and urgent:
+            row["hold"] = "Hold now (3–4 day washout not possible); monitor ketones"
+        elif key == "glp1ra" and urgent:
+            row["hold"] = "Hold now; manage as full stomach (aspiration risk)"
+        elif key == "beta_blocker" and heart_rate is not None and heart_rate < 50:
+            row.update({"continue": "Conditional", "hold": "Reduce or hold while HR < 50 bpm"})
+        rows.append(row)
+    return {"rows": rows, "unmatched": unmatched}
+
+
+def resolve_conflict(key: Optional[str], actions: list[str], heart_rate: Optional[float] = None) -> Optional[str]:
+    """Apply the mediator's SAFETY OVERRIDES truth table to conflicting advice.
+
+    Args:
+        key: Medication class key (see classify_medication)
+        actions: The specialists' recommended actions for that medication
+        heart_rate: Resting heart rate in bpm, if known
+
+    Returns:
+        The action that wins, or None if no override applies
+    """
+    lowered = [action.lower() for action in actions]
+    holds = [a for a, low in zip(actions, lowered) if low.startswith(("hold", "stop", "discontinue"))]
+    if key == "beta_blocker":
+        if heart_rate is not None and heart_rate < 50:
+            return "Reduce or hold while HR < 50 bpm"
+        return "Continue (avoid abrupt withdrawal)"
+    if key == "sglt2i" and holds:
+        return holds[0]
+    if key == "acei_arb":
+        return "Hold 24h pre-op"
+    return None
+
+
+def periop_medication_plan(
+    medications: list[str],
+    contrast: bool = False,
+    urgency: str = "elective",
+    egfr: Optional[float] = None,
+    tool_context: Optional[ToolContext] = None,
+) -> dict:
+    """Build the peri-operative medication stoplight table for a surgical case.
+
+    Call this whenever surgery or a procedure is planned instead of writing
+    hold/continue rules yourself. The returned rows already apply the
+    peri-op safety overrides and must be used as-is.
+
+    Args:
+        medications: Current medications exactly as listed in the case.
+        contrast: True if iodinated contrast is planned.
+        urgency: Procedure urgency: "elective", "urgent" or "emergent".
+        egfr: Latest eGFR in mL/min/1.73m², or null if not provided.
+
+    Returns:
+        A dict with the markdown 'table' rows, the structured 'rows', and
+        'unmatched' medications that still need specialist judgement.
+    """
+    plan = build_periop_plan(medications, contrast=contrast, urgency=urgency, egfr=egfr)
+    if tool_context is not None:
+        tool_context.state[PERIOP_PLAN_KEY] = plan
+    return {**plan, "table": format_medication_rows(plan["rows"])}
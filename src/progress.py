@@ -0,0 +1,98 @@
+"""Streaming progress for the specialist panel.
+
+With token streaming on (``adk web`` streaming toggle, ``/run_sse`` with
+``"streaming": true``, or RunConfig(streaming_mode=StreamingMode.SSE)) the
+mediator's Consultation Snapshot reaches the client token by token through
+``ckm_panel`` and ``root_agent``. The specialists would stream too, but
+their drafts are internal inputs to the mediator, so ``PanelProgressAgent``:
+1. Emits a progress event per specialist when it starts and when it
+   completes (or is skipped by triage, or reuses its previous assessment
+   after a case update), preceded by the consult's queue position when the
+   model backend is busy (see scheduler.py)
+2. Drops the specialists' partial token chunks; their final assessments
+   still go to the session and state as before
+
+Progress events are partial (never saved to the session or shown to later
+agents). Clients read the text, or the structured payload in
+``event.custom_metadata["ckm_progress"]``:
+{"agent": ..., "specialty": ..., "status": "started"|"completed"|"skipped"|"reused", "seconds": ...}
+The queue event has agent "ckm_panel", status "queued" and also "position"
+and "priority".
+"""
+
+from typing import Any, AsyncGenerator, Optional
+
+from google.adk.agents import ParallelAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.adk.utils.context_utils import Aclosing
+from google.genai import types
+
+from .metrics import consult_metrics
+from .reconsult import RECONSULT_KEY
+from .scheduler import QUEUE_KEY
+from .triage import SPECIALTY_NAMES, TRIAGE_KEY
+
+
+# Event.custom_metadata key of the structured progress payload
+PROGRESS_METADATA_KEY = "ckm_progress"
+
+_PROGRESS_TEXT = {
+    "started": "{specialty} assessment started",
+    "completed": "{specialty} assessment complete ({seconds:.1f}s)",
+    "skipped": "{specialty} not consulted",
+    "reused": "{specialty} assessment unchanged (no relevant case changes)",
+    "queued": "Model server busy: queued at position {position} (priority: {priority})",
+}
+
+
+class PanelProgressAgent(ParallelAgent):
+    """ParallelAgent that reports specialist progress instead of their token streams."""
+
+    def _progress_event(
+        self, ctx: InvocationContext, agent_name: str, status: str, seconds: Optional[float] = None, **details: Any
+    ) -> Event:
+        specialty = SPECIALTY_NAMES.get(agent_name, agent_name)
+        text = _PROGRESS_TEXT[status].format(specialty=specialty, seconds=seconds or 0.0, **details)
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            partial=True,
+            content=types.Content(role="model", parts=[types.Part(text=text + "\n")]),
+            custom_metadata={
+                PROGRESS_METADATA_KEY: {
+                    "agent": agent_name,
+                    "specialty": specialty,
+                    "status": status,
+                    "seconds": seconds,
+                    **details,
+                }
+            },
+        )
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        specialist_names = {agent.name for agent in self.sub_agents}
+        skipped = (ctx.session.state.get(TRIAGE_KEY) or {}).get("skipped", {})
+        reused = (ctx.session.state.get(RECONSULT_KEY) or {}).get("reused", [])
+        queue = ctx.session.state.get(QUEUE_KEY) or {}
+        if queue.get("position"):
+            yield self._progress_event(
+                ctx, "ckm_panel", "queued", position=queue["position"], priority=queue["priority"]
+            )
+        for agent in self.sub_agents:
+            if agent.name not in skipped and agent.name not in reused:
+                yield self._progress_event(ctx, agent.name, "started")
+
+        async with Aclosing(super()._run_async_impl(ctx)) as events:
+            async for event in events:
+                if event.author not in specialist_names:
+                    yield event
+                    continue
+                if event.partial:
+                    continue
+                yield event
+                if event.is_final_response():
+                    status = "skipped" if event.author in skipped else "reused" if event.author in reused else "completed"
+                    seconds = consult_metrics.specialist_finished(ctx.invocation_id, event.author, status)
+                    yield self._progress_event(ctx, event.author, status, seconds)
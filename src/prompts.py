@@ -0,0 +1,124 @@
+"""Composable agent instructions assembled per call from the case flags.
+
+The specialist, mediator and root instructions used to carry every
+protocol on every call: the peri-operative protocol and the peri-op tool
+for a non-surgical medication review, the expansion handling and the
+example stoplight table before any snapshot existed. They are now split
+into prompt modules (core role, peri-op protocol, expansion handling,
+safety overrides), each with an optional condition on the session state.
+The agent's instruction is an ADK instruction provider that joins the
+modules whose condition holds when the model is called.
+
+Peri-op conditions read the ``periop`` flag of the case object (see
+case_parser.py). Before a case exists (an agent run on its own), both the
+peri-op and non-surgical modules are included, plus a note telling the
+model to pick the one the input calls for.
+
+``python -m benchmarks.prompts`` measures every variant in tokens.
+"""
+
+from typing import Any, Callable, Mapping, NamedTuple, Optional, Sequence
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.models import LlmRequest, LlmResponse
+
+from .intake_agent import CASE_KEY
+from .router import PHASE_KEY, PHASE_SNAPSHOT
+
+
+# Tools only declared to the model for peri-op cases
+PERIOP_TOOLS = ("periop_medication_plan",)
+
+PromptCondition = Callable[[Mapping[str, Any]], bool]
+
+
+class PromptModule(NamedTuple):
+    """One section of an agent instruction, included when ``when`` holds (always if None)."""
+
+    name: str
+    text: str
+    when: Optional[PromptCondition] = None
+
+
+def case_unknown(state: Mapping[str, Any]) -> bool:
+    """No case object yet, so the peri-op status is unknown."""
+    return not state.get(CASE_KEY)
+
+
+def periop_case(state: Mapping[str, Any]) -> bool:
+    """The case involves surgery (or is not known yet)."""
+    return case_unknown(state) or (state.get(CASE_KEY) or {}).get("periop") is True
+
+
+def non_periop_case(state: Mapping[str, Any]) -> bool:
+    """No surgery is planned (or the case is not known yet)."""
+    return case_unknown(state) or (state.get(CASE_KEY) or {}).get("periop") is not True
+
+
+def snapshot_phase(state: Mapping[str, Any]) -> bool:
+    """A Consultation Snapshot has been shown and can be expanded."""
+    return state.get(PHASE_KEY) == PHASE_SNAPSHOT
+
+
+def intake_phase(state: Mapping[str, Any]) -> bool:
+    """No snapshot yet: the conversation is in the welcome or intake phase."""
+    return not snapshot_phase(state)
+
+
+def periop_snapshot(state: Mapping[str, Any]) -> bool:
+    """A snapshot of a peri-op case is being expanded."""
+    return snapshot_phase(state) and periop_case(state)
+
+
+# Shown with both peri-op variants when the case is not known yet
+PERIOP_STATUS_UNKNOWN = PromptModule(
+    "periop_status",
+    """## PERI-OPERATIVE STATUS
+The case does not state whether surgery is planned. Apply the PERI-OPERATIVE section only if the input mentions surgery, an operation, a procedure, anesthesia or pre-op clearance; otherwise apply NO SURGERY PLANNED.""",
+    case_unknown,
+)
+
+
+def assemble_instruction(modules: Sequence[PromptModule], state: Mapping[str, Any]) -> str:
+    """Join the modules whose condition holds for the given session state."""
+    return "\n\n".join(module.text for module in modules if module.when is None or module.when(state))
+
+
+def create_instruction(*modules: PromptModule) -> Callable[[ReadonlyContext], str]:
+    """Create an ADK instruction provider assembling the modules for each call.
+
+    Module texts are used as written: unlike a plain string instruction,
+    ADK does not fill {placeholders} from state in a provider's output.
+    """
+
+    def instruction(context: ReadonlyContext) -> str:
+        return assemble_instruction(modules, context.state)
+
+    return instruction
+
+
+def filter_periop_tools(state: Mapping[str, Any], llm_request: LlmRequest) -> None:
+    """Remove the peri-op tool declarations from a request unless the case involves surgery."""
+    if periop_case(state):
+        return
+    for name in PERIOP_TOOLS:
+        llm_request.tools_dict.pop(name, None)
+    config = llm_request.config
+    if config is None or not config.tools:
+        return
+    tools = []
+    for tool in config.tools:
+        declarations = getattr(tool, "function_declarations", None)
+        if declarations:
+            tool.function_declarations = [d for d in declarations if d.name not in PERIOP_TOOLS]
+            if not tool.function_declarations:
+                continue
+        tools.append(tool)
+    config.tools = tools or None
+
+
+def drop_periop_tools(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    """before_model_callback (before the cache lookup): declare peri-op tools only for peri-op cases."""
+    filter_periop_tools(callback_context.state, llm_request)
+    return None
@@ -0,0 +1,181 @@
+"""Incremental re-consultation when the clinician adds details.
+
+After a snapshot, clinicians often add one detail (a fresh eGFR, a
+corrected medication) and confirm again. Instead of rerunning the whole
+panel:
+1. Each specialist declares the case fields its assessment depends on
+   (SHARED_CASE_FIELDS plus SPECIALIST_CASE_FIELDS, including the
+   calculated fields it reads; in a peri-op case also the
+   periop_medication_plan tool arguments)
+2. The updated case is diffed against the case of the previous consult
+3. Only specialists with a changed dependency (or not consulted last time)
+   rerun; the others return their stored assessment without a model call
+4. The mediator runs as usual on the merged set
+
+A reused assessment is checked again against the safety rules with the
+updated case (safety.py), so e.g. a lower eGFR still corrects metformin
+advice that only the nephrologist re-assessed.
+
+A clinician update that the case parser cannot map to any field (free
+text) changes "notes" and reruns every specialist.
+
+Configuration (environment variables):
+- CKM_RECONSULT_DISABLED: set to "1" to always rerun every consulted specialist
+"""
+
+import os
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.lite_llm import LiteLlm
+from google.genai import types
+
+from .assessments import ASSESSMENT_SCHEMAS, parse_specialist_output
+from .case_parser import parse_case_update
+from .intake_agent import CASE_KEY
+from .metrics import consult_metrics
+from .panel_context import PREVIOUS_CONSULT_KEY, case_updates, collect_case_turns
+from .safety import repair_output
+from .triage import TRIAGE_KEY
+
+
+# Session state key holding the latest re-consult plan
+RECONSULT_KEY = "ckm_reconsult"
+
+# Case fields every specialist reads
+SHARED_CASE_FIELDS = ("age", "sex", "primary_question", "diagnoses", "medications", "notes")
+
+# Case fields each specialist's assessment depends on, besides SHARED_CASE_FIELDS
+SPECIALIST_CASE_FIELDS = {
+    "cardiologist": ("ef", "nyha", "nt_probnp", "bnp", "heart_rate", "periop", "procedure", "urgency", "hf_phenotype"),
+    "nephrologist": (
+        "egfr", "creatinine", "uacr", "contrast", "periop", "procedure", "urgency",
+        "egfr_calculated", "ckd_stage", "ckd_risk", "metformin_rule", "sglt2i_rule",
+    ),
+    # Calculated dose bands, so a new eGFR only reruns it when a band changes
+    "diabetologist": ("hba1c", "diabetes_type", "bmi", "periop", "procedure", "urgency", "metformin_rule", "sglt2i_rule", "bmi_class"),
+}
+
+# periop_medication_plan arguments: every specialist passes them in a peri-op case
+PERIOP_TOOL_FIELDS = ("egfr", "contrast", "urgency")
+
+
+def case_dependencies(agent_name: str, case: Mapping[str, Any]) -> set[str]:
+    """Return the case fields a specialist's assessment depends on."""
+    fields = {*SHARED_CASE_FIELDS, *SPECIALIST_CASE_FIELDS[agent_name]}
+    if case.get("periop"):
+        fields.update(PERIOP_TOOL_FIELDS)
+    return fields
+
+
+def diff_cases(old: Mapping[str, Any], new: Mapping[str, Any]) -> List[str]:
+    """Return the fields whose value differs between two case dicts."""
+    return sorted(field for field in {*old, *new} if old.get(field) != new.get(field))
+
+
+def plan_reconsult_for(
+    previous_case: Mapping[str, Any],
+    case: Mapping[str, Any],
+    consulted: Iterable[str],
+    previously_consulted: Iterable[str],
+    free_text_update: bool = False,
+) -> Dict[str, Any]:
+    """Decide which consulted specialists rerun after a case update.
+
+    Args:
+        previous_case: Case of the previous consult
+        case: Updated case
+        consulted: Specialists triage consults now
+        previously_consulted: Specialists consulted (and assessed) last time
+        free_text_update: An update the parser could not map to any field
+
+    Returns:
+        Dict with 'changed_fields', 'rerun' (agent name -> reason) and
+        'reused' (agent names whose stored assessment is still valid)
+    """
+    changed = diff_cases(previous_case, case)
+    if free_text_update and "notes" not in changed:
+        changed.append("notes")
+    previously_consulted = set(previously_consulted)
+    plan: Dict[str, Any] = {"changed_fields": changed, "rerun": {}, "reused": []}
+    for agent_name in consulted:
+        # Peri-op on either side: the tool arguments matter
+        affected = sorted(
+            (case_dependencies(agent_name, previous_case) | case_dependencies(agent_name, case)) & set(changed)
+        )
+        if agent_name not in previously_consulted:
+            plan["rerun"][agent_name] = "not consulted in the previous snapshot"
+        elif affected:
+            plan["rerun"][agent_name] = "changed: " + ", ".join(affected)
+        else:
+            plan["reused"].append(agent_name)
+    return plan
+
+
+def plan_reconsult(callback_context: CallbackContext) -> Optional[types.Content]:
+    """ckm_panel before_agent_callback (after triage): store the re-consult plan.
+
+    The first consult of an intake (or any consult with CKM_RECONSULT_DISABLED=1)
+    reruns every consulted specialist.
+    """
+    state = callback_context.state
+    previous = state.get(PREVIOUS_CONSULT_KEY)
+    updates = case_updates(collect_case_turns(callback_context.session.events), (previous or {}).get("turns"))
+    if updates is None or os.getenv("CKM_RECONSULT_DISABLED") == "1":
+        state[RECONSULT_KEY] = {}
+        return None
+    state[RECONSULT_KEY] = plan_reconsult_for(
+        previous.get("case") or {},
+        state.get(CASE_KEY) or {},
+        consulted=(state.get(TRIAGE_KEY) or {}).get("consulted", {}),
+        previously_consulted=previous.get("consulted") or [],
+        free_text_update=any(not parse_case_update(turn)[0] for turn in updates),
+    )
+    return None
+
+
+def remember_consult(callback_context: CallbackContext) -> Optional[types.Content]:
+    """ckm_panel after_agent_callback: keep the case the panel just assessed."""
+    state = callback_context.state
+    previous = state.get(PREVIOUS_CONSULT_KEY) or {}
+    turns = collect_case_turns(callback_context.session.events)
+    same_intake = case_updates(turns, previous.get("intake_turns")) is not None
+    state[PREVIOUS_CONSULT_KEY] = {
+        "case": dict(state.get(CASE_KEY) or {}),
+        "turns": turns,
+        "intake_turns": previous["intake_turns"] if same_intake else turns,
+        "consulted": list((state.get(TRIAGE_KEY) or {}).get("consulted", {})),
+    }
+    return None
+
+
+def create_assessment_reuse(
+    output_key: str, model: Optional[LiteLlm] = None
+) -> Callable[[CallbackContext], Any]:
+    """Create a specialist before_agent_callback returning its stored assessment.
+
+    When the re-consult plan reuses this specialist, its previous
+    assessment (from output_key) is checked against the safety rules for
+    the updated case and returned as the agent's answer, so the model is
+    not called.
+
+    Args:
+        output_key: State key of the specialist's assessment
+        model: The specialist's model, used for focused safety re-prompts
+    """
+
+    async def reuse_assessment(callback_context: CallbackContext) -> Optional[types.Content]:
+        state = callback_context.state
+        agent_name = callback_context.agent_name
+        text = state.get(output_key)
+        if agent_name not in (state.get(RECONSULT_KEY) or {}).get("reused", []) or not text:
+            return None
+        data = parse_specialist_output(agent_name, text).model_dump()
+        violations = await repair_output(agent_name, data, state.get(CASE_KEY) or {}, model)
+        if violations:
+            consult_metrics.safety_violations(callback_context.invocation_id, agent_name, violations)
+        text = ASSESSMENT_SCHEMAS[agent_name].model_validate(data).model_dump_json()
+        return types.Content(role="model", parts=[types.Part(text=text)])
+
+    return reuse_assessment
+
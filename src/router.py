@@ -0,0 +1,130 @@
+"""Deterministic routing for control replies in the CKM consultation portal.
+
+Most turns in a consultation need the model, but a handful never do:
+1. The first turn of a new session (static welcome message)
+2. Mode selection replies ("1" guided intake, "2" paste mode)
+3. Expansion replies after a snapshot ("A", "B", "C", "Back")
+
+This module holds the small state machine that recognises those turns so
+the agents' ``before_model_callback`` hooks can answer them (or transfer
+to the right sub-agent) without an LLM round trip.
+"""
+
+from typing import Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
+
+
+# Session state key holding the current consultation phase
+PHASE_KEY = "ckm_phase"
+
+# Consultation phases
+PHASE_AWAITING_MODE = "awaiting_mode"
+PHASE_GUIDED_INTAKE = "guided_intake"
+PHASE_PASTE_INTAKE = "paste_intake"
+PHASE_SNAPSHOT = "snapshot"
+
+# Control replies recognised by the router
+MODE_REPLIES = {"1": PHASE_GUIDED_INTAKE, "2": PHASE_PASTE_INTAKE}
+EXPANSION_REPLIES = {"a", "b", "c", "back"}
+
+# Routing decisions
+ROUTE_WELCOME = "welcome"
+ROUTE_INTAKE = "intake"
+ROUTE_EXPANSION = "expansion"
+ROUTE_MODEL = "model"
+
+
+def normalize_control_reply(text: Optional[str]) -> str:
+    """Normalize a user reply for control-token matching.
+
+    Strips whitespace, markdown emphasis, quotes and trailing punctuation,
+    so that "**A**", "'b'" and "Back." all match their control token.
+
+    Args:
+        text: Raw user message text
+
+    Returns:
+        Lower-cased reply stripped of decoration
+    """
+    if not text:
+        return ""
+    return text.strip().strip("*_`'\"").strip().rstrip(".!").strip().lower()
+
+
+def get_user_text(content: Optional[types.Content]) -> str:
+    """Extract the concatenated text parts of a user message."""
+    if not content or not content.parts:
+        return ""
+    return "".join(part.text for part in content.parts if part.text)
+
+
+def classify_turn(phase: Optional[str], reply: str) -> str:
+    """Decide how a root-level turn should be handled.
+
+    Args:
+        phase: Current consultation phase from session state (None for a new session)
+        reply: Normalized user reply (see normalize_control_reply)
+
+    Returns:
+        One of ROUTE_WELCOME, ROUTE_INTAKE, ROUTE_EXPANSION or ROUTE_MODEL
+    """
+    if phase is None:
+        return ROUTE_WELCOME
+    if phase in (PHASE_AWAITING_MODE, PHASE_SNAPSHOT) and reply in MODE_REPLIES:
+        # After a snapshot, a mode choice starts the intake of another patient
+        return ROUTE_INTAKE
+    if phase == PHASE_SNAPSHOT and reply in EXPANSION_REPLIES:
+        return ROUTE_EXPANSION
+    return ROUTE_MODEL
+
+
+def text_response(text: str) -> LlmResponse:
+    """Build a model response carrying static text."""
+    return LlmResponse(
+        content=types.Content(role="model", parts=[types.Part(text=text)])
+    )
+
+
+def transfer_response(agent_name: str, text: Optional[str] = None) -> LlmResponse:
+    """Build a model response that transfers control to another agent.
+
+    The response carries the same ``transfer_to_agent`` function call the
+    model would have emitted, so ADK performs the handoff as usual.
+
+    Args:
+        agent_name: Name of the agent to transfer to
+        text: Optional text shown before the handoff
+    """
+    parts = [types.Part(text=text)] if text else []
+    parts.append(
+        types.Part(
+            function_call=types.FunctionCall(
+                name="transfer_to_agent",
+                args={"agent_name": agent_name},
+            )
+        )
+    )
+    return LlmResponse(content=types.Content(role="model", parts=parts))
+
+
+def route_expansion_reply(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """Send expansion replies straight to the expansion handler.
+
+    After a consultation the next user turn is picked up by the last
+    transferable agent (usually intake_coordinator), so sub-agents that can
+    receive it use this callback to forward "A"/"B"/"C"/"Back", and to hand
+    a new mode choice ("1"/"2") back to the root agent, which starts the
+    new intake.
+    """
+    reply = normalize_control_reply(get_user_text(callback_context.user_content))
+    route = classify_turn(callback_context.state.get(PHASE_KEY), reply)
+    if route == ROUTE_EXPANSION:
+        return transfer_response("expansion_handler")
+    if route == ROUTE_INTAKE:
+        return transfer_response("ckm_root_agent")
+    return None
@@ -0,0 +1,472 @@
+"""Post-generation safety validation of specialist and mediator outputs.
+
+The mediator's SAFETY OVERRIDES and the nephrologist's metformin eGFR
+thresholds used to be enforced only by prompt text, so a model breaking
+them meant rerunning the whole panel. This module checks every final
+specialist assessment and snapshot against the rules in code:
+- sglt2i_hyperkalemia: SGLT2 inhibitors are not listed as causing hyperkalemia
+- metformin_egfr: metformin is discontinued at eGFR < 30 and reduced to 50%
+  (max 1000 mg/day) at eGFR 30–44
+- beta_blocker_periop: beta-blockers are not held peri-operatively (unless
+  HR < 50 bpm, see periop_rules.resolve_conflict)
+
+An offending line is patched deterministically where possible (verb
+rewritten, medication entry replaced, a lone SGLT2i hyperkalemia claim
+removed). Only when no patch is possible (e.g. a hyperkalemia risk naming
+SGLT2i alongside ACEi/ARB) is the same agent's model re-prompted, for that
+one line only, with a short focused prompt. A line that is still unsafe
+afterwards is dropped.
+
+Violations are logged and recorded per consult in metrics.py with their
+outcome: "patched", "reprompted" or "dropped".
+
+Configuration (environment variables):
+- CKM_SAFETY_REPROMPT: set to "0" to drop unpatchable lines without re-prompting
+"""
+
+import json
+import logging
+import os
+import re
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.models.lite_llm import LiteLlm
+from google.genai import types
+from pydantic import ValidationError
+
+from .assessments import ASSESSMENT_SCHEMAS, MedicationRecommendation, parse_specialist_output
+from .intake_agent import CASE_KEY
+from .metrics import consult_metrics
+from .periop_rules import MEDICATION_CLASSES, classify_medication, resolve_conflict
+from .snapshot import NextStep, SnapshotFields, parse_snapshot_fields
+from .triage import SPECIALTY_NAMES
+
+
+logger = logging.getLogger(__name__)
+
+# Rule name -> statement used in logs and focused re-prompts
+SAFETY_RULES = {
+    "sglt2i_hyperkalemia": "SGLT2 inhibitors do not cause hyperkalemia; never list them as a hyperkalemia cause.",
+    "metformin_egfr": (
+        "Metformin: continue at eGFR >= 45, reduce to 50% (max 1000 mg/day) at eGFR 30-44, "
+        "discontinue at eGFR < 30."
+    ),
+    "beta_blocker_periop": (
+        "Continue beta-blockers peri-operatively and avoid abrupt withdrawal; "
+        "reduce or hold only while HR < 50 bpm."
+    ),
+}
+
+# Check results other than a patched line
+_DROP = "drop"            # remove the line (list items) or clear it (single fields)
+_UNPATCHABLE = "reprompt"  # only the model can rewrite the line
+
+
+def _drug_pattern(key: str, *extra: str) -> str:
+    names = sorted([*MEDICATION_CLASSES[key], *extra], key=len, reverse=True)
+    return r"\b(?:" + "|".join(re.escape(name) for name in names) + r")(?:i|is|s)?\b"
+
+
+_METFORMIN = _drug_pattern("metformin")
+_BETA_BLOCKER = _drug_pattern("beta_blocker", "β-blocker")
+_HAS_SGLT2I = re.compile(_drug_pattern("sglt2i", "sglt2 inhibitor", "sglt-2 inhibitor", "sglt-2"), re.I)
+_HAS_METFORMIN = re.compile(_METFORMIN, re.I)
+_HAS_BETA_BLOCKER = re.compile(_BETA_BLOCKER, re.I)
+
+_HYPERKALEMIA = re.compile(r"\bhyperkal\w*|\b(?:high|elevated|raised|rising)\s+(?:serum\s+)?(?:potassium|K\+?)(?!\w)", re.I)
+# "SGLT2i lower hyperkalemia risk" is a true statement: a lowering or negating word
+# at most three words before the hyperkalemia mention, in the same clause
+_LOWERS_RISK = re.compile(
+    r"\b(?:reduc\w*|lower\w*|decreas\w*|mitigat\w*|protect\w*|prevent\w*|not|no|without)\b(?:\W+\w+){0,3}\W*$", re.I
+)
+_OTHER_POTASSIUM_CAUSES = re.compile(
+    _drug_pattern("acei_arb")
+    + r"|\b(?:raas|mra|spironolactone|eplerenone|finerenone|potassium[- ]sparing|trimethoprim|nsaids?|heparin|ckd)\b",
+    re.I,
+)
+
+_NEGATED = re.compile(r"\b(?:not|never|don't|avoid)\s+(?:\w+\s+)?$", re.I)
+_STOPPED = re.compile(r"\b(?:stop\w*|discontinu\w*|hold\w*|held|avoid\w*|contraindicat\w*)\b", re.I)
+_REDUCED = re.compile(r"\b(?:reduc\w*|half|lower\w*|renal\w*|dose[- ]adjust\w*)\b|50\s*%|1000\s*mg", re.I)
+_CONDITIONAL_HOLD = re.compile(r"\b(?:HR|heart rate|brady\w*|hypotens\w*)\b", re.I)
+_CLAUSES = re.compile(r"\s*(?:[;,]|\s[—–-]\s)\s*")
+
+# The whole continue clause, e.g. "Continue metformin until the day before"
+_CONTINUE_METFORMIN = re.compile(
+    r"\b(?:continu|keep|resum|restart|maintain)\w*\s+(?:the\s+|full[- ]dose\s+)?(?P<drug>" + _METFORMIN + r")(?P<rest>[^;,.]*)",
+    re.I,
+)
+# Dose-first form, e.g. "Metformin 500mg daily, no change"
+_METFORMIN_DOSE_UNCHANGED = re.compile(
+    r"(?P<drug>" + _METFORMIN + r")\s+\d[^;.]*?\b(?:no change|unchanged|same dose|as before|continu\w*)\b(?P<rest>[^;,.]*)",
+    re.I,
+)
+_METFORMIN_CONTINUED = re.compile(_METFORMIN + r"\W+(?:\w+\W+){0,3}?\b(?:continu\w*|full[- ]dose|unchanged)", re.I)
+# Clauses sequenced after a continue clause ("…, then hold"), replaced with it when metformin is stopped
+_THEN_CLAUSES = re.compile(r"(?:\s*[,;]\s*(?:and\s+)?then\b[^;,.]*)*", re.I)
+# Timing kept after a dose reduction ("… until the day before")
+_TIMING = re.compile(r"\s+(?:until|till|through|before|after|up to)\b", re.I)
+_HOLD_BETA_BLOCKER = re.compile(
+    r"\b(?:hold|stop|discontinue|withhold|suspend)\w*\s+(?:the\s+)?(?P<drug>" + _BETA_BLOCKER + ")", re.I
+)
+_BETA_BLOCKER_HELD = re.compile(
+    _BETA_BLOCKER
+    + r"(?:\s*[:—–-]\s*|\s+(?:(?:is|be|should|must|to|being|was|were|will|temporarily)\s+){0,3})"
+    + r"(?P<verb>held|hold|stopped|stop|discontinued|discontinue|withheld|withhold)\b",
+    re.I,
+)
+
+_HOLD_ACTIONS = ("hold", "stop", "discontinu", "withh", "suspend", "avoid")
+_CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def _case_egfr(case: Mapping[str, Any]) -> Any:
+    """The reported eGFR, else the one calculated from creatinine (calculators.py)."""
+    return case.get("egfr", case.get("egfr_calculated"))
+
+
+def _metformin_limit(case: Mapping[str, Any]) -> Optional[str]:
+    """Return "stop" (eGFR < 30), "reduce" (eGFR 30–44) or None."""
+    egfr = _case_egfr(case)
+    if not isinstance(egfr, (int, float)):
+        return None
+    if egfr < 30:
+        return "stop"
+    return "reduce" if egfr < 45 else None
+
+
+def _beta_blocker_must_continue(case: Mapping[str, Any]) -> bool:
+    if not case.get("periop"):
+        return False
+    return resolve_conflict("beta_blocker", [], case.get("heart_rate")).startswith("Continue")
+
+
+def _claims_hyperkalemia(text: str) -> bool:
+    """True when a hyperkalemia mention is not negated or lowered right before it.
+
+    >>> _claims_hyperkalemia("Empagliflozin may cause hyperkalemia, no dose change needed")
+    True
+    >>> _claims_hyperkalemia("Empagliflozin does not cause hyperkalemia")
+    False
+    >>> _claims_hyperkalemia("SGLT2i lower the risk of hyperkalemia")
+    False
+    """
+    return any(
+        not _LOWERS_RISK.search(_CLAUSES.split(text[: match.start()])[-1]) for match in _HYPERKALEMIA.finditer(text)
+    )
+
+
+def _claims_sglt2i_hyperkalemia(text: str) -> bool:
+    """True when one clause names an SGLT2 inhibitor and claims hyperkalemia.
+
+    >>> _claims_sglt2i_hyperkalemia("Hyperkalemia from lisinopril; empagliflozin without hyperkalemia risk")
+    False
+    """
+    return any(_HAS_SGLT2I.search(clause) and _claims_hyperkalemia(clause) for clause in _CLAUSES.split(text))
+
+
+def _replace(text: str, start: int, end: int, replacement: str) -> str:
+    if start == 0:
+        replacement = replacement[:1].upper() + replacement[1:]
+    return text[:start] + replacement + text[end:]
+
+
+def _check_sglt2i_text(text: str, case: Mapping[str, Any]) -> Optional[str]:
+    if not _claims_sglt2i_hyperkalemia(text):
+        return None
+    # A claim also naming drugs that do raise potassium cannot simply be removed
+    return _UNPATCHABLE if _OTHER_POTASSIUM_CAUSES.search(text) else _DROP
+
+
+def _check_metformin_text(text: str, case: Mapping[str, Any]) -> Optional[str]:
+    """Rewrite a clause continuing metformin past its eGFR limit.
+
+    >>> _check_metformin_text("Continue metformin until day before, then hold", {"egfr": 25})
+    'Discontinue metformin'
+    >>> _check_metformin_text("Continue metformin until day before, then hold", {"egfr": 40})
+    'Reduce metformin to 50% (max 1000 mg/day) until day before, then hold'
+    >>> _check_metformin_text("Metformin 500mg daily, no change", {"egfr": 25})
+    'Discontinue Metformin'
+    """
+    limit = _metformin_limit(case)
+    if limit is None or not _HAS_METFORMIN.search(text):
+        return None
+    if limit == "reduce" and _REDUCED.search(text):
+        return None
+    match = _CONTINUE_METFORMIN.search(text)
+    if not match or _NEGATED.search(text[: match.start()]):
+        match = _METFORMIN_DOSE_UNCHANGED.search(text)
+        if match and _STOPPED.search(match.group(0)):
+            match = None
+    if match:
+        drug = match.group("drug")
+        if limit == "stop":
+            return _replace(text, match.start(), _THEN_CLAUSES.match(text, match.end()).end(), f"discontinue {drug}")
+        timing = match.group("rest") if _TIMING.match(match.group("rest")) else ""
+        return _replace(text, match.start(), match.end(), f"reduce {drug} to 50% (max 1000 mg/day){timing}")
+    if _STOPPED.search(text) or not _METFORMIN_CONTINUED.search(text):
+        return None
+    return _UNPATCHABLE
+
+
+def _check_beta_blocker_text(text: str, case: Mapping[str, Any]) -> Optional[str]:
+    if not _beta_blocker_must_continue(case) or not _HAS_BETA_BLOCKER.search(text):
+        return None
+    if _CONDITIONAL_HOLD.search(text):
+        return None
+    match = _HOLD_BETA_BLOCKER.search(text)
+    if match and not _NEGATED.search(text[: match.start()]):
+        return _replace(text, match.start(), match.start("drug"), "continue ")
+    match = _BETA_BLOCKER_HELD.search(text)
+    if match and not _NEGATED.search(text[: match.start("verb")]):
+        verb = match.group("verb").lower()
+        return _replace(text, match.start("verb"), match.end("verb"), "continued" if verb.endswith("d") else "continue")
+    return None
+
+
+# Text checks in the order they are applied: rule -> check(text, case)
+_TEXT_CHECKS: Dict[str, Callable[[str, Mapping[str, Any]], Optional[str]]] = {
+    "sglt2i_hyperkalemia": _check_sglt2i_text,
+    "metformin_egfr": _check_metformin_text,
+    "beta_blocker_periop": _check_beta_blocker_text,
+}
+
+
+def patch_text(text: str, case: Mapping[str, Any]) -> Tuple[str, List[str]]:
+    """Apply the safety rules to one line of text.
+
+    Args:
+        text: A finding, risk, action or snapshot line
+        case: Compiled case dict (egfr or egfr_calculated, periop, heart_rate are used)
+
+    Returns:
+        (patched text, "drop" or "reprompt"; rules the line broke)
+    """
+    rules = []
+    for rule, check in _TEXT_CHECKS.items():
+        result = check(text, case)
+        if result is None:
+            continue
+        rules.append(rule)
+        if result in (_DROP, _UNPATCHABLE):
+            return result, rules
+        text = result
+    return text, rules
+
+
+def patch_medication(item: Dict[str, Any], case: Mapping[str, Any]) -> Tuple[Any, List[str]]:
+    """Apply the safety rules to one medication recommendation.
+
+    Without a reported eGFR, the eGFR calculated from creatinine is used:
+
+    >>> case = {"creatinine": 2.6, "age": 78, "sex": "F", "egfr_calculated": 18.0}
+    >>> patch_medication({"medication": "Metformin", "action": "Continue", "detail": ""}, case)
+    ({'medication': 'Metformin', 'action': 'Stop', 'detail': 'eGFR < 30 — discontinue (KDIGO/FDA)'}, ['metformin_egfr'])
+
+    Returns:
+        (patched item dict or "reprompt"; rules the entry broke)
+    """
+    key = classify_medication(item.get("medication") or "")
+    action = (item.get("action") or "").strip().lower()
+    detail = item.get("detail") or ""
+    held = action.startswith(_HOLD_ACTIONS)
+
+    if key == "metformin":
+        limit = _metformin_limit(case)
+        if limit == "stop" and not held:
+            return {**item, "action": "Stop", "detail": "eGFR < 30 — discontinue (KDIGO/FDA)"}, ["metformin_egfr"]
+        if limit == "reduce" and action.startswith(("continue", "start")) and not _REDUCED.search(detail):
+            return {**item, "action": "Adjust", "detail": "eGFR 30–44 — reduce to 50% (max 1000 mg/day)"}, ["metformin_egfr"]
+    elif key == "beta_blocker" and held and _beta_blocker_must_continue(case) and not _CONDITIONAL_HOLD.search(detail):
+        return {**item, "action": "Continue", "detail": "Continue peri-op; avoid abrupt withdrawal"}, ["beta_blocker_periop"]
+    elif key == "sglt2i" and _claims_hyperkalemia(detail):
+        kept = [clause for clause in _CLAUSES.split(detail) if clause and not _HYPERKALEMIA.search(clause)]
+        if held and not kept and not case.get("periop"):
+            # Hyperkalemia was the only reason given for stopping it
+            return _UNPATCHABLE, ["sglt2i_hyperkalemia"]
+        return {**item, "detail": "; ".join(kept)}, ["sglt2i_hyperkalemia"]
+
+    patched, rules = patch_text(detail, case) if detail else (detail, [])
+    if rules:
+        return (_UNPATCHABLE if patched in (_DROP, _UNPATCHABLE) else {**item, "detail": patched}), rules
+    return item, []
+
+
+def _patch_line(section: str, value: Any, case: Mapping[str, Any]) -> Tuple[Any, List[str]]:
+    if section == "medications":
+        return patch_medication(value, case)
+    if section == "next_steps":
+        patched, rules = patch_text(value.get("action") or "", case)
+        if patched in (_DROP, _UNPATCHABLE):
+            return patched, rules
+        return ({**value, "action": patched} if rules else value), rules
+    return patch_text(value, case)
+
+
+def _lines(agent_name: str, data: Dict[str, Any]) -> Iterator[Tuple[str, Optional[int], Any]]:
+    """Yield (section, list index or None, value) for every checked line."""
+    if agent_name in ASSESSMENT_SCHEMAS:
+        single = [*ASSESSMENT_SCHEMAS[agent_name].classification_fields(), "notes"]
+        lists = ("key_findings", "medications", "risks", "actions")
+    else:
+        single = ["one_line_problem", "decisions_needed"]
+        lists = ("key_facts", "key_risks", "next_steps")
+    for section in single:
+        if data.get(section):
+            yield section, None, data[section]
+    for section in lists:
+        for index, value in enumerate(data.get(section) or []):
+            yield section, index, value
+
+
+async def _reprompt_line(
+    model: LiteLlm, agent_name: str, section: str, value: Any, rule: str, case: Mapping[str, Any]
+) -> Optional[Any]:
+    """Ask the agent's model to rewrite one line; None if the reply is unusable or still unsafe."""
+    values = {"eGFR": _case_egfr(case), "peri-operative:": case.get("periop"), "HR": case.get("heart_rate")}
+    facts = "; ".join(
+        f"{label} {({True: 'yes', False: 'no'}.get(value, value))}" for label, value in values.items() if value is not None
+    )
+    instruction = (
+        f"You correct one line of a {SPECIALTY_NAMES.get(agent_name, 'Consultation Snapshot')} note "
+        f"that breaks a safety rule.\nRule: {SAFETY_RULES[rule]}\nPatient: {facts or 'no further data'}\n"
+        "Reply with ONLY the corrected line as JSON of the same shape. Change nothing else. "
+        "Reply null if the line should be removed."
+    )
+    request = LlmRequest(
+        model=model.model,
+        contents=[types.Content(role="user", parts=[types.Part(text=json.dumps({section: value}, ensure_ascii=False))])],
+        config=types.GenerateContentConfig(system_instruction=instruction),
+    )
+    text = ""
+    try:
+        async for response in model.generate_content_async(request):
+            if response.content and response.content.parts:
+                text = "".join(part.text or "" for part in response.content.parts if not part.thought)
+        reply = json.loads(_CODE_FENCE.sub("", text.strip()))
+    except Exception as exc:  # a failed repair must never fail the consult
+        logger.warning("Safety re-prompt of %s.%s failed: %s", agent_name, section, exc)
+        return None
+    if isinstance(reply, dict) and set(reply) == {section}:
+        reply = reply[section]
+    if reply is None:
+        return _DROP
+    try:
+        if section == "medications":
+            reply = MedicationRecommendation.model_validate(reply).model_dump()
+        elif section == "next_steps":
+            reply = NextStep.model_validate(reply).model_dump()
+        elif not isinstance(reply, str):
+            return None
+    except ValidationError:
+        return None
+    patched, rules = _patch_line(section, reply, case)
+    return None if patched in (_DROP, _UNPATCHABLE) else patched
+
+
+async def repair_output(
+    agent_name: str,
+    data: Dict[str, Any],
+    case: Mapping[str, Any],
+    model: Optional[LiteLlm] = None,
+) -> List[Dict[str, Any]]:
+    """Check a specialist assessment or snapshot and repair it in place.
+
+    Args:
+        agent_name: Specialist agent name, or "mediator" for snapshot fields
+        data: Assessment or snapshot fields as a dict (model_dump())
+        case: Compiled case dict
+        model: Model used to re-prompt unpatchable lines (None: drop them)
+
+    Returns:
+        One {'rule', 'section', 'outcome'} dict per violation
+    """
+    reprompt = model is not None and os.getenv("CKM_SAFETY_REPROMPT", "1") != "0"
+    violations: List[Dict[str, Any]] = []
+    dropped: List[Tuple[str, Optional[int]]] = []
+    for section, index, value in list(_lines(agent_name, data)):
+        patched, rules = _patch_line(section, value, case)
+        if not rules:
+            continue
+        outcome = "patched"
+        if patched == _UNPATCHABLE:
+            patched = await _reprompt_line(model, agent_name, section, value, rules[-1], case) if reprompt else None
+            outcome = "reprompted" if patched not in (None, _DROP) else "dropped"
+            patched = _DROP if patched is None else patched
+        for rule in rules:
+            logger.warning("%s broke safety rule %s in %s (%s): %r", agent_name, rule, section, outcome, value)
+            violations.append({"rule": rule, "section": section, "outcome": outcome})
+        if patched == _DROP:
+            dropped.append((section, index))
+        elif index is None:
+            data[section] = patched
+        else:
+            data[section][index] = patched
+    # Later indexes first so earlier ones stay valid
+    for section, index in sorted(dropped, key=lambda item: -1 if item[1] is None else item[1], reverse=True):
+        if index is None:
+            data[section] = ""
+        else:
+            del data[section][index]
+    return violations
+
+
+def _case(callback_context: CallbackContext) -> Mapping[str, Any]:
+    return callback_context.state.get(CASE_KEY) or {}
+
+
+def snapshot_line_is_safe(callback_context: CallbackContext, section: str, value: Any) -> bool:
+    """Whether a streamed snapshot line breaks none of the safety rules.
+
+    The mediator's snapshot renderer leaves failing lines out of partial
+    chunks (snapshot.create_snapshot_renderer); the final reply is then
+    repaired by the validator below.
+    """
+    return not _patch_line(section, value, _case(callback_context))[1]
+
+
+def create_safety_validator(
+    agent_name: str, model: Optional[LiteLlm] = None
+) -> Callable[[CallbackContext, LlmResponse], Any]:
+    """Create an after_model_callback enforcing the safety rules on an agent's answer.
+
+    Register it after the specialist's assessment validator, or before the
+    mediator's snapshot renderer: it reads the final JSON answer and, when a
+    rule is broken, rewrites it in place with the repaired JSON so the
+    renderer, result cache and output_key only see the safe version.
+    Partial chunks and tool calls pass through untouched (the snapshot
+    renderer filters streamed lines with snapshot_line_is_safe).
+
+    Args:
+        agent_name: Specialist agent name, or "mediator"
+        model: The agent's model, used for focused re-prompts
+    """
+
+    async def validate_safety(callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+        content = llm_response.content
+        if llm_response.partial or not content or not content.parts:
+            return None
+        if any(part.function_call for part in content.parts):
+            return None
+        text = "".join(part.text or "" for part in content.parts if not part.thought)
+        if not text.strip():
+            return None
+        if agent_name in ASSESSMENT_SCHEMAS:
+            schema = ASSESSMENT_SCHEMAS[agent_name]
+            parsed = parse_specialist_output(agent_name, text)
+        else:
+            schema = SnapshotFields
+            parsed = parse_snapshot_fields(text)
+            if parsed is None:
+                return None
+        data = parsed.model_dump()
+        violations = await repair_output(agent_name, data, _case(callback_context), model)
+        if violations:
+            consult_metrics.safety_violations(callback_context.invocation_id, agent_name, violations)
+            repaired = schema.model_validate(data).model_dump_json()
+            llm_response.content = types.Content(role="model", parts=[types.Part(text=repaired)])
+        return None
+
+    return validate_safety
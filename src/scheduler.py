@@ -0,0 +1,348 @@
+"""Urgency-aware admission control and request scheduling in front of Ollama.
+
+Each consult sends up to four requests (three specialists in parallel, then
+the mediator) to one Ollama instance, which serves OLLAMA_NUM_PARALLEL of
+them at a time and queues the rest first come, first served. With several
+clinicians submitting at once, an elective pre-op review could hold up an
+emergent case. Instead:
+1. Every Ollama request from the model registry waits for a slot of its
+   backend's scheduler (concurrency matched to OLLAMA_NUM_PARALLEL)
+2. Waiting requests are served by priority, then in arrival order. Priority
+   comes from the procedure urgency answered in the guided intake
+   (emergent > urgent > not stated > elective); intake and expansion
+   requests use "not stated"
+3. The queue is bounded: a consult whose model requests would not fit in
+   it is rejected at once with a retry message, and a request waiting
+   longer than the queue timeout fails instead of waiting indefinitely.
+   Requests of admitted consults skip the queue bound and wait up to the
+   longer admitted timeout (default models.REQUEST_TIMEOUT) before failing
+   the same way. Other requests are checked one by one. Emergent consults
+   are never rejected at admission
+4. An admitted consult that has to wait is told its queue position (a
+   progress event when streaming, see progress.py)
+
+Queue depth, wait time and rejections are reported by
+request_scheduler.stats() and, per consult, in metrics.py.
+
+Configuration (environment variables):
+- CKM_SCHEDULER_DISABLED: set to "1" to send requests straight to the backend
+- CKM_SCHEDULER_CONCURRENCY: requests in flight per backend (default OLLAMA_NUM_PARALLEL, else 4)
+- CKM_SCHEDULER_MAX_QUEUE: waiting requests per backend (default 32)
+- CKM_SCHEDULER_QUEUE_TIMEOUT_SECONDS: longest wait for a slot outside an admitted consult (default 120)
+- CKM_SCHEDULER_ADMITTED_TIMEOUT_SECONDS: longest wait for a slot of an admitted consult (default 600)
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.lite_llm import LiteLlm
+from google.genai import types
+
+from .intake_agent import CASE_KEY
+from .metrics import consult_metrics
+from .models import REQUEST_TIMEOUT, model_backends
+from .reconsult import RECONSULT_KEY
+from .triage import TRIAGE_KEY
+
+
+# Session state key holding the latest consult's admission (priority, queue position)
+QUEUE_KEY = "ckm_queue"
+
+# Lower is served first
+PRIORITY_EMERGENT, PRIORITY_URGENT, PRIORITY_ROUTINE, PRIORITY_ELECTIVE = range(4)
+
+PRIORITY_NAMES = {
+    PRIORITY_EMERGENT: "emergent",
+    PRIORITY_URGENT: "urgent",
+    PRIORITY_ROUTINE: "not stated",
+    PRIORITY_ELECTIVE: "elective",
+}
+
+# Urgency answers (case_parser "urgency") -> priority
+URGENCY_PRIORITY = {
+    "emergent": PRIORITY_EMERGENT,
+    "emergency": PRIORITY_EMERGENT,
+    "urgent": PRIORITY_URGENT,
+    "elective": PRIORITY_ELECTIVE,
+}
+
+# (priority, invocation id) of the model requests made in the current task
+_request_tag: ContextVar[Tuple[int, Optional[str]]] = ContextVar("ckm_request_tag", default=(PRIORITY_ROUTINE, None))
+
+
+class SchedulerOverloaded(RuntimeError):
+    """A request was rejected because its backend queue is full or it waited too long."""
+
+
+def case_priority(case: Mapping[str, Any]) -> int:
+    """Return the scheduling priority of a case from its procedure urgency.
+
+    >>> from src.panel_context import compile_case_text
+    >>> case, _ = compile_case_text(["Pre-op clearance for a 78F", "Hip replacement, emergent, about 2 hours"])
+    >>> case_priority(case) == PRIORITY_EMERGENT
+    True
+    >>> case, _ = compile_case_text(["Pre-op clearance for non-emergent knee surgery"])
+    >>> case_priority(case) == PRIORITY_ROUTINE
+    True
+    """
+    return URGENCY_PRIORITY.get(str(case.get("urgency") or "").strip().lower(), PRIORITY_ROUTINE)
+
+
+def _percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))], 3)
+
+
+class BackendScheduler:
+    """Priority queue and concurrency limit of one model backend.
+
+    Slots belong to the event loop that granted them, so the state is reset
+    when the scheduler is used from another loop (e.g. a second
+    ``asyncio.run`` in batch mode).
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        max_queue: int,
+        queue_timeout: Optional[float],
+        admitted_timeout: Optional[float] = None,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.admitted_timeout = admitted_timeout
+        self.in_flight = 0
+        self._waiting: List[Tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._waits: Deque[float] = deque(maxlen=1000)
+        self.max_queued = 0
+        self.requests = 0
+        self.rejected = 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiting)
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop, self._waiting, self.in_flight = loop, [], 0
+        return loop
+
+    def position(self, priority: int) -> int:
+        """Requests a new request of this priority would wait behind (0 = served at once)."""
+        if self.in_flight < self.concurrency and not self._waiting:
+            return 0
+        return 1 + sum(1 for waiting_priority, _, _ in self._waiting if waiting_priority <= priority)
+
+    def is_full(self, priority: int, requests: int = 1) -> bool:
+        """Whether this many more requests of a priority would overflow the queue."""
+        return priority != PRIORITY_EMERGENT and self.queued + requests > self.max_queue
+
+    async def acquire(self, priority: int, admitted: bool = False) -> float:
+        """Wait for a slot; return the seconds waited.
+
+        Args:
+            priority: Request priority (lower is served first)
+            admitted: The request belongs to a consult that passed admission
+                control, so the queue bound is not checked again and it
+                waits up to admitted_timeout instead of queue_timeout
+
+        Raises:
+            SchedulerOverloaded: Queue full, or no slot within the timeout
+
+        >>> async def admitted_wait(admitted_timeout):
+        ...     backend = BackendScheduler(1, max_queue=0, queue_timeout=0.01, admitted_timeout=admitted_timeout)
+        ...     await backend.acquire(PRIORITY_ROUTINE)
+        ...     waiter = asyncio.ensure_future(backend.acquire(PRIORITY_ELECTIVE, admitted=True))
+        ...     await asyncio.sleep(0.05)
+        ...     backend.release()
+        ...     try:
+        ...         return await waiter > 0.01, backend.rejected
+        ...     except SchedulerOverloaded:
+        ...         return "overloaded", backend.rejected
+        >>> asyncio.run(admitted_wait(1.0))
+        (True, 0)
+        >>> asyncio.run(admitted_wait(0.02))
+        ('overloaded', 1)
+        """
+        loop = self._bind_loop()
+        self.requests += 1
+        if self.in_flight < self.concurrency and not self._waiting:
+            self.in_flight += 1
+            self._waits.append(0.0)
+            return 0.0
+        if not admitted and self.is_full(priority):
+            self.rejected += 1
+            raise SchedulerOverloaded(f"Model backend busy: {self.queued} requests already waiting")
+        started = time.perf_counter()
+        granted = loop.create_future()
+        heapq.heappush(self._waiting, (priority, next(self._order), granted))
+        self.max_queued = max(self.max_queued, self.queued)
+        timeout = self.admitted_timeout if admitted else self.queue_timeout
+        try:
+            await asyncio.wait_for(granted, timeout)
+        except asyncio.TimeoutError:
+            self._discard(granted)
+            self.rejected += 1
+            raise SchedulerOverloaded(f"No model backend slot within {timeout:.0f}s")
+        except asyncio.CancelledError:
+            if granted.done() and not granted.cancelled():
+                self.release()
+            else:
+                self._discard(granted)
+            raise
+        waited = time.perf_counter() - started
+        self._waits.append(waited)
+        return waited
+
+    def _discard(self, granted: asyncio.Future) -> None:
+        self._waiting = [entry for entry in self._waiting if entry[2] is not granted]
+        heapq.heapify(self._waiting)
+
+    def release(self) -> None:
+        """Hand the slot to the first waiting request, or free it."""
+        while self._waiting:
+            _, _, granted = heapq.heappop(self._waiting)
+            if not granted.done():
+                granted.set_result(None)
+                return
+        self.in_flight = max(0, self.in_flight - 1)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = list(self._waits)
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "wait_seconds": {"p50": _percentile(waits, 50), "p95": _percentile(waits, 95), "max": _percentile(waits, 100)},
+        }
+
+
+class RequestScheduler:
+    """One BackendScheduler per model backend (api_base)."""
+
+    def __init__(
+        self,
+        concurrency: int = 4,
+        max_queue: int = 32,
+        queue_timeout: Optional[float] = 120.0,
+        admitted_timeout: Optional[float] = REQUEST_TIMEOUT.read,
+    ):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.admitted_timeout = admitted_timeout
+        self._backends: Dict[str, BackendScheduler] = {}
+
+    @classmethod
+    def from_env(cls) -> "RequestScheduler":
+        """Build a scheduler configured from CKM_SCHEDULER_* environment variables."""
+        timeout = float(os.getenv("CKM_SCHEDULER_QUEUE_TIMEOUT_SECONDS", "120"))
+        admitted_timeout = float(os.getenv("CKM_SCHEDULER_ADMITTED_TIMEOUT_SECONDS") or REQUEST_TIMEOUT.read)
+        return cls(
+            concurrency=int(os.getenv("CKM_SCHEDULER_CONCURRENCY") or os.getenv("OLLAMA_NUM_PARALLEL") or "4"),
+            max_queue=int(os.getenv("CKM_SCHEDULER_MAX_QUEUE", "32")),
+            queue_timeout=timeout if timeout > 0 else None,
+            admitted_timeout=admitted_timeout if admitted_timeout > 0 else None,
+        )
+
+    def for_backend(self, api_base: str) -> BackendScheduler:
+        """Return the scheduler of a backend, creating it on first use."""
+        backend = self._backends.get(api_base)
+        if backend is None:
+            backend = self._backends[api_base] = BackendScheduler(
+                self.concurrency, self.max_queue, self.queue_timeout, self.admitted_timeout
+            )
+        return backend
+
+    async def acquire(self, api_base: str) -> float:
+        """Wait for a slot on a backend at the current request priority; return the seconds waited."""
+        priority, invocation_id = _request_tag.get()
+        waited = await self.for_backend(api_base).acquire(priority, admitted=invocation_id is not None)
+        if invocation_id is not None:
+            consult_metrics.queue_wait(invocation_id, waited)
+        return waited
+
+    def release(self, api_base: str) -> None:
+        self.for_backend(api_base).release()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return queue depth, wait time and rejections per backend."""
+        return {api_base: backend.stats() for api_base, backend in self._backends.items()}
+
+
+# Shared scheduler used by every registry model
+request_scheduler = RequestScheduler.from_env()
+
+
+def scheduling_enabled() -> bool:
+    return os.getenv("CKM_SCHEDULER_DISABLED") != "1"
+
+
+def create_admission_control(models: Iterable[LiteLlm]) -> Callable[[CallbackContext], Optional[types.Content]]:
+    """Create the ckm_panel before_agent_callback admitting or rejecting a consult.
+
+    Runs after start_consult_metrics. The consult's priority applies to the
+    panel's model requests; a rejected consult ends with a retry message
+    and its metrics record is closed.
+
+    Args:
+        models: Models of the panel agents (their backends are checked; a
+            consult is rejected when every backend of one of them is full)
+    """
+    models = list(models)
+
+    def admit_consult(callback_context: CallbackContext) -> Optional[types.Content]:
+        state = callback_context.state
+        invocation_id = callback_context.invocation_id
+        priority = case_priority(state.get(CASE_KEY) or {})
+        _request_tag.set((priority, invocation_id))
+        if not scheduling_enabled():
+            state[QUEUE_KEY] = {}
+            return None
+        # Model calls this consult will make: specialists not reused, then the mediator
+        consulted = (state.get(TRIAGE_KEY) or {}).get("consulted", {})
+        reused = (state.get(RECONSULT_KEY) or {}).get("reused", [])
+        requests = 1 + sum(1 for agent_name in consulted if agent_name not in reused)
+        # Each agent is served by the least busy of its backends
+        candidates = [[request_scheduler.for_backend(api_base) for api_base in model_backends(m)] for m in models]
+        full = [backends[0] for backends in candidates if all(b.is_full(priority, requests) for b in backends)]
+        admission = {
+            "priority": PRIORITY_NAMES[priority],
+            "position": max((min(b.position(priority) for b in backends) for backends in candidates), default=0),
+            "rejected": bool(full),
+        }
+        state[QUEUE_KEY] = admission
+        consult_metrics.admission(invocation_id, admission)
+        if not full:
+            return None
+        _request_tag.set((PRIORITY_ROUTINE, None))
+        consult_metrics.finish(invocation_id)
+        text = (
+            f"The specialist panel is at capacity ({full[0].queued} requests waiting). "
+            "Your case is kept: reply **Confirm** in a minute to run the consultation."
+        )
+        return types.Content(role="model", parts=[types.Part(text=text)])
+
+    return admit_consult
+
+
+def end_admission(callback_context: CallbackContext) -> Optional[types.Content]:
+    """ckm_panel after_agent_callback: later requests of this task use the default priority."""
+    _request_tag.set((PRIORITY_ROUTINE, None))
+    return None
@@ -0,0 +1,453 @@
+"""Persistent SQLite session store for long-running ``adk web`` servers.
+
+With the default in-memory session service, the full transcript of every
+consult (intake turns, three specialist answers, tool calls, snapshot,
+expansions) stays resident until the server restarts, and a restart loses
+consults in progress. This store keeps sessions in a local SQLite file
+instead:
+1. WAL journal mode, so reads (session list, page reloads) do not block the
+   writes of a running consult
+2. Sessions indexed by user and last-activity time, for listing and expiry
+3. Session state (canonical case, specialist assessments, snapshot) is
+   stored once in the sessions row; events are not a second copy of it
+4. Once an invocation is older than the last few, its events are compacted
+   to the clinician's message and the reply shown to them: specialist
+   answers, tool calls and state deltas are dropped (they live in state)
+5. Sessions idle for longer than the TTL are deleted
+
+Only the session loaded for the current request is held in memory, and
+SQLite's page cache is capped, so memory stays flat however many consults
+the server has handled.
+
+Usage (``services.py`` at the repository root registers the ``ckm`` scheme):
+    adk web . --session_service_uri ckm://ckm_sessions.db
+
+Configuration (environment variables):
+- CKM_SESSION_DB: SQLite file used when the URI has no path (default ckm_sessions.db)
+- CKM_SESSION_TTL_SECONDS: idle time before a session is deleted (default 86400, 0 = never)
+- CKM_SESSION_KEEP_INVOCATIONS: most recent invocations kept uncompacted (default 4)
+- CKM_SESSION_MAX_EVENTS: stored events per session (default 200)
+"""
+
+import asyncio
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from google.adk.errors.session_not_found_error import SessionNotFoundError
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session, State
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = "ckm_sessions.db"
+
+# Expired sessions are swept at most this often (seconds)
+_SWEEP_INTERVAL = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    create_time REAL NOT NULL,
+    update_time REAL NOT NULL,
+    PRIMARY KEY (app_name, user_id, id)
+);
+CREATE INDEX IF NOT EXISTS sessions_by_user_activity ON sessions (app_name, user_id, update_time);
+CREATE INDEX IF NOT EXISTS sessions_by_activity ON sessions (update_time);
+CREATE TABLE IF NOT EXISTS events (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    invocation_id TEXT NOT NULL,
+    author TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    compacted INTEGER NOT NULL DEFAULT 0,
+    event_data TEXT NOT NULL,
+    PRIMARY KEY (app_name, user_id, session_id, id),
+    FOREIGN KEY (app_name, user_id, session_id) REFERENCES sessions (app_name, user_id, id) ON DELETE CASCADE
+);
+CREATE TABLE IF NOT EXISTS app_states (
+    app_name TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_states (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (app_name, user_id)
+);
+"""
+
+
+def split_state_delta(delta: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+    """Split a state delta into (app, user, session) parts; temp: keys are dropped.
+
+    The app: and user: prefixes are removed from the keys of their parts.
+    """
+    app: Dict[str, Any] = {}
+    user: Dict[str, Any] = {}
+    session: Dict[str, Any] = {}
+    for key, value in delta.items():
+        if key.startswith(State.APP_PREFIX):
+            app[key[len(State.APP_PREFIX):]] = value
+        elif key.startswith(State.USER_PREFIX):
+            user[key[len(State.USER_PREFIX):]] = value
+        elif not key.startswith(State.TEMP_PREFIX):
+            session[key] = value
+    return app, user, session
+
+
+def compact_event_data(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the compacted form of a stored event, or None to drop it.
+
+    Clinician messages and text replies are kept without their state delta
+    (the values are in the session state); thoughts, tool calls and tool
+    results are dropped.
+    """
+    parts = [
+        part for part in (data.get("content") or {}).get("parts") or []
+        if part.get("text") and not part.get("thought")
+    ]
+    if not parts:
+        return None
+    compacted = {key: data[key] for key in ("id", "invocation_id", "author", "timestamp") if key in data}
+    compacted["content"] = {"role": data["content"].get("role"), "parts": [{"text": part["text"]} for part in parts]}
+    return compacted
+
+
+class CkmSessionService(BaseSessionService):
+    """Session service on a local SQLite file with compaction and idle expiry."""
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_DB_PATH,
+        ttl_seconds: Optional[float] = 86400,
+        keep_invocations: int = 4,
+        max_events: int = 200,
+    ):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.keep_invocations = keep_invocations
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        # auto_vacuum only takes effect before the first table is created
+        self._db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        self._db.execute("PRAGMA foreign_keys = ON")
+        self._db.execute("PRAGMA busy_timeout = 5000")
+        # Bound SQLite's page cache (KiB) and the WAL file left after checkpoints (bytes)
+        self._db.execute("PRAGMA cache_size = -8192")
+        self._db.execute("PRAGMA journal_size_limit = 16777216")
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+        self.purge_expired()
+
+    @classmethod
+    def from_env(cls, db_path: Optional[str] = None) -> "CkmSessionService":
+        """Build a store configured from CKM_SESSION_* environment variables."""
+        ttl = float(os.getenv("CKM_SESSION_TTL_SECONDS", "86400"))
+        return cls(
+            db_path=db_path or os.getenv("CKM_SESSION_DB") or DEFAULT_DB_PATH,
+            ttl_seconds=ttl if ttl > 0 else None,
+            keep_invocations=int(os.getenv("CKM_SESSION_KEEP_INVOCATIONS", "4")),
+            max_events=int(os.getenv("CKM_SESSION_MAX_EVENTS", "200")),
+        )
+
+    def _expired(self, update_time: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - update_time > self.ttl_seconds
+
+    def _shared_state(self, app_name: str, user_id: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        app_row = self._db.execute("SELECT state FROM app_states WHERE app_name = ?", (app_name,)).fetchone()
+        user_row = self._db.execute(
+            "SELECT state FROM user_states WHERE app_name = ? AND user_id = ?", (app_name, user_id)
+        ).fetchone()
+        return json.loads(app_row[0]) if app_row else {}, json.loads(user_row[0]) if user_row else {}
+
+    def _merged_state(self, app_name: str, user_id: str, session_state: Dict[str, Any]) -> Dict[str, Any]:
+        app_state, user_state = self._shared_state(app_name, user_id)
+        merged = copy.deepcopy(session_state)
+        merged.update({State.APP_PREFIX + key: value for key, value in app_state.items()})
+        merged.update({State.USER_PREFIX + key: value for key, value in user_state.items()})
+        return merged
+
+    def _write_state(
+        self, app_name: str, user_id: str, session_id: str, delta: Dict[str, Any], now: float
+    ) -> None:
+        """Apply a state delta to the app, user and session rows (no commit)."""
+        app_delta, user_delta, session_delta = split_state_delta(delta)
+        app_state, user_state = self._shared_state(app_name, user_id)
+        if app_delta:
+            app_state.update(app_delta)
+            self._db.execute(
+                "INSERT OR REPLACE INTO app_states (app_name, state) VALUES (?, ?)",
+                (app_name, json.dumps(app_state, default=str)),
+            )
+        if user_delta:
+            user_state.update(user_delta)
+            self._db.execute(
+                "INSERT OR REPLACE INTO user_states (app_name, user_id, state) VALUES (?, ?, ?)",
+                (app_name, user_id, json.dumps(user_state, default=str)),
+            )
+        row = self._db.execute(
+            "SELECT state FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+            (app_name, user_id, session_id),
+        ).fetchone()
+        state = json.loads(row[0])
+        state.update(session_delta)
+        self._db.execute(
+            "UPDATE sessions SET state = ?, update_time = ? WHERE app_name = ? AND user_id = ? AND id = ?",
+            (json.dumps(state, default=str), now, app_name, user_id, session_id),
+        )
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        return await asyncio.to_thread(self._create_session, app_name, user_id, state or {}, session_id)
+
+    def _create_session(
+        self, app_name: str, user_id: str, state: Dict[str, Any], session_id: Optional[str]
+    ) -> Session:
+        self._maybe_sweep()
+        session_id = (session_id or "").strip() or str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT INTO sessions (app_name, user_id, id, state, create_time, update_time)"
+                    " VALUES (?, ?, ?, '{}', ?, ?)",
+                    (app_name, user_id, session_id, now, now),
+                )
+            except sqlite3.IntegrityError:
+                raise AlreadyExistsError(f"Session with id {session_id} already exists.")
+            self._write_state(app_name, user_id, session_id, state, now)
+            self._db.commit()
+            merged = self._merged_state(app_name, user_id, split_state_delta(state)[2])
+        return Session(
+            app_name=app_name, user_id=user_id, id=session_id, state=merged, events=[], last_update_time=now
+        )
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        return await asyncio.to_thread(self._get_session, app_name, user_id, session_id, config)
+
+    def _get_session(
+        self, app_name: str, user_id: str, session_id: str, config: Optional[GetSessionConfig]
+    ) -> Optional[Session]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT state, update_time FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+                (app_name, user_id, session_id),
+            ).fetchone()
+            if row is None:
+                return None
+            if self._expired(row[1], time.time()):
+                self._delete(app_name, user_id, session_id)
+                return None
+            query = "SELECT event_data FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?"
+            params: List[Any] = [app_name, user_id, session_id]
+            if config and config.after_timestamp:
+                query += " AND timestamp >= ?"
+                params.append(config.after_timestamp)
+            query += " ORDER BY rowid DESC"
+            if config and config.num_recent_events is not None:
+                query += " LIMIT ?"
+                params.append(config.num_recent_events)
+            event_rows = self._db.execute(query, params).fetchall()
+            state = self._merged_state(app_name, user_id, json.loads(row[0]))
+        events = [Event.model_validate_json(data) for (data,) in reversed(event_rows)]
+        return Session(
+            app_name=app_name, user_id=user_id, id=session_id, state=state, events=events, last_update_time=row[1]
+        )
+
+    async def list_sessions(self, *, app_name: str, user_id: Optional[str] = None) -> ListSessionsResponse:
+        return await asyncio.to_thread(self._list_sessions, app_name, user_id)
+
+    def _list_sessions(self, app_name: str, user_id: Optional[str]) -> ListSessionsResponse:
+        """List live sessions, oldest activity first, without state or events."""
+        cutoff = time.time() - self.ttl_seconds if self.ttl_seconds is not None else 0.0
+        query = "SELECT user_id, id, update_time FROM sessions WHERE app_name = ?"
+        params: List[Any] = [app_name]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        query += " AND update_time >= ? ORDER BY update_time, user_id, id"
+        params.append(cutoff)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return ListSessionsResponse(
+            sessions=[
+                Session(app_name=app_name, user_id=row_user, id=row_id, state={}, events=[], last_update_time=updated)
+                for row_user, row_id, updated in rows
+            ]
+        )
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        await asyncio.to_thread(self._delete_session, app_name, user_id, session_id)
+
+    def _delete_session(self, app_name: str, user_id: str, session_id: str) -> None:
+        with self._lock:
+            self._delete(app_name, user_id, session_id)
+
+    def _delete(self, app_name: str, user_id: str, session_id: str) -> None:
+        self._db.execute(
+            "DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?", (app_name, user_id, session_id)
+        )
+        self._db.commit()
+
+    async def get_user_state(self, *, app_name: str, user_id: str) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._get_user_state, app_name, user_id)
+
+    def _get_user_state(self, app_name: str, user_id: str) -> Dict[str, Any]:
+        with self._lock:
+            return self._shared_state(app_name, user_id)[1]
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        # Temp state is visible to later agents of this invocation but never stored
+        self._apply_temp_state(session, event)
+        event = self._trim_temp_delta_state(event)
+        await asyncio.to_thread(self._append_event, session, event)
+        session.last_update_time = event.timestamp
+        return self._commit_event_to_session(session, event)
+
+    def _append_event(self, session: Session, event: Event) -> None:
+        key = (session.app_name, session.user_id, session.id)
+        with self._lock:
+            if self._db.execute(
+                "SELECT 1 FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?", key
+            ).fetchone() is None:
+                raise SessionNotFoundError(f"Session {session.id} not found.")
+            self._write_state(*key, event.actions.state_delta if event.actions else {}, event.timestamp)
+            self._db.execute(
+                "INSERT OR REPLACE INTO events"
+                " (app_name, user_id, session_id, id, invocation_id, author, timestamp, event_data)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, event.id, event.invocation_id, event.author, event.timestamp,
+                 event.model_dump_json(exclude_none=True)),
+            )
+            # A clinician message starts a new invocation: compact the older ones
+            if event.author == "user":
+                self._compact(*key)
+            self._db.commit()
+        self._maybe_sweep()
+
+    def _compact(self, app_name: str, user_id: str, session_id: str) -> None:
+        """Compact invocations older than the last keep_invocations, then cap the event count (no commit)."""
+        key = (app_name, user_id, session_id)
+        recent = {
+            invocation_id for (invocation_id,) in self._db.execute(
+                "SELECT invocation_id FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?"
+                " GROUP BY invocation_id ORDER BY MAX(rowid) DESC LIMIT ?",
+                (*key, self.keep_invocations),
+            )
+        }
+        rows = self._db.execute(
+            "SELECT rowid, invocation_id, author, event_data FROM events"
+            " WHERE app_name = ? AND user_id = ? AND session_id = ? AND compacted = 0 ORDER BY rowid",
+            key,
+        ).fetchall()
+        # Keep every clinician message and the last text reply of each invocation
+        kept: Dict[int, Dict[str, Any]] = {}
+        last_reply: Dict[str, int] = {}
+        for rowid, invocation_id, author, event_data in rows:
+            if invocation_id in recent:
+                continue
+            compacted = compact_event_data(json.loads(event_data))
+            if compacted is None:
+                kept[rowid] = {}
+            elif author == "user":
+                kept[rowid] = compacted
+            else:
+                if invocation_id in last_reply:
+                    kept[last_reply[invocation_id]] = {}
+                last_reply[invocation_id] = rowid
+                kept[rowid] = compacted
+        for rowid, compacted in kept.items():
+            if compacted:
+                self._db.execute(
+                    "UPDATE events SET compacted = 1, event_data = ? WHERE rowid = ?",
+                    (json.dumps(compacted, ensure_ascii=False), rowid),
+                )
+            else:
+                self._db.execute("DELETE FROM events WHERE rowid = ?", (rowid,))
+        self._db.execute(
+            "DELETE FROM events WHERE rowid IN ("
+            " SELECT rowid FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?"
+            " ORDER BY rowid DESC LIMIT -1 OFFSET ?)",
+            (*key, self.max_events),
+        )
+
+    def _maybe_sweep(self) -> None:
+        if time.time() - self._last_sweep >= _SWEEP_INTERVAL:
+            self.purge_expired()
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """Delete sessions idle for longer than the TTL and return how many were deleted."""
+        now = time.time() if now is None else now
+        self._last_sweep = time.time()
+        if self.ttl_seconds is None:
+            return 0
+        with self._lock:
+            deleted = self._db.execute(
+                "DELETE FROM sessions WHERE update_time < ?", (now - self.ttl_seconds,)
+            ).rowcount
+            self._db.commit()
+            if deleted:
+                self._db.execute("PRAGMA incremental_vacuum")
+                self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if deleted:
+            logger.info("Expired %d idle session(s)", deleted)
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the number of stored sessions and events and the database size in bytes."""
+        with self._lock:
+            sessions = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            events = self._db.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+            pages = self._db.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._db.execute("PRAGMA page_size").fetchone()[0]
+        return {"sessions": sessions, "events": events, "db_bytes": pages * page_size}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def ckm_session_service_factory(uri: str, **kwargs: Any) -> CkmSessionService:
+    """ADK service registry factory for ``ckm://<path>`` session service URIs.
+
+    ``ckm://sessions.db`` is relative to the working directory,
+    ``ckm:///var/lib/ckm/sessions.db`` is absolute, and ``ckm://`` uses
+    CKM_SESSION_DB.
+    """
+    parsed = urlparse(uri)
+    return CkmSessionService.from_env(unquote(parsed.netloc + parsed.path) or None)
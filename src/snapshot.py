@@ -0,0 +1,285 @@
+"""Deterministic Consultation Snapshot rendering.
+
+The mediator returns only the snapshot's field values as JSON:
+
+    {"one_line_problem": "...", "key_facts": ["..."], "key_risks": ["..."],
+     "decisions_needed": "...", "next_steps": [{"action": "...", "owner": "...", "timing": "..."}]}
+
+An after_model_callback renders them through
+output_templates.generate_consultation_snapshot, which enforces the
+per-field length limits. The model no longer writes headings, numbering or
+reply options, snapshots can no longer run over 250 words, and the
+formatting is byte-identical across consults.
+
+With token streaming on, partial chunks are rendered as they arrive: each
+chunk is replaced by the newly completed part of the snapshot (whole
+fields and list items), so the clinician sees formatted markdown rather
+than raw JSON. Streamed lines have not been through the safety validator
+yet (safety.py checks the final reply), so lines breaking a safety rule
+are left out of the stream: an unsafe list item is skipped, an unsafe
+single field holds back the rest of the snapshot until the final,
+validated reply.
+
+A reply that is not valid JSON (e.g. a model that ignored the format) is
+kept as written.
+"""
+
+import json
+import logging
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmResponse
+from google.genai import types
+from pydantic import BaseModel, ConfigDict, ValidationError, field_validator
+
+from .output_templates import SNAPSHOT_MAX_ITEMS, SNAPSHOT_MAX_WORDS, generate_consultation_snapshot
+
+
+logger = logging.getLogger(__name__)
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+# Stands in for the first missing value while rendering a partial snapshot
+_PENDING = "\x00PENDING\x00"
+
+# Snapshot fields in template order
+SNAPSHOT_FIELDS = ("one_line_problem", "key_facts", "key_risks", "decisions_needed", "next_steps")
+
+# Field format shown to the mediator; limits come from output_templates
+SNAPSHOT_OUTPUT_FORMAT = f"""Reply with ONLY this JSON object (no markdown, no code fences, keys in this order). The snapshot headings, numbering and reply options are added in code, so do not write them:
+
+{{
+  "one_line_problem": "[Exact Age][Sex] with CKD, HFrEF, T2DM presenting for ...",
+  "key_facts": ["eGFR [Value] mL/min/1.73m² (CKD Stage [Stage])", "fact", "fact", "fact", "fact"],
+  "key_risks": ["risk", "risk", "risk", "risk", "risk"],
+  "decisions_needed": "Yes/No — brief explanation",
+  "next_steps": [{{"action": "action", "owner": "specialty", "timing": "when"}}]
+}}
+
+Length limits (longer values are cut off):
+- one_line_problem: {SNAPSHOT_MAX_WORDS["one_line_problem"]} words
+- key_facts: {SNAPSHOT_MAX_ITEMS["key_facts"]} items of at most {SNAPSHOT_MAX_WORDS["key_fact"]} words
+- key_risks: {SNAPSHOT_MAX_ITEMS["key_risks"]} items of at most {SNAPSHOT_MAX_WORDS["key_risk"]} words
+- decisions_needed: {SNAPSHOT_MAX_WORDS["decisions_needed"]} words
+- next_steps: up to {SNAPSHOT_MAX_ITEMS["next_steps"]} items; action {SNAPSHOT_MAX_WORDS["action"]} words, owner {SNAPSHOT_MAX_WORDS["owner"]} words, timing {SNAPSHOT_MAX_WORDS["timing"]} words"""
+
+
+class NextStep(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    action: str = ""
+    owner: str = ""
+    timing: str = ""
+
+
+class SnapshotFields(BaseModel):
+    """Field values of a Consultation Snapshot as returned by the mediator."""
+
+    model_config = ConfigDict(extra="ignore")
+
+    one_line_problem: str
+    key_facts: List[str] = []
+    key_risks: List[str] = []
+    decisions_needed: str = ""
+    next_steps: List[NextStep] = []
+
+    @field_validator("key_facts", "key_risks", mode="before")
+    @classmethod
+    def _as_text_list(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            return [value] if value.strip() else []
+        return value
+
+    def render(self) -> str:
+        """Render the snapshot through the standard template."""
+        return generate_consultation_snapshot(
+            one_line_problem=self.one_line_problem,
+            key_facts=self.key_facts,
+            key_risks=self.key_risks,
+            decisions_needed=self.decisions_needed,
+            next_steps=[step.model_dump() for step in self.next_steps],
+        )
+
+
+def parse_snapshot_fields(text: str) -> Optional[SnapshotFields]:
+    """Parse the mediator's JSON reply; None when it is not a valid snapshot."""
+    match = _JSON_OBJECT.search(text or "")
+    if not match:
+        return None
+    try:
+        return SnapshotFields.model_validate(json.loads(match.group(0)))
+    except (ValueError, ValidationError) as exc:
+        logger.warning("Mediator returned invalid snapshot fields: %s", exc)
+        return None
+
+
+def _close_partial_json(text: str) -> Tuple[Optional[Any], int]:
+    """Parse a JSON object cut off mid-stream.
+
+    An unfinished string is dropped (with its key), so every string in the
+    result is complete.
+
+    Returns:
+        (value or None, number of containers still open)
+    """
+    start = text.find("{")
+    if start < 0:
+        return None, 0
+    text = text[start:]
+    closers: List[str] = []
+    in_string = escaped = False
+    string_start = 0
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string, string_start = True, index
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+        elif char in "}]" and closers:
+            closers.pop()
+    depth = len(closers)
+    stripped = text.rstrip()
+    if in_string:
+        # Drop the unfinished string (and the key it belongs to, if any)
+        stripped = text[:string_start].rstrip()
+    stripped = stripped.rstrip(",").rstrip()
+    if stripped.endswith(":"):
+        stripped += " null"
+    elif closers and closers[-1] == "}" and stripped.endswith('"'):
+        # A key without its value yet
+        key_start = stripped.rfind('"', 0, len(stripped) - 1)
+        if stripped[:key_start].rstrip().endswith(("{", ",")):
+            stripped += ": null"
+    try:
+        return json.loads(stripped + "".join(reversed(closers))), depth
+    except ValueError:
+        return None, depth
+
+
+def _withhold_lines(data: Dict[str, Any], keep: Callable[[str, Any], bool]) -> bool:
+    """Remove list items failing `keep`; a failing single field and the fields after it become missing.
+
+    Returns:
+        Whether a single field was withheld
+    """
+    for index, name in enumerate(SNAPSHOT_FIELDS):
+        value = data.get(name)
+        if isinstance(value, list):
+            data[name] = [
+                item for item in value
+                if keep(name, item if name != "next_steps" or isinstance(item, dict) else {"action": str(item)})
+            ]
+        elif isinstance(value, str) and value and not keep(name, value):
+            for later in SNAPSHOT_FIELDS[index:]:
+                data.pop(later, None)
+            return True
+    return False
+
+
+def render_partial_snapshot(text: str, keep: Optional[Callable[[str, Any], bool]] = None) -> str:
+    """Render the part of a snapshot that is final in a partial JSON reply.
+
+    Only complete fields and list items are rendered, in template order, so
+    the result is always a prefix of the fully rendered snapshot.
+
+    Args:
+        text: Raw JSON received so far
+        keep: Optional check (field, value) -> bool; lines failing it are
+            not rendered (see the module docstring)
+
+    >>> reply = '{"one_line_problem": "78F with CKD 4", "key_facts": ["eGFR 22", "Continue metformin", "EF 35%"'
+    >>> render_partial_snapshot(reply, keep=lambda field, value: "metformin" not in value).splitlines()[-2:]
+    ['  1. eGFR 22', '  2. EF 35%']
+    """
+    data, depth = _close_partial_json(text)
+    if not isinstance(data, dict):
+        return ""
+    withheld = keep is not None and _withhold_lines(data, keep)
+    if depth == 0 and not withheld:
+        fields = parse_snapshot_fields(json.dumps(data))
+        return fields.render() if fields else ""
+    present = [name for name in data if name in SNAPSHOT_FIELDS]
+    last = present[-1] if present else None
+
+    values: Dict[str, Any] = {}
+    for name in SNAPSHOT_FIELDS:
+        value = data.get(name)
+        list_field = name in SNAPSHOT_MAX_ITEMS
+        if value is None:
+            values[name] = [_PENDING] if list_field else _PENDING
+            break
+        if name == last and depth >= 2:
+            # Open list: a next_steps item still being written (depth 3) is not final yet
+            items = list(value) if isinstance(value, list) else []
+            values[name] = (items[:-1] if depth >= 3 else items) + [_PENDING]
+            break
+        values[name] = value
+    for name in SNAPSHOT_FIELDS:
+        values.setdefault(name, [_PENDING] if name in SNAPSHOT_MAX_ITEMS else _PENDING)
+
+    steps = [
+        {"action": _PENDING} if step == _PENDING else (step if isinstance(step, dict) else {"action": str(step)})
+        for step in values["next_steps"]
+    ]
+    rendered = generate_consultation_snapshot(
+        one_line_problem=values["one_line_problem"],
+        key_facts=[str(item) for item in values["key_facts"]],
+        key_risks=[str(item) for item in values["key_risks"]],
+        decisions_needed=values["decisions_needed"],
+        next_steps=steps,
+    )
+    cut = rendered.find(_PENDING)
+    if cut < 0:
+        return rendered
+    return rendered[: rendered.rfind("\n", 0, cut)]
+
+
+def create_snapshot_renderer(
+    line_check: Optional[Callable[[CallbackContext, str, Any], bool]] = None,
+) -> Callable[[CallbackContext, LlmResponse], Optional[LlmResponse]]:
+    """Create the mediator's after_model_callback rendering the snapshot.
+
+    The response is rewritten in place, so callbacks registered after it
+    (TTFT metrics, result cache) and the output_key see the rendered
+    markdown.
+
+    Args:
+        line_check: Optional check (callback_context, field, value) -> bool
+            applied to partial chunks; lines failing it are not streamed
+            (e.g. safety.snapshot_line_is_safe)
+    """
+    # (invocation id, agent) -> (raw JSON received so far, markdown already streamed)
+    streams: Dict[Tuple[str, str], Tuple[str, str]] = {}
+
+    def render_snapshot(callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+        content = llm_response.content
+        if not content or not content.parts or any(part.function_call for part in content.parts):
+            return None
+        text = "".join(part.text or "" for part in content.parts if not part.thought)
+        stream_key = (callback_context.invocation_id, callback_context.agent_name)
+
+        if llm_response.partial:
+            raw, sent = streams.get(stream_key, ("", ""))
+            raw += text
+            keep = (lambda field, value: line_check(callback_context, field, value)) if line_check else None
+            rendered = render_partial_snapshot(raw, keep)
+            delta = rendered[len(sent):] if rendered.startswith(sent) and len(rendered) > len(sent) else ""
+            streams[stream_key] = (raw, sent + delta)
+            llm_response.content = types.Content(role="model", parts=[types.Part(text=delta)])
+            return None
+
+        streams.pop(stream_key, None)
+        fields = parse_snapshot_fields(text)
+        if fields is not None:
+            llm_response.content = types.Content(role="model", parts=[types.Part(text=fields.render())])
+        return None
+
+    return render_snapshot
@@ -0,0 +1,425 @@
+"""Hot-path tracing of every model call, with Ollama's own timing breakdown.
+
+A slow consult can spend its time waiting for a backend slot, evaluating
+the prompt, loading the model, generating, or on one straggling
+specialist. With CKM_TRACE_PATH set, every registry model call (root,
+intake, specialists, mediator, expansion) is recorded as a span:
+- agent name, model, backend and scheduler queue wait
+- Ollama's prompt_eval_count/prompt_eval_duration, eval_count/eval_duration,
+  load_duration and total_duration, read from the response as it streams
+  through the connection pool (LiteLLM drops them)
+- time to the first response chunk and generation tokens per second
+
+Spans of one invocation share a trace; the calls of a consult nest under
+its ``consult`` span (ckm_panel start to finish). Spans are appended to a
+JSONL file, one OpenTelemetry-style span per line (traceId, spanId,
+parentSpanId, name, start/end time in Unix nanoseconds, attributes,
+status).
+
+Summarise a trace file into per-agent latency and tokens-per-second
+histograms with:
+    python -m src.tracing traces.jsonl
+
+Configuration (environment variables):
+- CKM_TRACE_PATH: JSONL file receiving the spans (tracing is off when unset)
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
+
+
+# Final-chunk fields of an Ollama /api/chat or /api/generate response
+OLLAMA_TIMING_FIELDS = (
+    "prompt_eval_count",
+    "prompt_eval_duration",
+    "eval_count",
+    "eval_duration",
+    "load_duration",
+    "total_duration",
+)
+
+# (agent name, invocation id, session id) of the model call being prepared
+_caller: ContextVar[Optional[Tuple[str, str, str]]] = ContextVar("ckm_trace_caller", default=None)
+
+# Spans receiving the Ollama timing of the HTTP requests being sent (innermost last)
+_active_spans: ContextVar[Tuple["Span", ...]] = ContextVar("ckm_trace_spans", default=())
+
+
+def _trace_id(invocation_id: str) -> str:
+    return hashlib.sha256(invocation_id.encode("utf-8")).hexdigest()[:32]
+
+
+class Span:
+    """One timed operation; exported when ended."""
+
+    def __init__(self, tracer: "Tracer", name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self.ended = False
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self._start) * 1000, 1)
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        """Finish the span and export it (later calls are ignored)."""
+        if self.ended:
+            return
+        self.ended = True
+        status = {"code": "OK"}
+        if error is not None:
+            status = {"code": "ERROR", "message": f"{type(error).__name__}: {error}"[:300]}
+        self.tracer.export({
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.start_ns + int((time.perf_counter() - self._start) * 1e9),
+            "attributes": self.attributes,
+            "status": status,
+        })
+
+
+class Tracer:
+    """Span recorder appending finished spans to a JSONL file.
+
+    Disabled (every start_* returns None) when no path is configured.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._consults: Dict[str, Span] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        """Build a tracer configured from CKM_TRACE_PATH."""
+        return cls(path=os.getenv("CKM_TRACE_PATH") or None)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def start_consult(self, invocation_id: str, session_id: str) -> Optional[Span]:
+        """Open the consult span that the panel's model calls nest under."""
+        if not self.enabled:
+            return None
+        span = Span(self, "consult", _trace_id(invocation_id), None, {
+            "session.id": session_id,
+            "ckm.invocation_id": invocation_id,
+        })
+        with self._lock:
+            self._consults[invocation_id] = span
+        return span
+
+    def end_consult(self, invocation_id: str) -> None:
+        with self._lock:
+            span = self._consults.pop(invocation_id, None)
+        if span is not None:
+            span.end()
+
+    def start_llm(self, model: str, stream: bool) -> Optional[Span]:
+        """Open a span for a model call made by the agent marked with mark_llm_caller."""
+        if not self.enabled:
+            return None
+        agent_name, invocation_id, session_id = _caller.get() or ("unknown", "", "")
+        with self._lock:
+            consult = self._consults.get(invocation_id)
+        trace_id = consult.trace_id if consult else _trace_id(invocation_id or secrets.token_hex(8))
+        return Span(self, f"chat {model}", trace_id, consult.span_id if consult else None, {
+            "gen_ai.operation.name": "chat",
+            "gen_ai.system": "ollama" if model.startswith("ollama") else "litellm",
+            "gen_ai.agent.name": agent_name,
+            "gen_ai.request.model": model,
+            "session.id": session_id,
+            "ckm.invocation_id": invocation_id,
+            "ckm.stream": stream,
+        })
+
+    def export(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as handle:
+                handle.write(line + "\n")
+
+
+# Shared tracer used by every registry model
+tracer = Tracer.from_env()
+
+
+def activate_span(span: Optional[Span]) -> Any:
+    """Make a span receive the Ollama timing of the HTTP requests sent next; returns a reset token.
+
+    Spans nest: a span activated around a model call (e.g. by warmup.py)
+    receives the timing as well as the call's own span.
+    """
+    spans = _active_spans.get()
+    return _active_spans.set(spans + (span,) if span is not None else spans)
+
+
+def deactivate_span(token: Any) -> None:
+    _active_spans.reset(token)
+
+
+def _record_ollama_timing(span: Span, line: bytes) -> None:
+    try:
+        chunk = json.loads(line)
+    except ValueError:
+        return
+    if not isinstance(chunk, dict) or chunk.get("done") is not True:
+        return
+    timing = {field: chunk[field] for field in OLLAMA_TIMING_FIELDS if isinstance(chunk.get(field), (int, float))}
+    span.set(**{f"ollama.{field}": value for field, value in timing.items()})
+    if "prompt_eval_count" in timing:
+        span.set(**{"gen_ai.usage.input_tokens": timing["prompt_eval_count"]})
+    if "eval_count" in timing:
+        span.set(**{"gen_ai.usage.output_tokens": timing["eval_count"]})
+    if timing.get("eval_duration"):
+        span.set(**{"ollama.tokens_per_second": round(timing.get("eval_count", 0) / (timing["eval_duration"] / 1e9), 1)})
+    if timing.get("prompt_eval_duration"):
+        rate = timing.get("prompt_eval_count", 0) / (timing["prompt_eval_duration"] / 1e9)
+        span.set(**{"ollama.prompt_tokens_per_second": round(rate, 1)})
+
+
+class _TimingStream(httpx.AsyncByteStream):
+    """Response body passed through unchanged while its final Ollama chunk is read."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, spans: Tuple[Span, ...]):
+        self._stream = stream
+        self._spans = spans
+        self._tail = b""
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            for span in self._spans:
+                if "ckm.time_to_first_chunk_ms" not in span.attributes:
+                    span.set(**{"ckm.time_to_first_chunk_ms": span.elapsed_ms()})
+            *lines, self._tail = (self._tail + chunk).split(b"\n")
+            for line in lines:
+                if b'"done"' in line:
+                    self._record(line)
+            yield chunk
+        if self._tail.strip():
+            self._record(self._tail)
+
+    def _record(self, line: bytes) -> None:
+        for span in self._spans:
+            _record_ollama_timing(span, line)
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+
+
+class OllamaTimingTransport(httpx.AsyncBaseTransport):
+    """httpx transport wrapper feeding Ollama's response timing into the active span."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self._transport.handle_async_request(request)
+        spans = _active_spans.get()
+        if spans and request.url.path.endswith(("/api/chat", "/api/generate")):
+            response.stream = _TimingStream(response.stream, spans)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def set_llm_caller(agent_name: str, invocation_id: str = "", session_id: str = "") -> None:
+    """Name the agent of the model calls made next in the current context."""
+    _caller.set((agent_name, invocation_id, session_id))
+
+
+def mark_llm_caller(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    """before_model_callback (first in the list): name the agent of the next model call."""
+    set_llm_caller(callback_context.agent_name, callback_context.invocation_id, callback_context.session.id)
+    return None
+
+
+def trace_agent_tree(root: BaseAgent) -> None:
+    """Prepend mark_llm_caller to the before_model_callback of every LLM agent under root."""
+    pending = [root]
+    while pending:
+        agent = pending.pop()
+        pending.extend(agent.sub_agents)
+        if not isinstance(agent, LlmAgent):
+            continue
+        existing = agent.before_model_callback
+        callbacks = existing if isinstance(existing, list) else [existing] if existing else []
+        if mark_llm_caller not in callbacks:
+            agent.before_model_callback = [mark_llm_caller, *callbacks]
+
+
+def start_consult_trace(callback_context: CallbackContext) -> Optional[types.Content]:
+    """ckm_panel before_agent_callback: open the consult span."""
+    tracer.start_consult(callback_context.invocation_id, callback_context.session.id)
+    return None
+
+
+def end_consult_trace(callback_context: CallbackContext) -> Optional[types.Content]:
+    """ckm_panel after_agent_callback: close the consult span."""
+    tracer.end_consult(callback_context.invocation_id)
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Trace summary CLI
+# ---------------------------------------------------------------------------
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.5, 1, 2, 4, 8, 16, 32, 64)
+TOKENS_PER_SECOND_BUCKETS = (5, 10, 20, 40, 80, 160)
+
+
+def _percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))], 3)
+
+
+def histogram(values: Iterable[float], bounds: Iterable[float]) -> List[Tuple[str, int]]:
+    """Count values per bucket; labels are "<=bound" plus a final ">last"."""
+    bounds = list(bounds)
+    counts = [0] * (len(bounds) + 1)
+    for value in values:
+        counts[next((index for index, bound in enumerate(bounds) if value <= bound), len(bounds))] += 1
+    labels = [f"<={bound:g}" for bound in bounds] + [f">{bounds[-1]:g}"]
+    return list(zip(labels, counts))
+
+
+def load_spans(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as handle:
+        return [json.loads(line) for line in handle if line.strip()]
+
+
+def _seconds(span: Dict[str, Any]) -> float:
+    return (span["endTimeUnixNano"] - span["startTimeUnixNano"]) / 1e9
+
+
+def summarize_spans(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Per-agent latency, queue wait, prompt evaluation and generation speed of model call spans."""
+    calls: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    by_parent: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    consults = []
+    for span in spans:
+        if span["name"] == "consult":
+            consults.append(span)
+            continue
+        calls[span["attributes"].get("gen_ai.agent.name", "unknown")].append(span)
+        if span.get("parentSpanId"):
+            by_parent[span["parentSpanId"]].append(span)
+
+    agents = {}
+    for agent_name, agent_spans in sorted(calls.items()):
+        attributes = [span["attributes"] for span in agent_spans]
+        latency = [_seconds(span) for span in agent_spans]
+        rates = [a["ollama.tokens_per_second"] for a in attributes if "ollama.tokens_per_second" in a]
+
+        def p50(field: str, scale: float = 1.0) -> Optional[float]:
+            return _percentile([a[field] * scale for a in attributes if field in a], 50)
+
+        agents[agent_name] = {
+            "calls": len(agent_spans),
+            "errors": sum(1 for span in agent_spans if span.get("status", {}).get("code") == "ERROR"),
+            "latency_seconds": {"p50": _percentile(latency, 50), "p95": _percentile(latency, 95), "max": _percentile(latency, 100)},
+            "queue_wait_seconds_p50": p50("ckm.queue_wait_seconds"),
+            "load_seconds_p50": p50("ollama.load_duration", 1e-9),
+            "prompt_eval_seconds_p50": p50("ollama.prompt_eval_duration", 1e-9),
+            "eval_seconds_p50": p50("ollama.eval_duration", 1e-9),
+            "prompt_tokens_p50": p50("ollama.prompt_eval_count"),
+            "completion_tokens_p50": p50("ollama.eval_count"),
+            "tokens_per_second": {"p50": _percentile(rates, 50), "p5": _percentile(rates, 5)},
+            "latency_histogram": histogram(latency, LATENCY_BUCKETS),
+            "tokens_per_second_histogram": histogram(rates, TOKENS_PER_SECOND_BUCKETS),
+        }
+
+    # Straggler gap: slowest minus fastest specialist call within a consult
+    gaps = []
+    for consult in consults:
+        children = [span for span in by_parent.get(consult["spanId"], []) if span["attributes"].get("gen_ai.agent.name") != "mediator"]
+        if len(children) > 1:
+            durations = [_seconds(span) for span in children]
+            gaps.append(max(durations) - min(durations))
+    durations = [_seconds(span) for span in consults]
+    return {
+        "spans": len(spans),
+        "consults": {
+            "count": len(consults),
+            "seconds": {"p50": _percentile(durations, 50), "p95": _percentile(durations, 95)},
+            "straggler_gap_seconds": {"p50": _percentile(gaps, 50), "p95": _percentile(gaps, 95)},
+        },
+        "agents": agents,
+    }
+
+
+def _bars(buckets: List[Tuple[str, int]], width: int = 30) -> List[str]:
+    peak = max((count for _, count in buckets), default=0) or 1
+    return [f"    {label:>7} | {'#' * round(count / peak * width):<{width}} {count}" for label, count in buckets]
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """Render a trace summary as text with ASCII histograms."""
+    consults = summary["consults"]
+    lines = [
+        f"Spans: {summary['spans']}  Consults: {consults['count']}  "
+        f"consult s p50={consults['seconds']['p50']} p95={consults['seconds']['p95']}  "
+        f"straggler gap s p50={consults['straggler_gap_seconds']['p50']} p95={consults['straggler_gap_seconds']['p95']}",
+    ]
+    for agent_name, agent in summary["agents"].items():
+        latency, rate = agent["latency_seconds"], agent["tokens_per_second"]
+        lines += [
+            "",
+            f"{agent_name}: {agent['calls']} calls ({agent['errors']} errors)  "
+            f"latency s p50={latency['p50']} p95={latency['p95']} max={latency['max']}  tok/s p50={rate['p50']}",
+            f"  p50 s: queue={agent['queue_wait_seconds_p50']} load={agent['load_seconds_p50']} "
+            f"prompt_eval={agent['prompt_eval_seconds_p50']} eval={agent['eval_seconds_p50']}  "
+            f"tokens p50: prompt={agent['prompt_tokens_p50']} completion={agent['completion_tokens_p50']}",
+            "  latency (s):",
+            *_bars(agent["latency_histogram"]),
+        ]
+        if any(count for _, count in agent["tokens_per_second_histogram"]):
+            lines += ["  generation (tokens/s):", *_bars(agent["tokens_per_second_histogram"])]
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point: summarise a CKM_TRACE_PATH file."""
+    parser = argparse.ArgumentParser(description="Summarise CKM trace spans into per-agent latency and tokens/s histograms.")
+    parser.add_argument("path", help="JSONL trace file (CKM_TRACE_PATH)")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    summary = summarize_spans(load_spans(args.path))
+    print(json.dumps(summary, indent=2) if args.json else format_summary(summary))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""Triage stage deciding which specialists the panel needs.
+
+``specialists_parallel`` used to run all three specialists for every case.
+Before the panel runs, the compiled case (diagnoses, labs, medications,
+peri-op flag) is checked against simple inclusion rules per specialty:
+- Cardiology: EF < 50%, NYHA class, elevated NT-proBNP/BNP, cardiac diagnoses
+  or medications, or any peri-op case
+- Nephrology: eGFR < 60, albuminuria, CKD, or nephrotoxic exposure
+  (contrast, NSAIDs)
+- Endocrinology: diabetes, HbA1c ≥ 5.7%, glucose-lowering drugs, or BMI ≥ 30
+
+A specialist is only skipped when the case positively shows its domain is
+not involved (a normal marker and no other reason), so missing data never
+drops a specialty. Skipped specialists end immediately with a "not
+consulted" note, and the mediator is told explicitly which domains were
+not consulted. When all three are skipped, the mediator is not called
+either: the panel answers with a "no specialist input needed" note.
+
+Configuration (environment variables):
+- CKM_TRIAGE_DISABLED: set to "1" to always run all three specialists
+"""
+
+import os
+import re
+from typing import Any, Callable, Dict, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.genai import types
+
+from .intake_agent import CASE_KEY
+from .periop_rules import classify_medication
+
+
+# Session state key holding the latest triage decision
+TRIAGE_KEY = "ckm_panel_triage"
+
+SPECIALTY_NAMES = {
+    "cardiologist": "Cardiology",
+    "nephrologist": "Nephrology",
+    "diabetologist": "Endocrinology",
+}
+
+_CARDIAC_DIAGNOSES = re.compile(
+    r"\b(heart failure|HF[rpm]?EF|cardiomyopathy|coronary|CAD|myocardial|MI|angina|atrial fibrillation|AF|"
+    r"valv\w*|stenosis|arrhythmi\w*|ASCVD)\b",
+    re.I,
+)
+_KIDNEY_DIAGNOSES = re.compile(r"\b(CKD|chronic kidney|nephropathy|AKI|dialysis|transplant|albuminuria|proteinuria)\b", re.I)
+_DIABETES_DIAGNOSES = re.compile(r"\b(diabet\w*|T[12]DM|prediabet\w*|insulin resistance|obesity)\b", re.I)
+_NSAIDS = re.compile(r"\b(NSAID|ibuprofen|naproxen|diclofenac|celecoxib|ketorolac|meloxicam|indomethacin)\b", re.I)
+
+_CARDIAC_CLASSES = {"beta_blocker", "acei_arb", "loop_diuretic", "anticoagulant"}
+_GLUCOSE_CLASSES = {"metformin", "insulin", "sulfonylurea", "glp1ra"}
+
+
+def _text(case: Dict[str, Any], field: str) -> str:
+    value = case.get(field) or ""
+    return " ".join(value) if isinstance(value, list) else str(value)
+
+
+def _reasons(*checks: tuple[str, bool]) -> list[str]:
+    return [reason for reason, present in checks if present]
+
+
+def triage_case(case: Dict[str, Any]) -> Dict[str, Dict[str, str]]:
+    """Decide which specialists a compiled case needs.
+
+    A specialty is skipped only if none of its inclusion rules match AND
+    the case contains a normal value for it (EF ≥ 50% or a normal
+    natriuretic peptide, eGFR ≥ 60, HbA1c < 5.7%); missing data never
+    skips a specialist.
+
+    Args:
+        case: Canonical case object (see case_parser.CASE_SCHEMA)
+
+    Returns:
+        Dict with 'consulted' and 'skipped', each mapping specialist agent
+        name -> reason
+    """
+    diagnoses = " ".join(_text(case, field) for field in ("diagnoses", "primary_question", "notes"))
+    medications = case.get("medications") or []
+    classes = {classify_medication(medication) for medication in medications}
+    ef, nt_probnp, bnp = case.get("ef"), case.get("nt_probnp"), case.get("bnp")
+    egfr, uacr, hba1c, bmi = case.get("egfr", case.get("egfr_calculated")), case.get("uacr"), case.get("hba1c"), case.get("bmi")
+
+    inclusion = {
+        "cardiologist": _reasons(
+            (f"EF {ef:g}%" if ef is not None else "", ef is not None and ef < 50),
+            ("NYHA class", bool(case.get("nyha"))),
+            ("elevated natriuretic peptide", (nt_probnp or 0) >= 125 or (bnp or 0) >= 35),
+            ("cardiac diagnosis", bool(_CARDIAC_DIAGNOSES.search(diagnoses))),
+            ("cardiac medications", bool(classes & _CARDIAC_CLASSES)),
+            ("peri-operative risk", bool(case.get("periop"))),
+        ),
+        "nephrologist": _reasons(
+            (f"eGFR {egfr:g}" if egfr is not None else "", egfr is not None and egfr < 60),
+            ("albuminuria", uacr is not None and uacr >= 30),
+            ("kidney diagnosis", bool(_KIDNEY_DIAGNOSES.search(diagnoses))),
+            ("contrast exposure", bool(case.get("contrast"))),
+            ("NSAID exposure", any(_NSAIDS.search(m) for m in medications)),
+        ),
+        "diabetologist": _reasons(
+            ("diabetes", bool(case.get("diabetes_type") or _DIABETES_DIAGNOSES.search(diagnoses))),
+            (f"HbA1c {hba1c:g}%" if hba1c is not None else "", hba1c is not None and hba1c >= 5.7),
+            ("glucose-lowering medications", bool(classes & _GLUCOSE_CLASSES)),
+            (f"BMI {bmi:g}" if bmi is not None else "", bmi is not None and bmi >= 30),
+        ),
+    }
+    normal = {
+        "cardiologist": (ef is not None and ef >= 50) or nt_probnp is not None or bnp is not None,
+        "nephrologist": egfr is not None and egfr >= 60,
+        "diabetologist": hba1c is not None and hba1c < 5.7,
+    }
+    not_involved = {
+        "cardiologist": "normal cardiac markers, no cardiac diagnosis, cardiac medications or planned surgery",
+        "nephrologist": f"eGFR {egfr:g} without albuminuria, CKD or nephrotoxic exposure" if egfr is not None else "",
+        "diabetologist": f"HbA1c {hba1c:g}% without diabetes, glucose-lowering drugs or obesity" if hba1c is not None else "",
+    }
+
+    if os.getenv("CKM_TRIAGE_DISABLED") == "1":
+        return {"consulted": {name: "triage disabled" for name in SPECIALTY_NAMES}, "skipped": {}}
+    decision: Dict[str, Dict[str, str]] = {"consulted": {}, "skipped": {}}
+    for agent_name, reasons in inclusion.items():
+        if reasons or not normal[agent_name]:
+            decision["consulted"][agent_name] = ", ".join(reasons) or "domain not excluded by the case data"
+        else:
+            decision["skipped"][agent_name] = not_involved[agent_name]
+    return decision
+
+
+def triage_panel(callback_context: CallbackContext) -> Optional[types.Content]:
+    """ckm_panel before_agent_callback: store the triage decision for the case."""
+    state = callback_context.state
+    state[TRIAGE_KEY] = triage_case(state.get(CASE_KEY) or {})
+    return None
+
+
+def skip_unless_triaged(callback_context: CallbackContext) -> Optional[types.Content]:
+    """Specialist before_agent_callback: end at once if triage skipped this specialty.
+
+    The "not consulted" note becomes the specialist's output, replacing any
+    assessment left in state by a previous consult.
+    """
+    agent_name = callback_context.agent_name
+    reason = (callback_context.state.get(TRIAGE_KEY) or {}).get("skipped", {}).get(agent_name)
+    if reason is None:
+        return None
+    return types.Content(
+        role="model",
+        parts=[types.Part(text=f"{SPECIALTY_NAMES[agent_name]} not consulted: {reason}.")],
+    )
+
+
+def no_specialist_note(skipped: Dict[str, str]) -> str:
+    """Answer for a case in which triage skipped every specialty."""
+    lines = [f"- {SPECIALTY_NAMES[agent_name]} not consulted: {reason}." for agent_name, reason in skipped.items()]
+    return "**No specialist input needed.** The case shows no cardiac, kidney or metabolic involvement:\n" + "\n".join(lines)
+
+
+def create_mediator_skip(output_key: str) -> Callable[[CallbackContext], Optional[types.Content]]:
+    """Create the mediator before_agent_callback ending at once when no specialist was consulted.
+
+    There is nothing to synthesize, so the "no specialist input needed"
+    note is returned instead of calling the model, and stored under the
+    mediator's output_key in place of a snapshot.
+
+    Args:
+        output_key: State key of the mediator's snapshot
+    """
+
+    def skip_without_specialists(callback_context: CallbackContext) -> Optional[types.Content]:
+        triage = callback_context.state.get(TRIAGE_KEY) or {}
+        if triage.get("consulted") or not triage.get("skipped"):
+            return None
+        note = no_specialist_note(triage["skipped"])
+        callback_context.state[output_key] = note
+        return types.Content(role="model", parts=[types.Part(text=note)])
+
+    return skip_without_specialists
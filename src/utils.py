@@ -3,5 +3,55 @@
 This module provides utility functions for the CKM multi-agent board pattern.
 """
 
-from typing import Any, Dict
+import re
+from typing import Any, Dict, Optional, Tuple
 
+
+_FIELD_LINE = re.compile(r"^\*\*(?P<label>[^*]+?):\*\*\s*(?P<value>.*)$")
+_BULLET_LINE = re.compile(r"^(?:[•\-*]|\d+\.)\s+(?P<item>.+)$")
+_ACTION_SEPARATOR = re.compile(r"\s+[—–-]\s+")
+
+
+def parse_assessment(markdown: str) -> Dict[str, Any]:
+    """Parse a specialist assessment written in the agents' OUTPUT FORMAT.
+
+    Lines like ``**HF Classification:** HFrEF`` become fields, and bullets
+    following a ``**Key Findings:**`` header become that section's items.
+
+    Args:
+        markdown: Specialist assessment text
+
+    Returns:
+        Dict with 'fields' (label -> value) and 'sections' (label -> list of bullets)
+    """
+    fields: Dict[str, str] = {}
+    sections: Dict[str, list[str]] = {}
+    current: Optional[str] = None
+    for raw_line in (markdown or "").splitlines():
+        line = raw_line.strip()
+        field = _FIELD_LINE.match(line)
+        if field:
+            current = field.group("label").strip()
+            if field.group("value"):
+                fields[current] = field.group("value").strip()
+            continue
+        bullet = _BULLET_LINE.match(line)
+        if bullet and current:
+            sections.setdefault(current, []).append(bullet.group("item").strip())
+    return {"fields": fields, "sections": sections}
+
+
+def parse_medication_recommendation(item: str) -> Tuple[str, str, str]:
+    """Split a "Med: Action — reason" recommendation bullet.
+
+    Args:
+        item: Bullet text, e.g. "Metformin: Hold day of surgery — contrast planned"
+
+    Returns:
+        (medication, action, reason) with empty strings for missing parts
+    """
+    name, _, rest = item.partition(":")
+    if not rest:
+        return item.strip(), "", ""
+    action, *reason = _ACTION_SEPARATOR.split(rest.strip(), maxsplit=1)
+    return name.strip(" *"), action.strip(" *"), (reason[0].strip() if reason else "")
@@ -0,0 +1,182 @@
+"""Model warm-up and prompt-prefix priming before the first consult.
+
+After an Ollama restart or model eviction the first consult pays the model
+load plus a full evaluation of the long agent system prompts. Run from a
+deployment hook, this command:
+1. Builds each agent's request prefix (system instruction and tool
+   declarations) exactly as ADK does, for a non-surgical case before any
+   snapshot (the most common instruction variant, see prompts.py)
+2. Sends it to every backend the agent may use with a one-token reply and
+   an explicit keep_alive, which loads the model and fills Ollama's
+   prompt cache with the prefix
+3. Sends it again and reports cold versus warm latency per agent, with
+   Ollama's load time and prompt tokens evaluated
+
+Ollama keeps one prompt cache per parallel slot (OLLAMA_NUM_PARALLEL), so
+with fewer slots than agents only the last prefixes primed stay cached;
+the specialists and the mediator, which have the longest prompts, are
+primed last. A real request resets the model's expiry to its own
+keep_alive (CKM_KEEP_ALIVE, Ollama's default is 5 minutes), so set that
+too if models should stay loaded through the day.
+
+Usage:
+    python -m src.warmup
+    python -m src.warmup --keep-alive 24h --output warmup.json
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.agents.invocation_context import InvocationContext, new_invocation_context_id
+from google.adk.agents.run_config import RunConfig
+from google.adk.models import LlmRequest
+from google.adk.models.lite_llm import LiteLlm
+from google.adk.sessions import InMemorySessionService, Session
+from google.genai import types
+
+from .agent import root_agent
+from .intake_agent import CASE_KEY
+from .mediator import mediator_agent
+from .models import model_backends
+from .prompts import filter_periop_tools
+from .specialists import SPECIALIST_OUTPUT_KEYS
+from .tracing import Span, activate_span, deactivate_span, set_llm_caller, tracer
+
+
+DEFAULT_KEEP_ALIVE = "12h"
+
+# Prompt after the static prefix; the reply is cut to one token
+WARMUP_PROMPT = "Warm-up request. Reply with OK."
+
+# Session state of the primed instruction variant: a non-surgical case
+WARMUP_STATE = {CASE_KEY: {"periop": False}}
+
+# Agents primed last so their prefixes stay in Ollama's prompt cache
+PANEL_AGENTS = (*SPECIALIST_OUTPUT_KEYS, mediator_agent.name)
+
+
+def ollama_agents(root: BaseAgent) -> List[LlmAgent]:
+    """List the LLM agents under root that use an Ollama model, panel agents last."""
+    agents, pending = [], [root]
+    while pending:
+        agent = pending.pop(0)
+        pending.extend(agent.sub_agents)
+        if isinstance(agent, LlmAgent) and isinstance(agent.model, LiteLlm) and agent.model.model.startswith("ollama"):
+            agents.append(agent)
+    return sorted(agents, key=lambda agent: agent.name in PANEL_AGENTS)
+
+
+async def build_request(agent: LlmAgent, session_service: InMemorySessionService, session: Session) -> LlmRequest:
+    """Build the agent's model request (instruction and tools) for a session.
+
+    Runs the agent's own request processors, so the prefix matches the one
+    sent during a consult; of the before_model callbacks, only the peri-op
+    tool filter is applied.
+    """
+    context = InvocationContext(
+        session_service=session_service,
+        invocation_id=new_invocation_context_id(),
+        agent=agent,
+        session=session,
+        run_config=RunConfig(),
+    )
+    request = LlmRequest()
+    async for _ in agent._llm_flow._preprocess_async(context, request):
+        pass
+    filter_periop_tools(session.state, request)
+    request.contents = [types.Content(role="user", parts=[types.Part(text=WARMUP_PROMPT)])]
+    return request
+
+
+def warmup_model(model: LiteLlm, api_base: str, keep_alive: str) -> LiteLlm:
+    """Copy an agent's model pinned to one backend, with a one-token reply and the given keep_alive.
+
+    Other options (num_ctx in particular) are kept, since changing them
+    makes Ollama reload the model.
+    """
+    args = {**model._additional_args, "api_base": api_base, "num_predict": 1, "keep_alive": keep_alive}
+    return LiteLlm(model=model.model, llm_client=model.llm_client, **args)
+
+
+async def timed_call(model: LiteLlm, request: LlmRequest) -> Dict[str, Any]:
+    """Send one request; return its latency and Ollama's load and prompt evaluation figures."""
+    span = Span(tracer, "warmup", "", None, {})
+    token = activate_span(span)
+    started = time.perf_counter()
+    try:
+        async for _ in model.generate_content_async(request.model_copy(deep=True), stream=False):
+            pass
+    except Exception as exc:
+        return {"error": f"{type(exc).__name__}: {exc}"[:300]}
+    finally:
+        deactivate_span(token)
+    attributes = span.attributes
+    return {
+        "seconds": round(time.perf_counter() - started, 3),
+        "load_seconds": round(attributes.get("ollama.load_duration", 0) / 1e9, 3),
+        "prompt_eval_seconds": round(attributes.get("ollama.prompt_eval_duration", 0) / 1e9, 3),
+        "prompt_tokens_evaluated": attributes.get("ollama.prompt_eval_count"),
+    }
+
+
+async def warm_up(root: Optional[BaseAgent] = None, keep_alive: str = DEFAULT_KEEP_ALIVE) -> List[Dict[str, Any]]:
+    """Load every model of the agent tree on every backend and prime each agent's prompt prefix.
+
+    Returns:
+        One result per agent and backend with the cold and warm call
+    """
+    session_service = InMemorySessionService()
+    session = await session_service.create_session(app_name="ckm_warmup", user_id="warmup", state=WARMUP_STATE)
+    results = []
+    for agent in ollama_agents(root or root_agent):
+        request = await build_request(agent, session_service, session)
+        for api_base in model_backends(agent.model):
+            model = warmup_model(agent.model, api_base, keep_alive)
+            set_llm_caller(agent.name)
+            cold = await timed_call(model, request)
+            warm = await timed_call(model, request) if "error" not in cold else None
+            results.append({"agent": agent.name, "model": agent.model.model, "backend": api_base, "cold": cold, "warm": warm})
+    return results
+
+
+def _describe(call: Optional[Dict[str, Any]]) -> str:
+    if call is None:
+        return "-"
+    if "error" in call:
+        return f"FAILED ({call['error']})"
+    return (
+        f"{call['seconds']:.2f}s (load {call['load_seconds']:.2f}s, "
+        f"prompt {call['prompt_tokens_evaluated']} tok in {call['prompt_eval_seconds']:.2f}s)"
+    )
+
+
+def main() -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Load the agents' Ollama models and prime their prompt caches.")
+    parser.add_argument("--keep-alive", default=DEFAULT_KEEP_ALIVE, help=f"How long Ollama keeps the models loaded (default: {DEFAULT_KEEP_ALIVE})")
+    parser.add_argument("--output", help="Results JSON path")
+    args = parser.parse_args()
+
+    results = asyncio.run(warm_up(keep_alive=args.keep_alive))
+    for result in results:
+        print(f"{result['agent']:<20} {result['model']} @ {result['backend']}")
+        print(f"    cold {_describe(result['cold'])}")
+        print(f"    warm {_describe(result['warm'])}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2)
+        print(f"Results written to {args.output}")
+    failed = [result["agent"] for result in results if "error" in result["cold"]]
+    if failed:
+        print(f"Warm-up failed for: {', '.join(failed)}")
+        sys.exit(1)
+    print(f"{len(results)} agent prefixes primed (keep_alive {args.keep_alive}).")
+
+
+if __name__ == "__main__":
+    main()
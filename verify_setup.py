@@ -1,45 +1,191 @@
-"""Verify that the ADK Ollama setup is correct."""
+"""Verify that the ADK Ollama setup is correct.
 
+Checks every configured Ollama backend (CKM_OLLAMA_BACKENDS, else
+OLLAMA_API_BASE) and every per-agent model of the model registry at once,
+over one shared HTTP session. Then runs a short fixed generation per
+backend and model to measure prompt-eval and generation tokens/s, and
+estimates whether a consult can meet the target latency with the current
+model choices.
+
+Usage:
+    python verify_setup.py
+    python verify_setup.py --target-seconds 45 --output setup.json
+    python verify_setup.py --no-probe      # connectivity and models only
+"""
+
+import argparse
+import asyncio
+import json
 import os
 import sys
+import uuid
+
+
+DEFAULT_MODEL = "ollama_chat/qwen2.5:14b"
+DEFAULT_TARGET_SECONDS = 60.0
+
+# Tokens generated by the throughput probe
+PROBE_TOKENS = 64
+
+PROBE_CASE = (
+    "68-year-old man with type 2 diabetes, HFrEF (EF 35%, NYHA III) and CKD "
+    "(eGFR 42 mL/min/1.73m², UACR 180 mg/g), HbA1c 8.1%, BMI 32, scheduled "
+    "for elective hip replacement. Medications: carvedilol 6.25 mg BID, "
+    "sacubitril/valsartan 49/51 mg BID, furosemide 40 mg daily, metformin "
+    "1000 mg BID, empagliflozin 10 mg daily, atorvastatin 40 mg daily. "
+    "Recent admission for decompensated heart failure; NT-proBNP 1200 pg/mL; "
+    "potassium 5.1 mmol/L; blood pressure 118/72 mmHg; heart rate 68 bpm."
+)
+PROBE_PROMPT = (
+    "Summarise the cardio-kidney-metabolic risks and the peri-operative "
+    "medication plan for this case in short bullets.\n\n" + "\n".join([PROBE_CASE] * 4)
+)
+
+# Tokens (prompt, completion) of one call per panel agent in a typical consult:
+# prompts as measured by the offline benchmark (benchmarks/run.py), completions
+# as a typical JSON assessment or snapshot
+CONSULT_PROFILE = {
+    "cardiologist": (1300, 400),
+    "nephrologist": (1600, 400),
+    "diabetologist": (1300, 400),
+    "mediator": (2200, 500),
+}
+PANEL_SPECIALISTS = ("cardiologist", "nephrologist", "diabetologist")
+
+
+def ollama_backends():
+    """Return the Ollama servers to check: CKM_OLLAMA_BACKENDS, else OLLAMA_API_BASE."""
+    backends = [url.strip().rstrip("/") for url in os.getenv("CKM_OLLAMA_BACKENDS", "").split(",") if url.strip()]
+    return backends or [os.getenv("OLLAMA_API_BASE", "http://localhost:11434")]
+
+
+def ollama_model_name(model):
+    """Return the Ollama model name of a LiteLLM model id ("ollama_chat/qwen2.5:14b" -> "qwen2.5:14b")."""
+    name = model.split("/", 1)[1] if "/" in model else model
+    return name if ":" in name else f"{name}:latest"
+
+
+def agent_models():
+    """Return the Ollama model and backends of every agent role.
+
+    Uses the model registry (src/models.py), so per-role CKM_<ROLE>_MODEL and
+    CKM_<ROLE>_API_BASE settings are checked; falls back to the default
+    model when the registry cannot be imported.
+    """
+    try:
+        from src.models import configured_models
+    except ImportError:
+        configured = {"default": {"model": DEFAULT_MODEL, "api_base": None}}
+    else:
+        configured = configured_models()
+    roles = {}
+    for role, config in configured.items():
+        if not str(config["model"]).startswith("ollama"):
+            continue
+        pinned = config.get("api_base")
+        roles[role] = {
+            "model": ollama_model_name(config["model"]),
+            "backends": [pinned.rstrip("/")] if pinned else ollama_backends(),
+        }
+    return roles
 
 
-def check_ollama_running():
-    """Check if Ollama server is accessible."""
-    import requests
-    
-    api_base = os.getenv("OLLAMA_API_BASE", "http://localhost:11434")
+async def check_ollama_running(client, api_base):
+    """Check if an Ollama server is accessible; return (True, model names) or (False, error)."""
     try:
-        response = requests.get(f"{api_base}/api/tags", timeout=5)
+        response = await client.get(f"{api_base}/api/tags", timeout=5)
         if response.status_code == 200:
-            models = response.json().get("models", [])
-            model_names = [m.get("name", "") for m in models]
-            return True, model_names
-        return False, []
+            return True, [m.get("name", "") for m in response.json().get("models", [])]
+        return False, f"HTTP {response.status_code}"
     except Exception as e:
-        return False, str(e)
+        return False, str(e) or type(e).__name__
 
 
-def check_model_available(model_name="qwen2.5:14b"):
-    """Check if the specified model is available in Ollama."""
-    import requests
-    
-    api_base = os.getenv("OLLAMA_API_BASE", "http://localhost:11434")
+async def probe_throughput(client, api_base, model, timeout=300):
+    """Run a short fixed generation and return Ollama's prompt-eval and generation rates.
+
+    A random first line keeps Ollama's prompt cache from skipping the
+    prompt evaluation.
+    """
+    body = {
+        "model": model,
+        "messages": [{"role": "user", "content": f"Probe {uuid.uuid4().hex}\n{PROBE_PROMPT}"}],
+        "stream": False,
+        "options": {"num_predict": PROBE_TOKENS, "temperature": 0, "seed": 0},
+    }
     try:
-        response = requests.get(f"{api_base}/api/tags", timeout=5)
-        if response.status_code == 200:
-            models = response.json().get("models", [])
-            model_names = [m.get("name", "") for m in models]
-            # Check for exact match or partial match
-            if model_name in model_names:
-                return True, "exact match"
-            # Check for partial matches (UPDATED for Qwen)
-            for name in model_names:
-                if "qwen" in name.lower():
-                    return True, f"similar model found: {name}"
-            return False, f"Model '{model_name}' not found. Available models: {', '.join(model_names)}"
+        response = await client.post(f"{api_base}/api/chat", json=body, timeout=timeout)
+        if response.status_code != 200:
+            return {"error": f"HTTP {response.status_code}"}
+        result = response.json()
     except Exception as e:
-        return False, str(e)
+        return {"error": str(e) or type(e).__name__}
+
+    def rate(count, duration):
+        return round(count / (duration / 1e9), 1) if count and duration else None
+
+    return {
+        "prompt_tokens": result.get("prompt_eval_count"),
+        "prompt_tokens_per_second": rate(result.get("prompt_eval_count"), result.get("prompt_eval_duration")),
+        "completion_tokens": result.get("eval_count"),
+        "tokens_per_second": rate(result.get("eval_count"), result.get("eval_duration")),
+        "load_seconds": round(result.get("load_duration", 0) / 1e9, 2),
+        "total_seconds": round(result.get("total_duration", 0) / 1e9, 2),
+    }
+
+
+async def probe_backend(client, api_base, models):
+    """Probe the models of one backend one after another, so they do not share the hardware."""
+    return {model: await probe_throughput(client, api_base, model) for model in models}
+
+
+def call_seconds(role, probe):
+    """Estimated seconds of one call of a panel agent from a throughput probe."""
+    prompt_tokens, completion_tokens = CONSULT_PROFILE[role]
+    if not probe or not probe.get("prompt_tokens_per_second") or not probe.get("tokens_per_second"):
+        return None
+    return prompt_tokens / probe["prompt_tokens_per_second"] + completion_tokens / probe["tokens_per_second"]
+
+
+def estimate_consult(roles, probes, target_seconds):
+    """Estimate the latency of a consult (parallel specialists, then the mediator).
+
+    Each specialist goes to the candidate backend that would finish it
+    first; calls sharing a backend are counted one after another, since
+    parallel requests share its hardware. Model load time is excluded
+    (see src/warmup.py).
+    """
+    busy = {}
+    seconds = {}
+    for role in PANEL_SPECIALISTS:
+        if role not in roles:
+            continue
+        options = []
+        for api_base in roles[role]["backends"]:
+            estimate = call_seconds(role, probes.get(api_base, {}).get(roles[role]["model"]))
+            if estimate is not None:
+                options.append((busy.get(api_base, 0.0) + estimate, api_base, estimate))
+        if not options:
+            return None
+        finish, api_base, estimate = min(options)
+        busy[api_base] = finish
+        seconds[role] = round(estimate, 1)
+    mediator = [
+        call_seconds("mediator", probes.get(api_base, {}).get(roles["mediator"]["model"]))
+        for api_base in roles.get("mediator", {}).get("backends", [])
+    ]
+    mediator = [estimate for estimate in mediator if estimate is not None]
+    if not busy or not mediator:
+        return None
+    seconds["mediator"] = round(min(mediator), 1)
+    consult = max(busy.values()) + min(mediator)
+    return {
+        "agent_seconds": seconds,
+        "panel_seconds": round(max(busy.values()), 1),
+        "consult_seconds": round(consult, 1),
+        "target_seconds": target_seconds,
+        "meets_target": consult <= target_seconds,
+    }
 
 
 def check_dependencies():
@@ -49,28 +195,75 @@ def check_dependencies():
         import google.adk
     except ImportError:
         missing.append("google-adk")
-    
+
     try:
         import litellm
     except ImportError:
         missing.append("litellm")
-    
+
+    try:
+        import httpx
+    except ImportError:
+        missing.append("httpx")
+
     try:
         import requests
     except ImportError:
         missing.append("requests")
-    
+
     return len(missing) == 0, missing
 
 
+async def run_diagnostics(roles, probe=True, target_seconds=DEFAULT_TARGET_SECONDS):
+    """Check every backend and per-agent model at once, then probe throughput.
+
+    Returns:
+        JSON-serialisable report: backends (status, missing models, probes),
+        roles, and the consult latency estimate
+    """
+    import httpx
+
+    backends = list(dict.fromkeys(api_base for role in roles.values() for api_base in role["backends"]))
+    async with httpx.AsyncClient() as client:
+        statuses = await asyncio.gather(*(check_ollama_running(client, api_base) for api_base in backends))
+        report = {"backends": {}, "roles": roles}
+        for api_base, (ok, result) in zip(backends, statuses):
+            needed = sorted({role["model"] for role in roles.values() if api_base in role["backends"]})
+            report["backends"][api_base] = {
+                "running": ok,
+                "error": None if ok else result,
+                "models": result if ok else [],
+                "needed": needed,
+                "missing": [model for model in needed if model not in result] if ok else needed,
+            }
+        if probe:
+            targets = {
+                api_base: [model for model in backend["needed"] if model not in backend["missing"]]
+                for api_base, backend in report["backends"].items()
+                if backend["running"]
+            }
+            results = await asyncio.gather(*(probe_backend(client, api_base, models) for api_base, models in targets.items()))
+            for api_base, probes in zip(targets, results):
+                report["backends"][api_base]["probes"] = probes
+    probes = {api_base: backend.get("probes", {}) for api_base, backend in report["backends"].items()}
+    report["estimate"] = estimate_consult(roles, probes, target_seconds) if probe else None
+    return report
+
+
 def main():
     """Run all verification checks."""
+    parser = argparse.ArgumentParser(description="Check the Ollama backends and models, and measure their throughput.")
+    parser.add_argument("--target-seconds", type=float, default=DEFAULT_TARGET_SECONDS, help=f"Target consult latency (default: {DEFAULT_TARGET_SECONDS:g})")
+    parser.add_argument("--no-probe", action="store_true", help="Skip the throughput probe")
+    parser.add_argument("--output", help="JSON report path")
+    args = parser.parse_args()
+
     print("=" * 60)
     print("ADK Ollama Demo - Setup Verification")
     print("=" * 60)
-    
+
     all_ok = True
-    
+
     # Check dependencies
     print("\n1. Checking Python dependencies...")
     deps_ok, missing = check_dependencies()
@@ -80,7 +273,9 @@ def main():
         print(f"   ✗ Missing dependencies: {', '.join(missing)}")
         print(f"   Run: pip install -r requirements.txt")
         all_ok = False
-    
+        if "httpx" in missing:
+            sys.exit(1)
+
     # Check environment variable
     print("\n2. Checking environment variables...")
     ollama_base = os.getenv("OLLAMA_API_BASE")
@@ -89,32 +284,54 @@ def main():
     else:
         print("   ⚠ OLLAMA_API_BASE not set (using default: http://localhost:11434)")
         print("   You can set it with: export OLLAMA_API_BASE=http://localhost:11434")
-    
-    # Check Ollama server
-    print("\n3. Checking Ollama server connection...")
-    ollama_ok, result = check_ollama_running()
-    if ollama_ok:
-        print(f"   ✓ Ollama server is running")
-        if isinstance(result, list) and result:
-            print(f"   Available models: {', '.join(result[:5])}")
-            if len(result) > 5:
-                print(f"   ... and {len(result) - 5} more")
-    else:
-        print(f"   ✗ Cannot connect to Ollama server: {result}")
-        print("   Make sure Ollama is running: ollama serve")
-        all_ok = False
-    
-    # Check model availability
-    if ollama_ok:
-        print("\n4. Checking model availability...")
-        model_ok, message = check_model_available("qwen2.5:14b")
-        if model_ok:
-            print(f"   ✓ Model found: {message}")
-        else:
-            print(f"   ✗ {message}")
-            print("   Pull the model with: ollama pull qwen2.5:14b")
+
+    # Check Ollama server(s) and every agent's model at once
+    roles = agent_models()
+    report = asyncio.run(run_diagnostics(roles, probe=not args.no_probe, target_seconds=args.target_seconds))
+    print("\n3. Checking Ollama servers and agent models...")
+    for api_base, backend in report["backends"].items():
+        if not backend["running"]:
+            print(f"   ✗ Cannot connect to Ollama server at {api_base}: {backend['error']}")
+            print("   Make sure Ollama is running: ollama serve")
             all_ok = False
-    
+            continue
+        print(f"   ✓ Ollama server is running at {api_base}")
+        for model in backend["needed"]:
+            users = ", ".join(role for role, config in roles.items() if config["model"] == model and api_base in config["backends"])
+            if model in backend["missing"]:
+                print(f"   ✗ Model '{model}' not found (used by: {users})")
+                print(f"   Pull the model with: ollama pull {model}")
+                all_ok = False
+            else:
+                print(f"   ✓ Model found: {model} (used by: {users})")
+
+    # Throughput and consult latency estimate
+    if not args.no_probe:
+        print("\n4. Measuring throughput...")
+        for api_base, backend in report["backends"].items():
+            for model, probe in backend.get("probes", {}).items():
+                if "error" in probe:
+                    print(f"   ✗ {model} at {api_base}: {probe['error']}")
+                    all_ok = False
+                    continue
+                print(
+                    f"   {model} at {api_base}: prompt eval {probe['prompt_tokens_per_second']} tok/s, "
+                    f"generation {probe['tokens_per_second']} tok/s (load {probe['load_seconds']}s)"
+                )
+        estimate = report["estimate"]
+        if estimate is None:
+            print("   ⚠ Consult latency not estimated (panel models unavailable)")
+        else:
+            agents = ", ".join(f"{role} {seconds}s" for role, seconds in estimate["agent_seconds"].items())
+            mark = "✓" if estimate["meets_target"] else "✗"
+            print(
+                f"   {mark} Estimated consult latency {estimate['consult_seconds']}s "
+                f"(target {estimate['target_seconds']:g}s): {agents}"
+            )
+            if not estimate["meets_target"]:
+                slowest = max(estimate["agent_seconds"], key=estimate["agent_seconds"].get)
+                print(f"   Consider a smaller model or another backend for {slowest} (CKM_{slowest.upper()}_MODEL)")
+
     # Check agent file
     print("\n5. Checking agent configuration...")
     if os.path.exists("src/agent.py"):
@@ -122,12 +339,19 @@ def main():
     else:
         print("   ✗ Agent file not found: src/agent.py")
         all_ok = False
-    
+
+    report["checks_passed"] = all_ok
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"\nReport written to {args.output}")
+
     # Summary
     print("\n" + "=" * 60)
     if all_ok:
         print("✓ All checks passed! You're ready to use the agent.")
         print("\nTry running:")
+        print("  python -m src.warmup  # Load the models and prime the prompt caches")
         print("  adk web        # Start web interface")
         print("  adk run .      # Start CLI interface")
         print("  python example.py  # Run example script")
@@ -139,4 +363,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-